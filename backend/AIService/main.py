@@ -1,12 +1,67 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import Any, Dict
+from fastapi import Body, Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 import os
 
+from services.model_client import create_model_client
+from services.concurrency import AdaptiveConcurrencyLimiter, OverloadedError
+from services.resilience import ResilientCaller
+from services.persistent_cache import evict_periodically
+from services.response_cache import create_response_cache
+from services.single_flight import SingleFlight
+from services.metrics import LatencyStats
+from services.streaming import sse_stream
+from services.batch import batch_ndjson
+
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("AI_BATCH_MAX_CONCURRENCY", "32"))
+BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", "5000"))
+# Jak často se sdílená cache odpovědí uklízí na limit velikosti (sekundy)
+CACHE_EVICT_INTERVAL = float(os.getenv("AI_CACHE_EVICT_INTERVAL", "60"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Jeden klient AI modelu (s poolem HTTP spojení) na celou aplikaci
+    app.state.model_client = create_model_client()
+    app.state.response_cache = create_response_cache()
+    app.state.single_flight = SingleFlight()
+    app.state.limiter = AdaptiveConcurrencyLimiter.from_env()
+    app.state.resilience = ResilientCaller.from_env()
+    app.state.stream_ttfb = LatencyStats()
+    app.state.stream_duration = LatencyStats()
+    app.state.ai_service = None
+    warm_from = os.getenv("AI_CACHE_WARM_FROM")
+    if warm_from and hasattr(app.state.response_cache, "warm_from"):
+        app.state.response_cache.warm_from(warm_from)
+    evictor = None
+    if hasattr(app.state.response_cache, "evict"):
+        evictor = asyncio.create_task(evict_periodically(app.state.response_cache, CACHE_EVICT_INTERVAL))
+    await app.state.model_client.start()
+    try:
+        yield
+    finally:
+        if evictor is not None:
+            evictor.cancel()
+            with suppress(asyncio.CancelledError):
+                await evictor
+        await app.state.model_client.aclose()
+        snapshot_path = os.getenv("AI_CACHE_SNAPSHOT_PATH")
+        if snapshot_path and hasattr(app.state.response_cache, "snapshot"):
+            app.state.response_cache.snapshot(snapshot_path)
+        if hasattr(app.state.response_cache, "close"):
+            app.state.response_cache.close()
+
+
 app = FastAPI(
     title="CEPEM AI Service",
     description="AI mikroservice pro CEPEM platformu",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -18,6 +73,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Přetížení AI modelu: klient dostane 503 s Retry-After místo čekání do timeoutu
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -37,6 +98,73 @@ async def get_info():
         "status": "running"
     }
 
+# Provozní metriky (cache odpovědí AI modelu, sloučená souběžná volání, limit souběžnosti a fronta,
+# hedging a stav jističe)
+@app.get("/api/metrics")
+async def get_metrics():
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "response_cache": app.state.response_cache.stats(),
+        "single_flight": app.state.single_flight.stats(),
+        "concurrency_limiter": app.state.limiter.stats(),
+        "resilience": app.state.resilience.stats(),
+        "medical_question_stream": {
+            "ttfb": app.state.stream_ttfb.snapshot(),
+            "duration": app.state.stream_duration.snapshot()
+        }
+    }
+
+
+def get_ai_service():
+    """AIServiceCore se sdíleným klientem modelu, cache, slučováním volání, limiterem a jističem z app.state"""
+    if app.state.ai_service is None:
+        from services.ai_service import AIServiceCore
+        app.state.ai_service = AIServiceCore(
+            model_client=app.state.model_client,
+            response_cache=app.state.response_cache,
+            single_flight=app.state.single_flight,
+            limiter=app.state.limiter,
+            resilience=app.state.resilience
+        )
+    return app.state.ai_service
+
+
+# Odpověď na lékařskou otázku jako server-sent events: text odpovědi průběžně,
+# zdroje a navazující otázky jakmile jsou kompletní
+@app.post("/api/medical-question/stream")
+async def stream_medical_question(payload: Dict[str, Any] = Body(...), ai_service=Depends(get_ai_service)):
+    try:
+        events = await ai_service.stream_medical_question(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return StreamingResponse(
+        sse_stream(events, ttfb=app.state.stream_ttfb, duration=app.state.stream_duration),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Dávková analýza (např. noční triáž): položky se zpracují souběžně s omezením
+# a výsledky se streamují jako NDJSON v pořadí vstupu, chyba položky je jen u ní
+@app.post("/api/batch/analyze")
+async def batch_analyze(payload: Dict[str, Any] = Body(...), ai_service=Depends(get_ai_service)):
+    items = payload.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=422, detail="items musí být neprázdný seznam")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Dávka může mít nejvýš {BATCH_MAX_ITEMS} položek")
+
+    concurrency = payload.get("concurrency")
+    if concurrency is None:
+        concurrency = BATCH_DEFAULT_CONCURRENCY
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        raise HTTPException(status_code=422, detail="concurrency musí být kladné celé číslo")
+    concurrency = min(concurrency, BATCH_MAX_CONCURRENCY)
+
+    return StreamingResponse(
+        batch_ndjson(items, ai_service.run_batch_item, concurrency),
+        media_type="application/x-ndjson"
+    )
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8000"))
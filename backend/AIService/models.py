@@ -0,0 +1,127 @@
+"""Požadavky a odpovědi AI Service (Pydantic), které používá services/ai_service.py"""
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+
+class UrgencyLevel(str, Enum):
+    LOW = "low"
+    MEDIUM = "medium"
+    HIGH = "high"
+    CRITICAL = "critical"
+
+
+class Gender(str, Enum):
+    MALE = "male"
+    FEMALE = "female"
+    OTHER = "other"
+
+
+class Symptom(BaseModel):
+    name: str = Field(..., min_length=1)
+    severity: Optional[str] = None
+    duration: Optional[str] = None
+
+
+class PatientInfo(BaseModel):
+    age: Optional[int] = Field(None, ge=0, le=150)
+    gender: Optional[Gender] = None
+    medical_history: List[str] = Field(default_factory=list)
+
+
+class _SymptomsRequest(BaseModel):
+    symptoms: List[Symptom] = Field(..., min_length=1)
+    patient_info: Optional[PatientInfo] = None
+
+    @field_validator("symptoms", mode="before")
+    @classmethod
+    def _symptom_names(cls, value):
+        # Frontend posílá symptomy i jako prosté řetězce
+        if isinstance(value, list):
+            return [{"name": item} if isinstance(item, str) else item for item in value]
+        return value
+
+
+class SymptomAnalysisRequest(_SymptomsRequest):
+    pass
+
+
+class MedicalQuestionRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    context: Optional[str] = None
+    specialization: Optional[str] = None
+
+
+class DiagnosisAssistanceRequest(_SymptomsRequest):
+    test_results: List[Dict[str, Any]] = Field(default_factory=list)
+    clinical_notes: Optional[str] = None
+
+
+class BaseResponse(BaseModel):
+    response_id: str
+    timestamp: datetime
+    success: bool = True
+
+
+class Condition(BaseModel):
+    name: str
+    probability: float = Field(..., ge=0, le=1)
+    description: str
+    severity: UrgencyLevel
+    recommendations: List[str] = Field(default_factory=list)
+
+
+class SymptomAnalysisResponse(BaseResponse):
+    analysis_id: str
+    possible_conditions: List[Condition]
+    general_recommendations: List[str]
+    urgency_level: UrgencyLevel
+    confidence_score: float = Field(..., ge=0, le=1)
+    disclaimer: str
+    should_seek_immediate_care: bool = False
+
+
+class Source(BaseModel):
+    title: str
+    type: str
+    reliability_score: float = Field(0.8, ge=0, le=1)
+
+
+class MedicalQuestionResponse(BaseResponse):
+    answer: str
+    sources: List[Source]
+    confidence_score: float = Field(..., ge=0, le=1)
+    follow_up_questions: List[str] = Field(default_factory=list)
+    related_topics: List[str] = Field(default_factory=list)
+
+
+class DiagnosticSuggestion(BaseModel):
+    diagnosis: str
+    icd_code: Optional[str] = None
+    probability: float = Field(..., ge=0, le=1)
+    supporting_evidence: List[str] = Field(default_factory=list)
+    contradicting_evidence: List[str] = Field(default_factory=list)
+
+
+class RecommendedTest(BaseModel):
+    test_name: str
+    priority: str
+    reason: str
+
+
+class TreatmentSuggestion(BaseModel):
+    treatment: str
+    type: str
+    priority: str
+    contraindications: List[str] = Field(default_factory=list)
+    monitoring_required: bool = False
+
+
+class DiagnosisAssistanceResponse(BaseResponse):
+    suggested_diagnoses: List[DiagnosticSuggestion]
+    recommended_tests: List[RecommendedTest]
+    treatment_suggestions: List[TreatmentSuggestion]
+    referral_recommendations: List[str] = Field(default_factory=list)
+    confidence_score: float = Field(..., ge=0, le=1)
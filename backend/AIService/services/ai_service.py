@@ -1,11 +1,6 @@
 import os
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Optional, Tuple, Union
 from datetime import datetime
-try:
-    import openai
-except ImportError:
-    openai = None
-
 # Import models directly
 import sys
 sys.path.append('..')
@@ -16,239 +11,167 @@ from models import (
     Condition, UrgencyLevel, Source, DiagnosticSuggestion,
     RecommendedTest, TreatmentSuggestion
 )
+from services.model_client import ModelClientError, create_model_client
+from services.concurrency import AdaptiveConcurrencyLimiter, OverloadedError
+from services.resilience import CircuitOpenError, ResilientCaller
+from services.scheduling import BATCH, INTERACTIVE_QUESTION, CallPriority, priority_for
+from services.single_flight import SingleFlight
+from services.streaming import cached_answer_events, model_answer_events
+from services.batch import SYMPTOM_ANALYSIS, DIAGNOSIS_ASSISTANCE
+from services.prompts import (
+    PromptBudget, symptom_analysis_prompt, medical_question_prompt, diagnosis_assistance_prompt
+)
+from services.response_cache import (
+    ResponseCache, create_response_cache, symptom_analysis_key, medical_question_key, diagnosis_assistance_key
+)
 
 class AIServiceCore:
-    def __init__(self):
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
+    def __init__(self, model_client=None, response_cache=None, single_flight: SingleFlight = None,
+                 limiter: AdaptiveConcurrencyLimiter = None, resilience: ResilientCaller = None):
         self.model_name = os.getenv("AI_MODEL_NAME", "gpt-3.5-turbo")
         self.max_tokens = int(os.getenv("MAX_TOKENS", "1000"))
         self.temperature = float(os.getenv("TEMPERATURE", "0.3"))
-        
-        if self.openai_api_key:
-            openai.api_key = self.openai_api_key
+        # Rozpočty tokenů pro proměnná pole promptů (anamnéza, klinické poznámky...)
+        self.prompt_budget = PromptBudget.from_env()
 
-    async def analyze_symptoms_with_ai(self, request: SymptomAnalysisRequest) -> SymptomAnalysisResponse:
-        """Analýza symptomů pomocí AI modelu"""
+        # Sdílený klient z app.state (vytvořený při startu aplikace), jinak vlastní podle AI_BACKEND
+        self.model_client = model_client or create_model_client()
+        self.response_cache = response_cache if response_cache is not None else create_response_cache()
+        self.single_flight = single_flight or SingleFlight()
+        # Priorita právě běžících (sloučených) volání podle klíče cache
+        self._flight_priorities: Dict[str, CallPriority] = {}
+        self.limiter = limiter or AdaptiveConcurrencyLimiter.from_env()
+        self.resilience = resilience or ResilientCaller.from_env()
+
+    async def analyze_symptoms_with_ai(self, request: SymptomAnalysisRequest,
+                                       priority: Optional[str] = None) -> SymptomAnalysisResponse:
+        """Analýza symptomů pomocí AI modelu (priority: třída z services/scheduling.py, výchozí podle endpointu)"""
         try:
-            # Vytvoření promptu pro AI
-            prompt = self._create_symptom_analysis_prompt(request)
-            
-            # Volání AI modelu (mock implementace)
-            ai_response = await self._call_ai_model(prompt)
+            # Volání AI modelu (nebo odpověď z cache; prompt se vytváří jen při cache miss)
+            ai_response = await self._cached_call(
+                symptom_analysis_key(request), lambda: self._create_symptom_analysis_prompt(request), priority
+            )
             
             # Zpracování odpovědi
             return self._process_symptom_analysis_response(ai_response, request)
             
+        except (ModelClientError, OverloadedError):
+            # Typované chyby modelu a přetížení jdou k volajícímu beze změny (přetížení = 503 + Retry-After v main.py)
+            raise
         except Exception as e:
             raise Exception(f"Chyba při AI analýze symptomů: {str(e)}")
 
-    async def answer_medical_question_with_ai(self, request: MedicalQuestionRequest) -> MedicalQuestionResponse:
+    async def answer_medical_question_with_ai(self, request: MedicalQuestionRequest,
+                                              priority: Optional[str] = None) -> MedicalQuestionResponse:
         """Odpovídání na lékařské otázky pomocí AI"""
         try:
-            prompt = self._create_medical_question_prompt(request)
-            ai_response = await self._call_ai_model(prompt)
+            ai_response = await self._cached_call(
+                medical_question_key(request), lambda: self._create_medical_question_prompt(request), priority
+            )
             return self._process_medical_question_response(ai_response, request)
             
+        except (ModelClientError, OverloadedError):
+            raise
         except Exception as e:
             raise Exception(f"Chyba při AI odpovídání: {str(e)}")
 
-    async def provide_diagnosis_assistance_with_ai(self, request: DiagnosisAssistanceRequest) -> DiagnosisAssistanceResponse:
+    async def stream_medical_question(self, payload: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+        """Streamovaná odpověď na lékařskou otázku: události (název, data) pro SSE, viz services/streaming.py.
+        Místo v limiteru se získá ještě před odpovědí (přetížení = 503) a drží se po celou dobu streamu."""
+        request = MedicalQuestionRequest(**payload)
+        cache_key = medical_question_key(request)
+        cached = await self.response_cache.aget(cache_key)
+        if cached is not None:
+            return cached_answer_events(cached)
+
+        prompt = self._create_medical_question_prompt(request)
+        chunks = await self.limiter.open_stream(lambda: self.model_client.stream(prompt), INTERACTIVE_QUESTION)
+        return model_answer_events(chunks, cache=self.response_cache, cache_key=cache_key)
+
+    async def provide_diagnosis_assistance_with_ai(self, request: DiagnosisAssistanceRequest,
+                                                   priority: Optional[str] = None) -> DiagnosisAssistanceResponse:
         """Diagnostická asistence pomocí AI"""
         try:
-            prompt = self._create_diagnosis_assistance_prompt(request)
-            ai_response = await self._call_ai_model(prompt)
+            ai_response = await self._cached_call(
+                diagnosis_assistance_key(request), lambda: self._create_diagnosis_assistance_prompt(request), priority
+            )
             return self._process_diagnosis_assistance_response(ai_response, request)
             
+        except (ModelClientError, OverloadedError):
+            raise
         except Exception as e:
             raise Exception(f"Chyba při AI diagnostické asistenci: {str(e)}")
 
+    async def run_batch_item(self, item: Dict[str, Any]):
+        """Jedna položka dávky: {"type": "symptom_analysis" | "diagnosis_assistance", "request": {...}}.
+        Volání modelu jdou ve třídě BATCH, takže nezdrží interaktivní požadavky."""
+        if not isinstance(item, dict):
+            raise ValueError("Položka dávky musí být objekt")
+        item_type = item.get("type")
+        if item_type == SYMPTOM_ANALYSIS:
+            return await self.analyze_symptoms_with_ai(SymptomAnalysisRequest(**item.get("request", {})), BATCH)
+        if item_type == DIAGNOSIS_ASSISTANCE:
+            return await self.provide_diagnosis_assistance_with_ai(
+                DiagnosisAssistanceRequest(**item.get("request", {})), BATCH
+            )
+        raise ValueError(f"Neznámý typ položky dávky: {item_type}")
+
     def _create_symptom_analysis_prompt(self, request: SymptomAnalysisRequest) -> str:
         """Vytvoření promptu pro analýzu symptomů"""
-        symptoms_text = ", ".join([s.name for s in request.symptoms])
-        
-        prompt = f"""
-        Jako AI asistent pro zdravotnictví, analyzuj následující symptomy a poskytni strukturovanou odpověď:
-
-        Symptomy: {symptoms_text}
-        
-        Informace o pacientovi:
-        """
-        
-        if request.patient_info:
-            if request.patient_info.age:
-                prompt += f"- Věk: {request.patient_info.age} let\n"
-            if request.patient_info.gender:
-                prompt += f"- Pohlaví: {request.patient_info.gender}\n"
-            if request.patient_info.medical_history:
-                prompt += f"- Anamnéza: {', '.join(request.patient_info.medical_history)}\n"
-        
-        prompt += """
-        Požadovaný formát odpovědi (JSON):
-        {
-            "possible_conditions": [
-                {
-                    "name": "název diagnózy",
-                    "probability": 0.7,
-                    "description": "popis",
-                    "severity": "low/medium/high/critical"
-                }
-            ],
-            "recommendations": ["doporučení 1", "doporučení 2"],
-            "urgency_level": "low/medium/high/critical",
-            "confidence_score": 0.8,
-            "should_seek_immediate_care": false
-        }
-        
-        Odpověz v češtině a buď konzervativní s diagnózami.
-        """
-        
-        return prompt
+        return symptom_analysis_prompt(request, self.prompt_budget)
 
     def _create_medical_question_prompt(self, request: MedicalQuestionRequest) -> str:
         """Vytvoření promptu pro lékařské otázky"""
-        prompt = f"""
-        Jako AI asistent pro zdravotnictví, odpověz na následující lékařskou otázku:
-
-        Otázka: {request.question}
-        
-        Kontext: {request.context or "Žádný specifický kontext"}
-        Specializace: {request.specialization or "Obecná medicína"}
-        
-        Poskytni odpověď ve formátu JSON:
-        {{
-            "answer": "detailní odpověď",
-            "sources": [
-                {{
-                    "title": "název zdroje",
-                    "type": "guideline/study/textbook",
-                    "reliability_score": 0.9
-                }}
-            ],
-            "confidence_score": 0.8,
-            "follow_up_questions": ["otázka 1", "otázka 2"],
-            "related_topics": ["téma 1", "téma 2"]
-        }}
-        
-        Odpověz v češtině a buď přesný s medicínskými informacemi.
-        """
-        
-        return prompt
+        return medical_question_prompt(request, self.prompt_budget)
 
     def _create_diagnosis_assistance_prompt(self, request: DiagnosisAssistanceRequest) -> str:
         """Vytvoření promptu pro diagnostickou asistenci"""
-        symptoms_text = ", ".join([s.name for s in request.symptoms])
-        
-        prompt = f"""
-        Jako AI asistent pro diagnostiku, poskytni diagnostickou asistenci:
+        return diagnosis_assistance_prompt(request, self.prompt_budget)
 
-        Symptomy: {symptoms_text}
-        
-        Informace o pacientovi:
-        """
-        
-        if request.patient_info:
-            prompt += f"- Věk: {request.patient_info.age or 'neznámý'}\n"
-            prompt += f"- Pohlaví: {request.patient_info.gender or 'neznámé'}\n"
-            
-        if request.test_results:
-            prompt += f"Výsledky testů: {len(request.test_results)} výsledků\n"
-            
-        if request.clinical_notes:
-            prompt += f"Klinické poznámky: {request.clinical_notes}\n"
-        
-        prompt += """
-        Formát odpovědi (JSON):
-        {
-            "suggested_diagnoses": [
-                {
-                    "diagnosis": "název diagnózy",
-                    "icd_code": "ICD-10 kód",
-                    "probability": 0.7,
-                    "supporting_evidence": ["důkaz 1"],
-                    "contradicting_evidence": ["proti-důkaz 1"]
-                }
-            ],
-            "recommended_tests": [
-                {
-                    "test_name": "název testu",
-                    "priority": "urgent/routine/optional",
-                    "reason": "důvod"
-                }
-            ],
-            "treatment_suggestions": [
-                {
-                    "treatment": "léčba",
-                    "type": "medication/procedure/lifestyle",
-                    "priority": "vysoká/střední/nízká"
-                }
-            ],
-            "confidence_score": 0.8
-        }
-        """
-        
-        return prompt
+    async def _cached_call(self, cache_key: str, build_prompt, priority: Optional[str] = None) -> Dict[str, Any]:
+        """Surová odpověď modelu z cache, jinak volání modelu a uložení do cache.
+        Shodné požadavky, které dorazí, zatímco model ještě odpovídá, čekají na stejné volání."""
+        cached = await self.response_cache.aget(cache_key)
+        if cached is not None:
+            return cached
 
-    async def _call_ai_model(self, prompt: str) -> Dict[str, Any]:
-        """Volání AI modelu (mock implementace)"""
-        # V produkci by zde bylo skutečné volání OpenAI API
-        # Pro demonstraci vracíme mock odpověď
-        
-        if "symptom" in prompt.lower() or "symptom" in prompt.lower():
-            return {
-                "possible_conditions": [
-                    {
-                        "name": "Virová infekce",
-                        "probability": 0.6,
-                        "description": "Běžná virová infekce dýchacích cest",
-                        "severity": "low"
-                    }
-                ],
-                "recommendations": ["Odpočinek", "Zvýšený příjem tekutin"],
-                "urgency_level": "low",
-                "confidence_score": 0.7,
-                "should_seek_immediate_care": False
-            }
-        elif "question" in prompt.lower():
-            return {
-                "answer": "Detailní odpověď na lékařskou otázku založená na aktuálních guidelines.",
-                "sources": [
-                    {
-                        "title": "ESC Guidelines 2024",
-                        "type": "guideline",
-                        "reliability_score": 0.95
-                    }
-                ],
-                "confidence_score": 0.85,
-                "follow_up_questions": ["Jaké jsou rizikové faktory?"],
-                "related_topics": ["Prevence", "Léčba"]
-            }
+        endpoint = ResponseCache.endpoint_of(cache_key)
+        requested = priority or priority_for(endpoint)
+        if cache_key in self.single_flight:
+            # Připojení k běžícímu volání: interaktivní volající nesmí čekat s vahou dávky
+            call_priority = self._flight_priorities.get(cache_key)
+            if call_priority is not None:
+                self.limiter.raise_priority(call_priority, requested)
         else:
-            return {
-                "suggested_diagnoses": [
-                    {
-                        "diagnosis": "Funkční porucha",
-                        "icd_code": "K59.0",
-                        "probability": 0.5,
-                        "supporting_evidence": ["Anamnéza"],
-                        "contradicting_evidence": []
-                    }
-                ],
-                "recommended_tests": [
-                    {
-                        "test_name": "Základní biochemie",
-                        "priority": "routine",
-                        "reason": "Vyloučení organické příčiny"
-                    }
-                ],
-                "treatment_suggestions": [
-                    {
-                        "treatment": "Symptomatická léčba",
-                        "type": "medication",
-                        "priority": "střední"
-                    }
-                ],
-                "confidence_score": 0.6
-            }
+            call_priority = CallPriority(requested)
+            self._flight_priorities[cache_key] = call_priority
+
+        async def call() -> Dict[str, Any]:
+            prompt = build_prompt()
+            try:
+                try:
+                    # Hedging pomalých volání a jistič při vysoké chybovosti (services/resilience.py)
+                    ai_response = await self.resilience.call(endpoint, lambda: self._call_ai_model(prompt, call_priority))
+                except CircuitOpenError:
+                    # Starší nebo obecná odpověď při rozpojeném jističi se do cache neukládá
+                    fallback = self.resilience.fallback(endpoint, cache_key)
+                    if fallback is None:
+                        raise
+                    return fallback
+            finally:
+                if self._flight_priorities.get(cache_key) is call_priority:
+                    del self._flight_priorities[cache_key]
+            await self.response_cache.aset(cache_key, ai_response)
+            self.resilience.remember(cache_key, ai_response)
+            return ai_response
+
+        return await self.single_flight.do(cache_key, call)
+
+    async def _call_ai_model(self, prompt: str, priority: Union[str, CallPriority, None] = None) -> Dict[str, Any]:
+        """Volání AI modelu přes nastavený backend (mock nebo HTTP, viz services/model_client.py),
+        s adaptivním limitem souběžných volání a frontou podle priority (services/concurrency.py)"""
+        return await self.limiter.run(lambda: self.model_client.complete(prompt),
+                                      priority or INTERACTIVE_QUESTION)
 
     def _process_symptom_analysis_response(self, ai_response: Dict[str, Any], request: SymptomAnalysisRequest) -> SymptomAnalysisResponse:
         """Zpracování odpovědi AI pro analýzu symptomů"""
@@ -0,0 +1,59 @@
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+SYMPTOM_ANALYSIS = "symptom_analysis"
+DIAGNOSIS_ASSISTANCE = "diagnosis_assistance"
+BATCH_ITEM_TYPES = (SYMPTOM_ANALYSIS, DIAGNOSIS_ASSISTANCE)
+
+
+async def run_ordered(items: List[Any], worker: Callable[[Any], Awaitable[Any]],
+                      concurrency: int) -> AsyncIterator[Tuple[int, Any, Any, bool]]:
+    """
+    Zpracuje položky s nejvýš `concurrency` souběžnými voláními a vrací výsledky
+    v původním pořadí jako (index, položka, výsledek nebo výjimka, ok).
+
+    Rozpracovaných je nejvýš 2 * concurrency položek, takže jedna pomalá položka
+    na začátku nezastaví ostatní a paměť neroste s velikostí dávky.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def guarded(item):
+        async with semaphore:
+            return await worker(item)
+
+    window: deque = deque()
+    pending = iter(enumerate(items))
+    try:
+        while True:
+            while len(window) < 2 * concurrency:
+                try:
+                    index, item = next(pending)
+                except StopIteration:
+                    break
+                window.append((index, item, asyncio.ensure_future(guarded(item))))
+            if not window:
+                return
+            index, item, task = window.popleft()
+            try:
+                yield index, item, await task, True
+            except Exception as e:
+                yield index, item, e, False
+    finally:
+        for _index, _item, task in window:
+            task.cancel()
+
+
+async def batch_ndjson(items: List[Dict[str, Any]], worker: Callable[[Dict[str, Any]], Awaitable[Any]],
+                       concurrency: int) -> AsyncIterator[str]:
+    """NDJSON řádek na položku, v pořadí vstupu; chyba položky nezastaví zbytek dávky"""
+    async for index, item, outcome, ok in run_ordered(items, worker, concurrency):
+        line: Dict[str, Any] = {"index": index, "type": item.get("type") if isinstance(item, dict) else None}
+        if ok:
+            line.update(success=True, result=jsonable_encoder(outcome))
+        else:
+            line.update(success=False, error=str(outcome))
+        yield json.dumps(line, ensure_ascii=False) + "\n"
@@ -0,0 +1,268 @@
+import asyncio
+import math
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Union
+
+from services.metrics import LatencyStats
+from services.scheduling import INTERACTIVE_QUESTION, CallPriority, WeightedFairQueue
+
+# HTTP statusy AI API, které znamenají přetížení (rate limit, dočasná nedostupnost)
+THROTTLE_STATUSES = (429, 503)
+
+
+class OverloadedError(Exception):
+    """Volání odmítnuto limiterem (plná fronta nebo příliš dlouhé čekání); klient má zkusit znovu za `retry_after` s"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Adaptivní limit souběžných volání AI modelu (AIMD) s omezenou frontou čekajících.
+    Volná místa se čekajícím přidělují podle tříd priority (services/scheduling.py).
+
+    Každé úspěšné volání v rámci cílové latence zvýší limit o 1/limit (tj. zhruba +1
+    za každé „kolo“ limit volání), pokud byl limit aspoň z poloviny využitý. Odpověď
+    429/503 nebo latence nad cílem limit vynásobí `backoff`; volání zahájená před
+    posledním snížením ho už znovu nesnižují, jedno zahlcení = jedno snížení.
+
+    Cílová latence je `latency_target` (s), nebo `latency_tolerance` × 10. percentil
+    posledních latencí. Když je fronta plná nebo čekání trvá déle než `queue_timeout`,
+    volání hned skončí OverloadedError s odhadem Retry-After.
+    """
+
+    def __init__(self, initial_limit: int = 10, min_limit: int = 1, max_limit: int = 64, max_queue: int = 100,
+                 queue_timeout: float = 10.0, latency_target: float = 0.0, latency_tolerance: float = 2.0,
+                 backoff: float = 0.7, scheduler: Optional[WeightedFairQueue] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self._clock = clock
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.scheduler = scheduler or WeightedFairQueue()
+        self._last_decrease = float("-inf")
+        self._upstream_retry_after: Optional[float] = None
+        self.latency = LatencyStats(window=200)
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.queue_timeouts = 0
+        self.throttled = 0
+        self.decreases = 0
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveConcurrencyLimiter":
+        return cls(
+            initial_limit=int(os.getenv("AI_LIMIT_INITIAL", "10")),
+            min_limit=int(os.getenv("AI_LIMIT_MIN", "1")),
+            max_limit=int(os.getenv("AI_LIMIT_MAX", "64")),
+            max_queue=int(os.getenv("AI_LIMIT_MAX_QUEUE", "100")),
+            queue_timeout=float(os.getenv("AI_LIMIT_QUEUE_TIMEOUT", "10")),
+            latency_target=float(os.getenv("AI_LIMIT_LATENCY_TARGET_MS", "0")) / 1000,
+            latency_tolerance=float(os.getenv("AI_LIMIT_LATENCY_TOLERANCE", "2.0")),
+            scheduler=WeightedFairQueue.from_env(),
+        )
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.scheduler)
+
+    async def run(self, factory: Callable[[], Awaitable[Any]],
+                  priority: Union[str, CallPriority] = INTERACTIVE_QUESTION) -> Any:
+        """`priority` je třída, nebo CallPriority sdílená sloučenými volajícími (viz raise_priority)"""
+        await self._acquire(priority)
+        started = self._clock()
+        try:
+            result = await factory()
+        except Exception as e:
+            self._on_error(e, started)
+            raise
+        finally:
+            self._release()
+        self._on_success(self._clock() - started, started)
+        return result
+
+    async def open_stream(self, factory: Callable[[], AsyncIterator[Any]],
+                          priority: str = INTERACTIVE_QUESTION) -> AsyncIterator[Any]:
+        """
+        Místo pro streamované volání: získá se hned (OverloadedError ještě před odesláním
+        odpovědi) a drží se, dokud stream neskončí, nespadne nebo se nezavře. Latence je
+        doba celého streamu, stejně jako u run() doba celé odpovědi.
+        """
+        await self._acquire(priority)
+        return _HeldStream(self, factory)
+
+    def raise_priority(self, call: CallPriority, priority: str) -> None:
+        """Zvýší třídu volání, ke kterému se připojil volající s vyšší prioritou; pokud
+        volání ještě čeká ve frontě, přesune se do nové třídy hned"""
+        if not self.scheduler.outranks(priority, call.priority):
+            return
+        call.priority = priority
+        for waiter in call.waiters:
+            self.scheduler.promote(waiter, priority)
+
+    def _on_error(self, error: Exception, started: float) -> None:
+        if getattr(error, "status_code", None) in THROTTLE_STATUSES:
+            self.throttled += 1
+            self._upstream_retry_after = getattr(error, "retry_after", None)
+            self._decrease(started)
+
+    async def _acquire(self, priority: Union[str, CallPriority]) -> None:
+        call = priority if isinstance(priority, CallPriority) else None
+        if call is not None:
+            priority = call.priority
+        if self.in_flight < self.limit and not len(self.scheduler):
+            self.scheduler.admitted_immediately(priority)
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self.scheduler) >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError("AI model je přetížený, fronta volání je plná", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.scheduler.push(waiter, priority)
+        if call is not None:
+            call.waiters.add(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self.scheduler.remove(waiter)
+                self.queue_timeouts += 1
+                raise OverloadedError("AI model je přetížený, čekání ve frontě vypršelo", self.retry_after())
+        except BaseException:
+            # Zrušený volající: místo, které mezitím dostal, se hned předá dál
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                waiter.cancel()
+                self.scheduler.remove(waiter)
+            raise
+        finally:
+            if call is not None:
+                call.waiters.discard(waiter)
+        self.admitted += 1
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Předá volná místa čekajícím v pořadí, které určí plánovač"""
+        while self.in_flight < self.limit:
+            waiter = self.scheduler.pop()
+            if waiter is None:
+                return
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _target_latency(self) -> Optional[float]:
+        if self.latency_target > 0:
+            return self.latency_target
+        if self.latency.count < 20:
+            return None
+        return self.latency_tolerance * self.latency.percentile(10)
+
+    def _on_success(self, latency: float, started: float) -> None:
+        target = self._target_latency()
+        self.latency.record(latency)
+        self._upstream_retry_after = None
+        if target is not None and latency > target:
+            self._decrease(started)
+        elif self.in_flight + 1 >= self._limit / 2:
+            # Bez využití limitu by limit rostl do nekonečna, aniž by o upstreamu cokoli říkal
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._wake()
+
+    def _decrease(self, started: float) -> None:
+        if started < self._last_decrease:
+            return
+        self._limit = max(self.min_limit, self._limit * self.backoff)
+        self._last_decrease = self._clock()
+        self.decreases += 1
+
+    def retry_after(self) -> int:
+        """Odhad v sekundách, kdy se fronta uvolní: (čekající + 1) / limit × medián latence"""
+        estimate = (len(self.scheduler) + 1) / self.limit * self.latency.percentile(50)
+        return max(1, math.ceil(max(estimate, self._upstream_retry_after or 0)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.scheduler),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queue_timeouts": self.queue_timeouts,
+            "throttled": self.throttled,
+            "decreases": self.decreases,
+            "latency": self.latency.snapshot(),
+            "scheduler": self.scheduler.stats(),
+        }
+
+
+class _HeldStream:
+    """Async iterátor, který drží místo v limiteru; uvolní ho právě jednou (konec, chyba, aclose)"""
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter, factory: Callable[[], AsyncIterator[Any]]):
+        self._limiter = limiter
+        self._factory = factory
+        self._iterator: Optional[AsyncIterator[Any]] = None
+        self._started = limiter._clock()
+        self._held = True
+
+    def __aiter__(self) -> "_HeldStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if not self._held:
+            raise StopAsyncIteration
+        try:
+            if self._iterator is None:
+                self._iterator = self._factory().__aiter__()
+            return await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._finish()
+            self._limiter._on_success(self._limiter._clock() - self._started, self._started)
+            raise
+        except Exception as e:
+            self._finish()
+            self._limiter._on_error(e, self._started)
+            raise
+        except BaseException:
+            self._finish()
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            if self._iterator is not None and hasattr(self._iterator, "aclose"):
+                await self._iterator.aclose()
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        if self._held:
+            self._held = False
+            self._limiter._release()
+
+    def __del__(self) -> None:
+        # Stream, který se nikdy nedočetl ani nezavřel (klient odešel před prvním kusem)
+        if self._held:
+            self._finish()
@@ -0,0 +1,45 @@
+import threading
+from collections import deque
+from typing import Any, Dict
+
+
+def _nearest_rank(samples, p: float) -> float:
+    return samples[min(len(samples) - 1, max(0, round(p / 100 * len(samples)) - 1))]
+
+
+class LatencyStats:
+    """Klouzavé okno posledních `window` měření (v sekundách) s percentily v ms"""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, p: float) -> float:
+        """p-tý percentil okna v sekundách (0.0, pokud zatím nic není změřeno)"""
+        with self._lock:
+            samples = sorted(self._samples)
+        return _nearest_rank(samples, p) if samples else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count}
+
+        def ms(value: float) -> float:
+            return round(value * 1000, 1)
+
+        return {
+            "count": self.count,
+            "avg_ms": ms(sum(samples) / len(samples)),
+            "p50_ms": ms(_nearest_rank(samples, 50)),
+            "p95_ms": ms(_nearest_rank(samples, 95)),
+            "p99_ms": ms(_nearest_rank(samples, 99)),
+            "max_ms": ms(samples[-1]),
+        }
@@ -0,0 +1,285 @@
+import asyncio
+import copy
+import importlib.util
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ModelClientError(Exception):
+    """Chyba při volání AI modelu (síť, timeout, neplatná odpověď)"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        # HTTP status a Retry-After z odpovědi AI API (429/503 = přetížení, viz services/concurrency.py)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _status_error(e: httpx.HTTPStatusError) -> ModelClientError:
+    try:
+        retry_after = float(e.response.headers.get("Retry-After", ""))
+    except ValueError:
+        retry_after = None
+    return ModelClientError(f"AI API vrátilo {e.response.status_code}",
+                            status_code=e.response.status_code, retry_after=retry_after)
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+@dataclass
+class ModelClientSettings:
+    """Nastavení klienta AI modelu, výchozí hodnoty z proměnných prostředí"""
+    backend: str = "mock"
+    base_url: str = "https://api.openai.com/v1"
+    api_key: Optional[str] = None
+    model_name: str = "gpt-3.5-turbo"
+    max_tokens: int = 1000
+    temperature: float = 0.3
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+    http2: bool = False
+    extra_headers: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> "ModelClientSettings":
+        return cls(
+            backend=os.getenv("AI_BACKEND", "mock").lower(),
+            base_url=os.getenv("AI_API_BASE_URL", "https://api.openai.com/v1"),
+            api_key=os.getenv("OPENAI_API_KEY"),
+            model_name=os.getenv("AI_MODEL_NAME", "gpt-3.5-turbo"),
+            max_tokens=_env_int("MAX_TOKENS", 1000),
+            temperature=_env_float("TEMPERATURE", 0.3),
+            max_connections=_env_int("AI_HTTP_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_env_int("AI_HTTP_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("AI_HTTP_KEEPALIVE_EXPIRY", 30.0),
+            connect_timeout=_env_float("AI_HTTP_CONNECT_TIMEOUT", 5.0),
+            read_timeout=_env_float("AI_HTTP_READ_TIMEOUT", 60.0),
+            write_timeout=_env_float("AI_HTTP_WRITE_TIMEOUT", 10.0),
+            pool_timeout=_env_float("AI_HTTP_POOL_TIMEOUT", 5.0),
+            http2=os.getenv("AI_HTTP2", "false").lower() in ("1", "true", "yes"),
+        )
+
+
+MOCK_SYMPTOM_RESPONSE = {
+    "possible_conditions": [
+        {
+            "name": "Virová infekce",
+            "probability": 0.6,
+            "description": "Běžná virová infekce dýchacích cest",
+            "severity": "low"
+        }
+    ],
+    "recommendations": ["Odpočinek", "Zvýšený příjem tekutin"],
+    "urgency_level": "low",
+    "confidence_score": 0.7,
+    "should_seek_immediate_care": False
+}
+
+MOCK_QUESTION_RESPONSE = {
+    "answer": "Detailní odpověď na lékařskou otázku založená na aktuálních guidelines.",
+    "sources": [
+        {
+            "title": "ESC Guidelines 2024",
+            "type": "guideline",
+            "reliability_score": 0.95
+        }
+    ],
+    "confidence_score": 0.85,
+    "follow_up_questions": ["Jaké jsou rizikové faktory?"],
+    "related_topics": ["Prevence", "Léčba"]
+}
+
+MOCK_DIAGNOSIS_RESPONSE = {
+    "suggested_diagnoses": [
+        {
+            "diagnosis": "Funkční porucha",
+            "icd_code": "K59.0",
+            "probability": 0.5,
+            "supporting_evidence": ["Anamnéza"],
+            "contradicting_evidence": []
+        }
+    ],
+    "recommended_tests": [
+        {
+            "test_name": "Základní biochemie",
+            "priority": "routine",
+            "reason": "Vyloučení organické příčiny"
+        }
+    ],
+    "treatment_suggestions": [
+        {
+            "treatment": "Symptomatická léčba",
+            "type": "medication",
+            "priority": "střední"
+        }
+    ],
+    "confidence_score": 0.6
+}
+
+
+def mock_response_for(prompt: str) -> Dict[str, Any]:
+    """Pevná odpověď podle formátu, který prompt požaduje (sdílí ji MockModelClient i stub server)"""
+    if '"possible_conditions"' in prompt:
+        return copy.deepcopy(MOCK_SYMPTOM_RESPONSE)
+    elif '"answer"' in prompt:
+        return copy.deepcopy(MOCK_QUESTION_RESPONSE)
+    return copy.deepcopy(MOCK_DIAGNOSIS_RESPONSE)
+
+
+class MockModelClient:
+    """Mock backend bez sítě (AI_BACKEND=mock)"""
+
+    async def start(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+    async def complete(self, prompt: str) -> Dict[str, Any]:
+        return mock_response_for(prompt)
+
+    async def stream(self, prompt: str, chunk_chars: int = 12) -> AsyncIterator[str]:
+        """Mock odpověď po kouscích textu, jako by je generoval model"""
+        content = json.dumps(mock_response_for(prompt), ensure_ascii=False)
+        for i in range(0, len(content), chunk_chars):
+            await asyncio.sleep(0)
+            yield content[i:i + chunk_chars]
+
+
+class HTTPModelClient:
+    """
+    Asynchronní klient OpenAI-kompatibilního /chat/completions API (AI_BACKEND=http).
+    Jeden httpx.AsyncClient s poolem keep-alive spojení se vytvoří při startu
+    aplikace a sdílí se všemi požadavky, takže se TCP/TLS spojení nenavazuje
+    pro každé volání znovu.
+    """
+
+    def __init__(self, settings: ModelClientSettings, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.settings = settings
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        s = self.settings
+        http2 = s.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("AI_HTTP2 je zapnuté, ale balíček h2 chybí, používám HTTP/1.1")
+            http2 = False
+
+        headers = {"Content-Type": "application/json", **s.extra_headers}
+        if s.api_key:
+            headers["Authorization"] = f"Bearer {s.api_key}"
+
+        return httpx.AsyncClient(
+            base_url=s.base_url.rstrip("/"),
+            headers=headers,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=s.max_connections,
+                max_keepalive_connections=s.max_keepalive_connections,
+                keepalive_expiry=s.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=s.connect_timeout,
+                read=s.read_timeout,
+                write=s.write_timeout,
+                pool=s.pool_timeout,
+            ),
+            transport=self._transport,
+        )
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = self._build_client()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _payload(self, prompt: str) -> Dict[str, Any]:
+        return {
+            "model": self.settings.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.settings.max_tokens,
+            "temperature": self.settings.temperature,
+            "response_format": {"type": "json_object"},
+        }
+
+    @staticmethod
+    def _parse_content(content: str) -> Dict[str, Any]:
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ModelClientError(f"Model nevrátil platný JSON: {e}") from e
+        if not isinstance(data, dict):
+            raise ModelClientError("Model nevrátil JSON objekt")
+        return data
+
+    async def complete(self, prompt: str) -> Dict[str, Any]:
+        if self._client is None:
+            await self.start()
+        try:
+            response = await self._client.post("/chat/completions", json=self._payload(prompt))
+            response.raise_for_status()
+            content = response.json()["choices"][0]["message"]["content"]
+        except httpx.HTTPStatusError as e:
+            raise _status_error(e) from e
+        except httpx.HTTPError as e:
+            raise ModelClientError(f"Chyba spojení s AI API: {e!r}") from e
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise ModelClientError(f"Neočekávaný formát odpovědi AI API: {e!r}") from e
+        return self._parse_content(content)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Streamovaná odpověď (stream=true): vrací přírůstky textu tak, jak je model generuje"""
+        if self._client is None:
+            await self.start()
+        payload = {**self._payload(prompt), "stream": True}
+        try:
+            async with self._client.stream("POST", "/chat/completions", json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        except httpx.HTTPStatusError as e:
+            raise _status_error(e) from e
+        except httpx.HTTPError as e:
+            raise ModelClientError(f"Chyba spojení s AI API: {e!r}") from e
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise ModelClientError(f"Neočekávaný formát odpovědi AI API: {e!r}") from e
+
+
+def create_model_client(settings: Optional[ModelClientSettings] = None,
+                        transport: Optional[httpx.AsyncBaseTransport] = None):
+    """Vytvoří klienta podle AI_BACKEND (mock | http)"""
+    settings = settings or ModelClientSettings.from_env()
+    if settings.backend == "mock":
+        return MockModelClient()
+    if settings.backend == "http":
+        return HTTPModelClient(settings, transport=transport)
+    raise ValueError(f"Neznámý AI_BACKEND: {settings.backend}")
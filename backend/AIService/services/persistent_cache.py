@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from services.response_cache import DEFAULT_TTLS, ResponseCache
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_response_cache (
+    key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ai_response_cache_last_access ON ai_response_cache (last_access);
+CREATE INDEX IF NOT EXISTS ix_ai_response_cache_expires_at ON ai_response_cache (expires_at);
+"""
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """Zámek drží jiný worker (SQLITE_BUSY / SQLITE_LOCKED)"""
+    name = getattr(error, "sqlite_errorname", "")
+    return name.startswith(("SQLITE_BUSY", "SQLITE_LOCKED")) or "locked" in str(error) or "busy" in str(error)
+
+
+class SQLiteResponseCache:
+    """
+    Cache odpovědí AI modelu v SQLite souboru (WAL), sdílená všemi uvicorn workery
+    na jednom stroji a zachovaná přes restart / deploy.
+
+    Rozhraní je stejné jako u ResponseCache. Velikost je omezená součtem bajtů
+    uložených JSON hodnot: evict() (v aplikaci periodicky, viz evict_periodically)
+    maže nejdéle nepoužité položky až na 90 % limitu. Čas posledního použití se při
+    čtení zapisuje nejvýš jednou za `touch_interval` sekund, aby čtení nebyla zápisem.
+
+    Z event loopu se volají aget/aset, které get/set spustí v thread poolu. Na zámek
+    jiného workeru čekají nejvýš `busy_timeout` sekund, aby nedržely vlákna: zamčené
+    čtení je miss, zamčený zápis se vynechá (busy_skips). Údržba (warm_from, evict,
+    snapshot) čeká až `maintenance_timeout`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttls: Optional[Dict[str, float]] = None,
+                 touch_interval: float = 30.0, busy_timeout: float = 0.005,
+                 maintenance_timeout: float = 5.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.touch_interval = touch_interval
+        self.busy_timeout = busy_timeout
+        self.maintenance_timeout = maintenance_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats = {endpoint: {"hits": 0, "misses": 0} for endpoint in self.ttls}
+        self.evictions = 0
+        self.busy_skips = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=maintenance_timeout, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._set_busy_timeout(busy_timeout)
+
+    @classmethod
+    def from_env(cls) -> "SQLiteResponseCache":
+        memory = ResponseCache.from_env()
+        return cls(
+            path=os.getenv("AI_CACHE_PATH", "./cache/ai_response_cache.sqlite3"),
+            max_bytes=int(os.getenv("AI_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            ttls=memory.ttls,
+        )
+
+    endpoint_of = staticmethod(ResponseCache.endpoint_of)
+
+    def _set_busy_timeout(self, seconds: float) -> None:
+        self._conn.execute(f"PRAGMA busy_timeout={max(0, int(seconds * 1000))}")
+
+    @contextmanager
+    def _maintenance(self) -> Iterator[None]:
+        """Zámek instance a delší čekání na zámek databáze pro údržbové operace"""
+        with self._lock:
+            self._set_busy_timeout(self.maintenance_timeout)
+            try:
+                yield
+            finally:
+                self._set_busy_timeout(self.busy_timeout)
+
+    def _counter(self, endpoint: str) -> Dict[str, int]:
+        return self._stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(hodnota, expires_at podle hodin cache), nebo None"""
+        endpoint = self.endpoint_of(key)
+        now = self._clock()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT value, expires_at, last_access FROM ai_response_cache WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e):
+                    raise
+                self.busy_skips += 1
+                row = None
+            if row is None or row[1] <= now:
+                self._counter(endpoint)["misses"] += 1
+                return None
+            if now - row[2] >= self.touch_interval:
+                try:
+                    self._conn.execute("UPDATE ai_response_cache SET last_access = ? WHERE key = ?", (now, key))
+                except sqlite3.OperationalError as e:
+                    # Čas použití se dopíše při dalším čtení
+                    if not _is_busy(e):
+                        raise
+                    self.busy_skips += 1
+            self._counter(endpoint)["hits"] += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        endpoint = self.endpoint_of(key)
+        ttl = self.ttls.get(endpoint, 0)
+        if ttl <= 0 or self.max_bytes <= 0:
+            return
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        now = self._clock()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ai_response_cache (key, endpoint, value, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, endpoint, payload, len(payload.encode("utf-8")), now + ttl, now)
+                )
+            except sqlite3.OperationalError as e:
+                # Zámek drží jiný worker: odpověď se do sdílené cache neuloží
+                if not _is_busy(e):
+                    raise
+                self.busy_skips += 1
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aget_entry(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        return await asyncio.to_thread(self.get_entry, key)
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    def _evict(self, now: float) -> None:
+        """Smaže prošlé položky a pak nejdéle nepoužité, dokud součet nespadne pod 90 % limitu"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (now,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_response_cache").fetchone()[0]
+            if total > self.max_bytes:
+                target = int(self.max_bytes * 0.9)
+                doomed = []
+                for key, size in self._conn.execute("SELECT key, size FROM ai_response_cache ORDER BY last_access"):
+                    if total <= target:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM ai_response_cache WHERE key = ?", doomed)
+                self.evictions += len(doomed)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def evict(self) -> None:
+        with self._maintenance():
+            self._evict(self._clock())
+
+    def snapshot(self, target_path: str) -> None:
+        """Konzistentní kopie cache (SQLite backup API) pro zahřátí jiné instance"""
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        # Vlastní dočasný soubor pro každý proces: snapshot při vypnutí dělá každý worker
+        tmp_path = f"{target_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        target = sqlite3.connect(tmp_path)
+        try:
+            with self._maintenance():
+                self._conn.backup(target)
+            target.close()
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            target.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def warm_from(self, snapshot_path: str) -> int:
+        """Načte platné položky ze snapshotu; existující položky nepřepisuje. Vrací počet nových."""
+        if not os.path.exists(snapshot_path):
+            return 0
+        now = self._clock()
+        with self._maintenance():
+            self._conn.execute("ATTACH DATABASE ? AS snapshot", (snapshot_path,))
+            try:
+                before = self._conn.total_changes
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO ai_response_cache "
+                    "SELECT key, endpoint, value, size, expires_at, last_access "
+                    "FROM snapshot.ai_response_cache WHERE expires_at > ?", (now,)
+                )
+                added = self._conn.total_changes - before
+            finally:
+                self._conn.execute("DETACH DATABASE snapshot")
+            self._evict(now)
+        return added
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_response_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_response_cache"
+            ).fetchone()
+        endpoints = {}
+        for endpoint, counter in self._stats.items():
+            total = counter["hits"] + counter["misses"]
+            endpoints[endpoint] = {
+                **counter,
+                "hit_ratio": round(counter["hits"] / total, 3) if total else None,
+                "ttl_seconds": self.ttls.get(endpoint),
+            }
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "busy_skips": self.busy_skips,
+            "endpoints": endpoints,
+        }
+
+
+class TieredResponseCache:
+    """In-process LRU před sdílenou SQLite cache: opakované dotazy v rámci workeru se
+    obslouží z paměti, ostatní workery a restart pokrývá SQLite."""
+
+    def __init__(self, memory: ResponseCache, shared: SQLiteResponseCache):
+        self.memory = memory
+        self.shared = shared
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None:
+            entry = self.shared.get_entry(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            # Paměťová kopie vyprší nejpozději se sdílenou položkou
+            self.memory.set(key, value, ttl=expires_at - self.shared._clock())
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value)
+        self.shared.set(key, value)
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """Jako get, ale sdílená cache se čte v thread poolu; zásah v paměti event loop neopouští"""
+        value = self.memory.get(key)
+        if value is None:
+            entry = await self.shared.aget_entry(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            self.memory.set(key, value, ttl=expires_at - self.shared._clock())
+        return value
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value)
+        await self.shared.aset(key, value)
+
+    def evict(self) -> None:
+        self.shared.evict()
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.shared.clear()
+
+    def warm_from(self, snapshot_path: str) -> int:
+        return self.shared.warm_from(snapshot_path)
+
+    def snapshot(self, target_path: str) -> None:
+        self.shared.snapshot(target_path)
+
+    def __len__(self) -> int:
+        return len(self.shared)
+
+    def close(self) -> None:
+        self.shared.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "tiered", "memory": self.memory.stats(), "shared": self.shared.stats()}
+
+
+async def evict_periodically(cache, interval: float) -> None:
+    """Úklid cache každých `interval` sekund v thread poolu, mimo cestu požadavků (běží do zrušení)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(cache.evict)
+        except sqlite3.OperationalError as e:
+            # Zámek drží jiný worker déle než maintenance_timeout: úklid se zkusí příště
+            if not _is_busy(e):
+                logger.exception("Úklid cache odpovědí AI selhal")
@@ -0,0 +1,200 @@
+import json
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+_TOKEN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+TRUNCATION_MARK = " … "
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Lokální odhad počtu tokenů bez tokenizéru: interpunkce = 1 token, slovo = 1 token
+    na každé 4 znaky (české tvary s diakritikou se v BPE dělí na víc kousků).
+    Pro rozpočet stačí, přesnost kolem ±15 % proti tiktoken.
+    """
+    if not text:
+        return 0
+    return sum(max(1, math.ceil(len(t) / 4)) if t[0].isalnum() or t[0] == "_" else 1
+               for t in _TOKEN.findall(text))
+
+
+def minify(text: str) -> str:
+    """Sloučí odsazení a prázdné řádky do jedné mezery"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def truncate_to_tokens(text: Optional[str], budget: int) -> str:
+    """Zkrátí text na rozpočet tokenů; ponechá začátek a konec (v poznámkách bývá
+    nejnovější informace na konci) a mezi ně vloží „…“"""
+    text = minify(text or "")
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+
+    head_budget = budget * 2 // 3
+    tail_budget = budget - head_budget - 1
+
+    def take(tokens_iter, limit):
+        used = 0
+        end = 0
+        for match in tokens_iter:
+            cost = estimate_tokens(match.group())
+            if used + cost > limit:
+                break
+            used += cost
+            end = match.end()
+        return end
+
+    head_end = take(_TOKEN.finditer(text), head_budget)
+    tail_start = len(text)
+    used = 0
+    for match in reversed(list(_TOKEN.finditer(text, head_end))):
+        cost = estimate_tokens(match.group())
+        if used + cost > tail_budget:
+            break
+        used += cost
+        tail_start = match.start()
+    return text[:head_end].rstrip() + TRUNCATION_MARK + text[tail_start:].lstrip()
+
+
+def truncate_list_to_tokens(items: Optional[Iterable[str]], budget: int, separator: str = ", ") -> str:
+    """Spojí položky seznamu do rozpočtu tokenů; zbytek nahradí „(+N dalších)“"""
+    items = [minify(item) for item in items or [] if item and minify(item)]
+    kept: List[str] = []
+    used = 0
+    for item in items:
+        cost = estimate_tokens(item) + 1
+        if used + cost > budget:
+            break
+        kept.append(item)
+        used += cost
+    if len(kept) < len(items):
+        kept.append(f"(+{len(items) - len(kept)} dalších)")
+    return separator.join(kept)
+
+
+@dataclass
+class PromptBudget:
+    """Rozpočty tokenů pro proměnná pole promptu"""
+    question: int = 500
+    context: int = 300
+    medical_history: int = 200
+    clinical_notes: int = 400
+    symptoms: int = 200
+
+    @classmethod
+    def from_env(cls) -> "PromptBudget":
+        return cls(
+            question=int(os.getenv("AI_PROMPT_QUESTION_TOKENS", "500")),
+            context=int(os.getenv("AI_PROMPT_CONTEXT_TOKENS", "300")),
+            medical_history=int(os.getenv("AI_PROMPT_HISTORY_TOKENS", "200")),
+            clinical_notes=int(os.getenv("AI_PROMPT_NOTES_TOKENS", "400")),
+            symptoms=int(os.getenv("AI_PROMPT_SYMPTOMS_TOKENS", "200")),
+        )
+
+
+class PromptTemplate:
+    """
+    Předkompilovaný prompt: statická část (role, pokyny, JSON schéma odpovědi) se
+    minifikuje jednou při importu a stojí na začátku, takže je pro všechna volání
+    stejná bajt po bajtu (prompt caching u poskytovatele); proměnná část následuje.
+    """
+
+    def __init__(self, instructions: str, response_schema: dict, closing: str):
+        schema = json.dumps(response_schema, ensure_ascii=False, separators=(",", ":"))
+        self.prefix = f"{minify(instructions)} Odpověz pouze JSON objektem ve formátu: {schema} {minify(closing)}\n"
+        self.prefix_tokens = estimate_tokens(self.prefix)
+
+    def render(self, lines: Iterable[str]) -> str:
+        return self.prefix + "\n".join(line for line in lines if line)
+
+
+SYMPTOM_ANALYSIS_TEMPLATE = PromptTemplate(
+    "Jako AI asistent pro zdravotnictví analyzuj symptomy pacienta a poskytni strukturovanou odpověď.",
+    {
+        "possible_conditions": [
+            {"name": "název diagnózy", "probability": 0.7, "description": "popis",
+             "severity": "low/medium/high/critical"}
+        ],
+        "recommendations": ["doporučení 1", "doporučení 2"],
+        "urgency_level": "low/medium/high/critical",
+        "confidence_score": 0.8,
+        "should_seek_immediate_care": False,
+    },
+    "Odpověz v češtině a buď konzervativní s diagnózami.",
+)
+
+MEDICAL_QUESTION_TEMPLATE = PromptTemplate(
+    "Jako AI asistent pro zdravotnictví odpověz na lékařskou otázku.",
+    {
+        "answer": "detailní odpověď",
+        "sources": [{"title": "název zdroje", "type": "guideline/study/textbook", "reliability_score": 0.9}],
+        "confidence_score": 0.8,
+        "follow_up_questions": ["otázka 1", "otázka 2"],
+        "related_topics": ["téma 1", "téma 2"],
+    },
+    "Odpověz v češtině a buď přesný s medicínskými informacemi.",
+)
+
+DIAGNOSIS_ASSISTANCE_TEMPLATE = PromptTemplate(
+    "Jako AI asistent pro diagnostiku poskytni diagnostickou asistenci k symptomům pacienta.",
+    {
+        "suggested_diagnoses": [
+            {"diagnosis": "název diagnózy", "icd_code": "ICD-10 kód", "probability": 0.7,
+             "supporting_evidence": ["důkaz 1"], "contradicting_evidence": ["proti-důkaz 1"]}
+        ],
+        "recommended_tests": [
+            {"test_name": "název testu", "priority": "urgent/routine/optional", "reason": "důvod"}
+        ],
+        "treatment_suggestions": [
+            {"treatment": "léčba", "type": "medication/procedure/lifestyle", "priority": "vysoká/střední/nízká"}
+        ],
+        "confidence_score": 0.8,
+    },
+    "Odpověz v češtině.",
+)
+
+
+def _gender(patient_info) -> Optional[str]:
+    gender = getattr(patient_info, "gender", None)
+    return getattr(gender, "value", gender)
+
+
+def symptom_analysis_prompt(request, budget: PromptBudget) -> str:
+    lines = [f"Symptomy: {truncate_list_to_tokens((s.name for s in request.symptoms), budget.symptoms)}"]
+    info = request.patient_info
+    if info:
+        if info.age:
+            lines.append(f"Věk: {info.age} let")
+        if _gender(info):
+            lines.append(f"Pohlaví: {_gender(info)}")
+        if info.medical_history:
+            lines.append(f"Anamnéza: {truncate_list_to_tokens(info.medical_history, budget.medical_history)}")
+    return SYMPTOM_ANALYSIS_TEMPLATE.render(lines)
+
+
+def medical_question_prompt(request, budget: PromptBudget) -> str:
+    return MEDICAL_QUESTION_TEMPLATE.render([
+        f"Otázka: {truncate_to_tokens(request.question, budget.question)}",
+        f"Kontext: {truncate_to_tokens(request.context, budget.context) or 'Žádný specifický kontext'}",
+        f"Specializace: {request.specialization or 'Obecná medicína'}",
+    ])
+
+
+def diagnosis_assistance_prompt(request, budget: PromptBudget) -> str:
+    lines = [f"Symptomy: {truncate_list_to_tokens((s.name for s in request.symptoms), budget.symptoms)}"]
+    info = request.patient_info
+    if info:
+        lines.append(f"Věk: {info.age or 'neznámý'}")
+        lines.append(f"Pohlaví: {_gender(info) or 'neznámé'}")
+    if request.test_results:
+        lines.append(f"Výsledky testů: {len(request.test_results)} výsledků")
+    if request.clinical_notes:
+        lines.append(f"Klinické poznámky: {truncate_to_tokens(request.clinical_notes, budget.clinical_notes)}")
+    return DIAGNOSIS_ASSISTANCE_TEMPLATE.render(lines)
@@ -0,0 +1,280 @@
+import asyncio
+import copy
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from services.concurrency import OverloadedError
+from services.metrics import LatencyStats
+from services.response_cache import DIAGNOSIS, QUESTION, SYMPTOMS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Odpovědi při nedostupném modelu, když není ani starší odpověď z cache:
+# nulová jistota a odkaz na lékaře, nikdy se neukládají do cache
+DEGRADED_RESPONSES: Dict[str, Dict[str, Any]] = {
+    SYMPTOMS: {
+        "possible_conditions": [],
+        "recommendations": ["AI analýza je dočasně nedostupná, obraťte se prosím na lékaře"],
+        "urgency_level": "medium",
+        "confidence_score": 0.0,
+        "should_seek_immediate_care": False,
+    },
+    QUESTION: {
+        "answer": "AI asistent je dočasně nedostupný, zkuste to prosím později.",
+        "sources": [],
+        "confidence_score": 0.0,
+        "follow_up_questions": [],
+        "related_topics": [],
+    },
+    DIAGNOSIS: {
+        "suggested_diagnoses": [],
+        "recommended_tests": [],
+        "treatment_suggestions": [],
+        "confidence_score": 0.0,
+    },
+}
+
+
+class CircuitOpenError(OverloadedError):
+    """AI model má vysokou chybovost, volání se neposílají (jistič je rozpojený)"""
+
+
+class CircuitBreaker:
+    """
+    Jistič volání AI modelu podle chybovosti v klouzavém časovém okně.
+
+    closed:    volání procházejí; když je v okně aspoň `min_calls` výsledků a podíl
+               chyb dosáhne `failure_rate`, jistič se rozpojí
+    open:      volání se `open_seconds` neposílají vůbec
+    half_open: projde jedno zkušební volání; úspěch jistič sepne, chyba ho znovu rozpojí
+    """
+
+    def __init__(self, failure_rate: float = 0.5, min_calls: int = 20, window: float = 30.0,
+                 open_seconds: float = 15.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._outcomes: "deque[tuple]" = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self.state = CLOSED
+        self.opened = 0
+        self.short_circuited = 0
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(
+            failure_rate=float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5")),
+            min_calls=int(os.getenv("AI_BREAKER_MIN_CALLS", "20")),
+            window=float(os.getenv("AI_BREAKER_WINDOW", "30")),
+            open_seconds=float(os.getenv("AI_BREAKER_OPEN_SECONDS", "15")),
+        )
+
+    def allow(self) -> bool:
+        now = self._clock()
+        if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probe_started = None
+        if self.state == HALF_OPEN:
+            # Zkušební volání, které se nikdy neohlásilo (zrušené), po open_seconds nahradí další
+            if self._probe_started is None or now - self._probe_started >= self.open_seconds:
+                self._probe_started = now
+                return True
+        if self.state == CLOSED:
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record(self, ok: bool) -> None:
+        now = self._clock()
+        if self.state == HALF_OPEN:
+            if ok:
+                self._reset(CLOSED)
+            else:
+                self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self._outcomes.append((now, ok))
+        self._failures += not ok
+        while self._outcomes and self._outcomes[0][0] <= now - self.window:
+            self._failures -= not self._outcomes.popleft()[1]
+        if len(self._outcomes) >= self.min_calls and self._failures / len(self._outcomes) >= self.failure_rate:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self._reset(OPEN)
+        self._opened_at = now
+        self.opened += 1
+
+    def _reset(self, state: str) -> None:
+        self.state = state
+        self._outcomes.clear()
+        self._failures = 0
+        self._probe_started = None
+
+    def retry_after(self) -> int:
+        remaining = self.open_seconds - (self._clock() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_failures": self._failures,
+            "opened": self.opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class ResilientCaller:
+    """
+    Volání AI modelu s hedgingem a jističem.
+
+    Hedging: u endpointů z `hedge_endpoints` se po `hedge_percentile` percentilu latence
+    (nejméně `hedge_min_delay` s, až po `hedge_min_samples` měřeních) pošle souběžně
+    druhé stejné volání a použije se odpověď, která přijde dřív; druhé se zruší.
+    Duplicitních volání je nejvýš `hedge_max_ratio` z počtu volání, aby hedging
+    při zpomalení upstreamu nezdvojnásobil zátěž.
+
+    Jistič: při rozpojení se volání neposílají a fallback() vrátí podle `fallback`
+    poslední úspěšnou odpověď pro stejný klíč (cached), případně obecnou odpověď
+    s nulovou jistotou (degraded), jinak volající dostane CircuitOpenError (503).
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, hedge_endpoints: Iterable[str] = (),
+                 hedge_percentile: float = 95, hedge_min_delay: float = 0.05, hedge_min_samples: int = 20,
+                 hedge_max_ratio: float = 0.1, fallback: str = "cached", fallback_entries: int = 1000):
+        if fallback not in ("cached", "degraded", "none"):
+            raise ValueError(f"Neznámý režim fallbacku: {fallback}")
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_endpoints = set(hedge_endpoints)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_ratio = hedge_max_ratio
+        self.fallback_mode = fallback
+        self.fallback_entries = fallback_entries
+        self._last_good: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.latency: Dict[str, LatencyStats] = {}
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = {"cached": 0, "degraded": 0}
+
+    @classmethod
+    def from_env(cls) -> "ResilientCaller":
+        endpoints = os.getenv("AI_HEDGE_ENDPOINTS", "")
+        return cls(
+            breaker=CircuitBreaker.from_env(),
+            hedge_endpoints=[e.strip() for e in endpoints.split(",") if e.strip()],
+            hedge_percentile=float(os.getenv("AI_HEDGE_PERCENTILE", "95")),
+            hedge_min_delay=float(os.getenv("AI_HEDGE_MIN_DELAY_MS", "50")) / 1000,
+            hedge_min_samples=int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20")),
+            hedge_max_ratio=float(os.getenv("AI_HEDGE_MAX_RATIO", "0.1")),
+            fallback=os.getenv("AI_BREAKER_FALLBACK", "cached").lower(),
+        )
+
+    def _latency(self, endpoint: str) -> LatencyStats:
+        return self.latency.setdefault(endpoint, LatencyStats(window=500))
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """Za kolik sekund poslat duplicitní volání; None = nehedgovat"""
+        if endpoint not in self.hedge_endpoints or self.breaker.state != CLOSED:
+            return None
+        if self._latency(endpoint).count < self.hedge_min_samples or self.hedges >= self.hedge_max_ratio * self.calls:
+            return None
+        return self._percentile_delay(endpoint)
+
+    def _percentile_delay(self, endpoint: str) -> float:
+        return max(self.hedge_min_delay, self._latency(endpoint).percentile(self.hedge_percentile))
+
+    async def call(self, endpoint: str, factory: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            raise CircuitOpenError("AI model je dočasně nedostupný (vysoká chybovost)", self.breaker.retry_after())
+        self.calls += 1
+        delay = self.hedge_delay(endpoint)
+        primary = asyncio.ensure_future(self._attempt(endpoint, factory))
+        hedge = None
+        try:
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.hedges += 1
+            hedge = asyncio.ensure_future(self._attempt(endpoint, factory))
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge_wins += task is hedge
+                        return task.result()
+                    if error is None or task is primary:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _attempt(self, endpoint: str, factory: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result = await factory()
+        except OverloadedError:
+            # Odmítnutí lokálním limiterem není chyba upstreamu
+            raise
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        self._latency(endpoint).record(time.perf_counter() - started)
+        return result
+
+    def remember(self, key: str, response: Dict[str, Any]) -> None:
+        """Uloží poslední úspěšnou odpověď pro fallback (nezávisle na TTL cache odpovědí)"""
+        if self.fallback_mode == "none" or self.fallback_entries <= 0:
+            return
+        self._last_good[key] = response
+        self._last_good.move_to_end(key)
+        while len(self._last_good) > self.fallback_entries:
+            self._last_good.popitem(last=False)
+
+    def fallback(self, endpoint: str, key: str) -> Optional[Dict[str, Any]]:
+        if self.fallback_mode == "none":
+            return None
+        response = self._last_good.get(key)
+        if response is not None:
+            self.fallbacks["cached"] += 1
+            return response
+        if self.fallback_mode == "degraded" and endpoint in DEGRADED_RESPONSES:
+            self.fallbacks["degraded"] += 1
+            return copy.deepcopy(DEGRADED_RESPONSES[endpoint])
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats(),
+            "hedging": {
+                "endpoints": sorted(self.hedge_endpoints),
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "delay_ms": {endpoint: round(self._percentile_delay(endpoint) * 1000, 1)
+                             for endpoint in sorted(self.hedge_endpoints)},
+            },
+            "fallback": {"mode": self.fallback_mode, **self.fallbacks},
+            "latency": {endpoint: stats.snapshot() for endpoint, stats in self.latency.items()},
+        }
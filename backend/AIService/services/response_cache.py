@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+SYMPTOMS = "symptoms"
+QUESTION = "question"
+DIAGNOSIS = "diagnosis"
+
+DEFAULT_TTLS = {
+    SYMPTOMS: 3600.0,
+    QUESTION: 24 * 3600.0,
+    DIAGNOSIS: 900.0,
+}
+
+# Hranice věkových skupin (dolní mez včetně): kojenec, batole, dítě, dorost, dospělí..., senior
+AGE_BUCKETS = [(0, "0"), (1, "1-4"), (5, "5-11"), (12, "12-17"), (18, "18-29"),
+               (30, "30-44"), (45, "45-59"), (60, "60-74"), (75, "75+")]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip().casefold()
+
+
+def normalize_list(items: Optional[Iterable[str]]) -> list:
+    return sorted({normalize_text(item) for item in items or [] if normalize_text(item)})
+
+
+def age_bucket(age: Optional[int]) -> Optional[str]:
+    if age is None:
+        return None
+    label = AGE_BUCKETS[0][1]
+    for lower, name in AGE_BUCKETS:
+        if age >= lower:
+            label = name
+    return label
+
+
+def _patient_key(patient_info) -> Dict[str, Any]:
+    if not patient_info:
+        return {}
+    gender = getattr(patient_info, "gender", None)
+    return {
+        "age": age_bucket(getattr(patient_info, "age", None)),
+        "gender": normalize_text(str(getattr(gender, "value", gender) or "")),
+        "history": normalize_list(getattr(patient_info, "medical_history", None)),
+    }
+
+
+def _digest(endpoint: str, parts: Dict[str, Any]) -> str:
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{endpoint}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def symptom_analysis_key(request) -> str:
+    """Klíč pro analýzu symptomů: seřazené názvy symptomů + věková skupina, pohlaví, anamnéza"""
+    return _digest(SYMPTOMS, {
+        "symptoms": normalize_list(s.name for s in request.symptoms),
+        "patient": _patient_key(request.patient_info),
+    })
+
+
+def medical_question_key(request) -> str:
+    return _digest(QUESTION, {
+        "question": normalize_text(request.question),
+        "context": normalize_text(request.context),
+        "specialization": normalize_text(request.specialization),
+    })
+
+
+def diagnosis_assistance_key(request) -> str:
+    return _digest(DIAGNOSIS, {
+        "symptoms": normalize_list(s.name for s in request.symptoms),
+        "patient": _patient_key(request.patient_info),
+        "test_results": len(request.test_results or []),
+        "clinical_notes": normalize_text(request.clinical_notes),
+    })
+
+
+class ResponseCache:
+    """
+    LRU cache surových odpovědí AI modelu (před _process_*_response), omezená počtem
+    položek, s TTL podle endpointu. Hodnoty se berou jako neměnné — response_id
+    a timestamp vznikají až při zpracování, takže jsou pro každý požadavek nové.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttls: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._stats = {endpoint: {"hits": 0, "misses": 0} for endpoint in self.ttls}
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000")),
+            ttls={
+                SYMPTOMS: float(os.getenv("AI_CACHE_TTL_SYMPTOMS", str(DEFAULT_TTLS[SYMPTOMS]))),
+                QUESTION: float(os.getenv("AI_CACHE_TTL_QUESTION", str(DEFAULT_TTLS[QUESTION]))),
+                DIAGNOSIS: float(os.getenv("AI_CACHE_TTL_DIAGNOSIS", str(DEFAULT_TTLS[DIAGNOSIS]))),
+            },
+        )
+
+    @staticmethod
+    def endpoint_of(key: str) -> str:
+        return key.split(":", 1)[0]
+
+    def _counter(self, endpoint: str) -> Dict[str, int]:
+        return self._stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        endpoint = self.endpoint_of(key)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self._counter(endpoint)["hits"] += 1
+                return value
+            del self._entries[key]
+        self._counter(endpoint)["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """`ttl` zkrátí platnost pod TTL endpointu (zbytek platnosti položky z jiné cache)"""
+        configured = self.ttls.get(self.endpoint_of(key), 0)
+        ttl = configured if ttl is None else min(ttl, configured)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # Asynchronní rozhraní společné s persistentními cache; slovník v paměti event loop neblokuje
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        self.set(key, value)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, counter in self._stats.items():
+            total = counter["hits"] + counter["misses"]
+            endpoints[endpoint] = {
+                **counter,
+                "hit_ratio": round(counter["hits"] / total, 3) if total else None,
+                "ttl_seconds": self.ttls.get(endpoint),
+            }
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "endpoints": endpoints,
+        }
+
+
+def create_response_cache():
+    """Cache podle AI_CACHE_BACKEND: memory (výchozí, jen v procesu), sqlite (sdílený
+    soubor na disku, přežije restart) nebo tiered (paměť před sdílenou SQLite)"""
+    backend = os.getenv("AI_CACHE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return ResponseCache.from_env()
+
+    from services.persistent_cache import SQLiteResponseCache, TieredResponseCache
+    if backend == "sqlite":
+        return SQLiteResponseCache.from_env()
+    if backend == "tiered":
+        return TieredResponseCache(ResponseCache.from_env(), SQLiteResponseCache.from_env())
+    raise ValueError(f"Neznámý AI_CACHE_BACKEND: {backend}")
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Set
+
+from services.metrics import LatencyStats
+from services.response_cache import DIAGNOSIS, QUESTION, SYMPTOMS
+
+INTERACTIVE_DIAGNOSIS = "interactive_diagnosis"
+INTERACTIVE_QUESTION = "interactive_question"
+BATCH = "batch"
+
+DEFAULT_WEIGHTS = {
+    INTERACTIVE_DIAGNOSIS: 8.0,
+    INTERACTIVE_QUESTION: 4.0,
+    BATCH: 1.0,
+}
+
+# Třída interaktivního volání podle endpointu; dávkové položky jsou vždy BATCH
+ENDPOINT_PRIORITIES = {
+    DIAGNOSIS: INTERACTIVE_DIAGNOSIS,
+    QUESTION: INTERACTIVE_QUESTION,
+    SYMPTOMS: INTERACTIVE_QUESTION,
+}
+
+
+def priority_for(endpoint: str) -> str:
+    return ENDPOINT_PRIORITIES.get(endpoint, INTERACTIVE_QUESTION)
+
+
+class CallPriority:
+    """
+    Třída priority jednoho volání modelu, sdílená všemi volajícími sloučenými do něj
+    (single-flight). Dokud volání čeká ve frontě limiteru, lze ji zvýšit, takže
+    interaktivní požadavek nečeká s vahou dávky, ke které se připojil.
+    """
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        # Čekající ve frontě (víc při hedgingu); limiter je přidává a po přidělení místa odebírá
+        self.waiters: Set[asyncio.Future] = set()
+
+
+class WeightedFairQueue:
+    """
+    Fronta čekajících volání AI modelu rozdělená podle třídy priority (weighted fair queueing).
+
+    Každé čekající volání dostane virtuální čas dokončení max(V, poslední značka třídy)
+    + 1 / váha a jako další se obslouží to s nejmenší značkou, takže při plné zátěži
+    dostávají třídy místa v poměru vah (výchozí 8 : 4 : 1) a v rámci třídy platí pořadí
+    příchodu. Volání, které čeká déle než `max_wait` sekund, jde na řadu přednostně
+    bez ohledu na váhu (ochrana dávek před vyhladověním).
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, max_wait: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.max_wait = max_wait
+        self._clock = clock
+        self._queues: Dict[str, deque] = {priority: deque() for priority in self.weights}
+        self._last_tag = {priority: 0.0 for priority in self.weights}
+        self._virtual_time = 0.0
+        self.queue_latency = {priority: LatencyStats() for priority in self.weights}
+        self.starvation_promotions = 0
+
+    @classmethod
+    def from_env(cls) -> "WeightedFairQueue":
+        return cls(
+            weights={
+                INTERACTIVE_DIAGNOSIS: float(os.getenv("AI_SCHED_WEIGHT_DIAGNOSIS", "8")),
+                INTERACTIVE_QUESTION: float(os.getenv("AI_SCHED_WEIGHT_QUESTION", "4")),
+                BATCH: float(os.getenv("AI_SCHED_WEIGHT_BATCH", "1")),
+            },
+            max_wait=float(os.getenv("AI_SCHED_MAX_WAIT_MS", "5000")) / 1000,
+        )
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _check(self, priority: str) -> None:
+        if priority not in self.weights:
+            raise ValueError(f"Neznámá třída priority: {priority}")
+
+    def push(self, waiter: asyncio.Future, priority: str) -> None:
+        self._check(priority)
+        tag = max(self._virtual_time, self._last_tag[priority]) + 1 / self.weights[priority]
+        self._last_tag[priority] = tag
+        self._queues[priority].append((tag, self._clock(), waiter))
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """Další čekající podle značky (nebo nejdéle čekající při překročení max_wait); None = prázdná fronta"""
+        heads = {}
+        for priority, queue in self._queues.items():
+            while queue and queue[0][2].done():
+                queue.popleft()
+            if queue:
+                heads[priority] = queue[0]
+        if not heads:
+            return None
+
+        now = self._clock()
+        oldest = min(heads, key=lambda p: heads[p][1])
+        if now - heads[oldest][1] >= self.max_wait:
+            priority = oldest
+            if priority != min(heads, key=lambda p: heads[p][0]):
+                self.starvation_promotions += 1
+        else:
+            priority = min(heads, key=lambda p: heads[p][0])
+
+        tag, enqueued_at, waiter = self._queues[priority].popleft()
+        self._virtual_time = max(self._virtual_time, tag)
+        self.queue_latency[priority].record(now - enqueued_at)
+        return waiter
+
+    def outranks(self, priority: str, other: str) -> bool:
+        self._check(priority)
+        return self.weights[priority] > self.weights.get(other, 0.0)
+
+    def promote(self, waiter: asyncio.Future, priority: str) -> bool:
+        """Přesune čekajícího do třídy `priority`; čas zařazení (latence, ochrana před
+        vyhladověním) zůstává původní. False, pokud už ve frontě není."""
+        self._check(priority)
+        for queue in self._queues.values():
+            for entry in queue:
+                if entry[2] is waiter:
+                    queue.remove(entry)
+                    tag = max(self._virtual_time, self._last_tag[priority]) + 1 / self.weights[priority]
+                    self._last_tag[priority] = tag
+                    target = self._queues[priority]
+                    # Zachová pořadí příchodu v cílové třídě
+                    index = len(target)
+                    while index and target[index - 1][1] > entry[1]:
+                        index -= 1
+                    target.insert(index, (tag, entry[1], waiter))
+                    return True
+        return False
+
+    def remove(self, waiter: asyncio.Future) -> None:
+        for queue in self._queues.values():
+            for entry in queue:
+                if entry[2] is waiter:
+                    queue.remove(entry)
+                    return
+
+    def admitted_immediately(self, priority: str) -> None:
+        """Volání prošlo bez čekání; započítá se do latence fronty své třídy jako 0"""
+        self._check(priority)
+        self.queue_latency[priority].record(0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "starvation_promotions": self.starvation_promotions,
+            "classes": {
+                priority: {
+                    "weight": self.weights[priority],
+                    "queue_depth": len(self._queues[priority]),
+                    "queue_latency": self.queue_latency[priority].snapshot(),
+                }
+                for priority in self.weights
+            },
+        }
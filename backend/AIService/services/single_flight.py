@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Slučování souběžných shodných volání: dokud pro klíč běží volání modelu, další
+    volající nevolají model znovu, ale čekají na stejný výsledek (nebo výjimku).
+
+    Volání běží jako samostatná úloha, takže zrušení prvního volajícího (např. klient
+    zavře spojení) nezruší výsledek pro ostatní, kteří na něj čekají.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.executed = 0
+        self.collapsed = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._in_flight
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.collapsed += 1
+        else:
+            self.executed += 1
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        # Výjimku mohli všichni čekající "propást" (byli zrušeni); označí se jako převzatá
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._in_flight),
+        }
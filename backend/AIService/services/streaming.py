@@ -0,0 +1,253 @@
+import json
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+# Události parseru: ("delta", klíč, text) pro streamovaná textová pole,
+# ("field", klíč, hodnota) pro každou kompletní hodnotu nejvyšší úrovně
+ParserEvent = Tuple[str, str, Any]
+
+
+class IncrementalJSONParser:
+    """
+    Inkrementální parser jednoho JSON objektu, který model generuje po kouscích.
+
+    Hodnoty klíčů ve `stream_fields` (řetězce, např. "answer") vrací průběžně jako
+    ("delta", klíč, text) už během generování, včetně dekódování escape sekvencí.
+    Ostatní hodnoty nejvyšší úrovně (seznamy zdrojů, čísla...) se skládají
+    a vrátí se jednou jako ("field", klíč, hodnota), až jsou kompletní.
+    Text před prvním "{" (např. ```json) se ignoruje.
+    """
+
+    def __init__(self, stream_fields: Iterable[str] = ("answer",)):
+        self.stream_fields = set(stream_fields)
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._state = "start"
+        self._key: List[str] = []
+        self._key_escape = False
+        self._current_key = ""
+        # Streamovaný řetězec
+        self._text: List[str] = []
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        # Ostatní hodnoty
+        self._raw: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._raw_escape = False
+
+    def feed(self, chunk: str) -> List[ParserEvent]:
+        events: List[ParserEvent] = []
+        delta: List[str] = []
+        for ch in chunk:
+            if self._state == "string":
+                self._feed_string(ch, delta, events)
+            elif self._state == "raw":
+                self._feed_raw(ch, events)
+            elif self._state == "start":
+                if ch == "{":
+                    self._state = "key_or_end"
+            elif self._state == "key_or_end":
+                if ch == '"':
+                    self._key = []
+                    self._state = "key"
+                elif ch == "}":
+                    self._state = "end"
+                    self.done = True
+            elif self._state == "key":
+                if self._key_escape:
+                    self._key.append(ch)
+                    self._key_escape = False
+                elif ch == "\\":
+                    self._key.append(ch)
+                    self._key_escape = True
+                elif ch == '"':
+                    self._current_key = json.loads('"' + "".join(self._key) + '"')
+                    self._state = "colon"
+                else:
+                    self._key.append(ch)
+            elif self._state == "colon":
+                if ch == ":":
+                    self._state = "value"
+            elif self._state == "value":
+                if ch.isspace():
+                    continue
+                if ch == '"' and self._current_key in self.stream_fields:
+                    self._text = []
+                    self._state = "string"
+                else:
+                    self._raw = [ch]
+                    self._in_string = ch == '"'
+                    self._raw_escape = False
+                    self._depth = 1 if ch in "[{" else 0
+                    self._state = "raw"
+            elif self._state == "after_value":
+                if ch == ",":
+                    self._state = "key_or_end"
+                elif ch == "}":
+                    self._state = "end"
+                    self.done = True
+        if delta:
+            events.append(("delta", self._current_key, "".join(delta)))
+        return events
+
+    def _feed_string(self, ch: str, delta: List[str], events: List[ParserEvent]) -> None:
+        if self._unicode is not None:
+            self._unicode += ch
+            if len(self._unicode) == 4:
+                self._emit_code_point(int(self._unicode, 16), delta)
+                self._unicode = None
+        elif self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = ""
+            else:
+                self._emit_char(_ESCAPES.get(ch, ch), delta)
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            key = self._current_key
+            if delta:
+                events.append(("delta", key, "".join(delta)))
+                delta.clear()
+            self.fields[key] = "".join(self._text)
+            events.append(("field", key, self.fields[key]))
+            self._state = "after_value"
+        else:
+            self._emit_char(ch, delta)
+
+    def _emit_code_point(self, code: int, delta: List[str]) -> None:
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        self._emit_char(chr(code), delta)
+
+    def _emit_char(self, ch: str, delta: List[str]) -> None:
+        self._text.append(ch)
+        delta.append(ch)
+
+    def _feed_raw(self, ch: str, events: List[ParserEvent]) -> None:
+        if self._in_string:
+            self._raw.append(ch)
+            if self._raw_escape:
+                self._raw_escape = False
+            elif ch == "\\":
+                self._raw_escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._depth == 0:
+                    self._complete_raw(events)
+            return
+
+        if self._depth == 0 and (ch in ",}" or ch.isspace()):
+            # Konec skalární hodnoty (číslo, true/false/null)
+            self._complete_raw(events)
+            if ch == ",":
+                self._state = "key_or_end"
+            elif ch == "}":
+                self._state = "end"
+                self.done = True
+            return
+
+        self._raw.append(ch)
+        if ch == '"':
+            self._in_string = True
+        elif ch in "[{":
+            self._depth += 1
+        elif ch in "]}":
+            self._depth -= 1
+            if self._depth == 0:
+                self._complete_raw(events)
+
+    def _complete_raw(self, events: List[ParserEvent]) -> None:
+        key = self._current_key
+        self.fields[key] = json.loads("".join(self._raw))
+        events.append(("field", key, self.fields[key]))
+        self._state = "after_value"
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Jedna SSE zpráva (data jako JSON na jednom řádku)"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+# Pole odpovědi na lékařskou otázku, která se klientovi posílají samostatně, jakmile jsou kompletní
+QUESTION_STRUCTURED_FIELDS = ("sources", "follow_up_questions")
+
+
+async def cached_answer_events(cached: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+    """Celá odpověď z cache najednou, ve stejných událostech jako model_answer_events"""
+    yield "answer", {"text": cached.get("answer", "")}
+    for field in QUESTION_STRUCTURED_FIELDS:
+        yield field, cached.get(field, [])
+    yield "done", _done_payload(cached, cached=True)
+
+
+async def model_answer_events(chunks: AsyncIterator[str], cache=None,
+                              cache_key: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Události pro SSE odpověď na lékařskou otázku z přírůstků textu, které generuje model:
+      answer               {"text": přírůstek}        průběžně během generování
+      sources              [...]                       jakmile je seznam kompletní
+      follow_up_questions  [...]                       jakmile je seznam kompletní
+      done                 {response_id, timestamp, confidence_score, related_topics, cached}
+
+    Kompletní odpověď se uloží do cache.
+    """
+    parser = IncrementalJSONParser(stream_fields=("answer",))
+    try:
+        async for chunk in chunks:
+            for kind, key, value in parser.feed(chunk):
+                if kind == "delta" and key == "answer":
+                    yield "answer", {"text": value}
+                elif kind == "field" and key in QUESTION_STRUCTURED_FIELDS:
+                    yield key, value
+    finally:
+        # Předčasně ukončený stream (chyba, odpojený klient) uvolní spojení i místo v limiteru
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+
+    result = parser.fields
+    if not parser.done:
+        raise ValueError("Model ukončil odpověď před koncem JSON objektu")
+    for field in QUESTION_STRUCTURED_FIELDS:
+        if field not in result:
+            yield field, []
+    if cache is not None and cache_key:
+        await cache.aset(cache_key, result)
+    yield "done", _done_payload(result, cached=False)
+
+
+def _done_payload(result: Dict[str, Any], cached: bool) -> Dict[str, Any]:
+    return {
+        "response_id": str(uuid4()),
+        "timestamp": datetime.now().isoformat(),
+        "confidence_score": result.get("confidence_score", 0.7),
+        "related_topics": result.get("related_topics", []),
+        "cached": cached,
+    }
+
+
+async def sse_stream(events: AsyncIterator[Tuple[str, Any]], ttfb=None, duration=None) -> AsyncIterator[str]:
+    """Převede události na SSE text a změří čas do prvního bajtu odpovědi (TTFB) a celkovou dobu"""
+    started = time.perf_counter()
+    first = True
+    try:
+        async for event, data in events:
+            if first and ttfb is not None:
+                ttfb.record(time.perf_counter() - started)
+            first = False
+            yield sse_event(event, data)
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+    finally:
+        if duration is not None:
+            duration.record(time.perf_counter() - started)
@@ -0,0 +1,133 @@
+"""
+Lokální stub OpenAI-kompatibilního API pro vývoj, testy a zátěžové testy bez sítě.
+
+    python stub_model_server.py --port 8081 --latency-ms 300 --jitter-ms 100
+
+a AI Service pak spustit s AI_BACKEND=http AI_API_BASE_URL=http://localhost:8081/v1.
+Odpovídá stejnými daty jako mock backend; latenci (včetně pomalého ocasu
+--slow-rate / --slow-latency-ms) a chybovost lze za běhu změnit přes POST /stub/config.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from services.model_client import mock_response_for
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    retry_after_s: float = 0.0
+    # Ocas rozdělení latence: s pravděpodobností slow_rate trvá odpověď slow_latency_ms
+    slow_rate: float = 0.0
+    slow_latency_ms: float = 0.0
+    seed: Optional[int] = None
+    chunk_chars: int = 8
+    token_interval_ms: float = 0.0
+
+
+def create_stub_app(config: Optional[StubConfig] = None) -> FastAPI:
+    stub = FastAPI(title="CEPEM AI model stub")
+    stub.state.config = config or StubConfig()
+    stub.state.requests = 0
+    stub.state.rng = random.Random(stub.state.config.seed)
+
+    async def stream_chunks(content: str, model: str):
+        cfg: StubConfig = stub.state.config
+        # Latence se rozloží: první kus po latency_ms, další po token_interval_ms
+        for i in range(0, len(content), cfg.chunk_chars):
+            if i and cfg.token_interval_ms:
+                await asyncio.sleep(cfg.token_interval_ms / 1000)
+            chunk = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": content[i:i + cfg.chunk_chars]}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    async def chat_completions(request: Request):
+        cfg: StubConfig = stub.state.config
+        stub.state.requests += 1
+        body: Dict[str, Any] = await request.json()
+
+        rng: random.Random = stub.state.rng
+        delay = cfg.latency_ms + rng.uniform(0, cfg.jitter_ms)
+        if cfg.slow_rate and rng.random() < cfg.slow_rate:
+            delay = cfg.slow_latency_ms
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if cfg.error_rate and rng.random() < cfg.error_rate:
+            headers = {"Retry-After": str(int(cfg.retry_after_s))} if cfg.retry_after_s else None
+            return JSONResponse({"error": {"message": "stub: injected error"}}, status_code=cfg.error_status,
+                                headers=headers)
+
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        content = json.dumps(mock_response_for(prompt), ensure_ascii=False)
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(content, body.get("model", "stub")), media_type="text/event-stream")
+        return {
+            "id": f"chatcmpl-stub-{stub.state.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 0, "total_tokens": len(prompt) // 4},
+        }
+
+    stub.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    stub.add_api_route("/chat/completions", chat_completions, methods=["POST"])
+
+    @stub.post("/stub/config")
+    async def update_config(values: Dict[str, float]):
+        for key, value in values.items():
+            if key == "seed":
+                stub.state.config.seed = int(value)
+                stub.state.rng = random.Random(stub.state.config.seed)
+            elif hasattr(stub.state.config, key):
+                setattr(stub.state.config, key, type(getattr(stub.state.config, key))(value))
+        return asdict(stub.state.config)
+
+    @stub.get("/stub/stats")
+    async def stats():
+        return {"requests": stub.state.requests, **asdict(stub.state.config)}
+
+    return stub
+
+
+app = create_stub_app(StubConfig(
+    latency_ms=float(os.getenv("STUB_LATENCY_MS", "0")),
+    jitter_ms=float(os.getenv("STUB_JITTER_MS", "0")),
+    error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+    slow_rate=float(os.getenv("STUB_SLOW_RATE", "0")),
+    slow_latency_ms=float(os.getenv("STUB_SLOW_LATENCY_MS", "0")),
+))
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub OpenAI-kompatibilního API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=app.state.config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=app.state.config.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=app.state.config.error_rate)
+    parser.add_argument("--slow-rate", type=float, default=app.state.config.slow_rate)
+    parser.add_argument("--slow-latency-ms", type=float, default=app.state.config.slow_latency_ms)
+    args = parser.parse_args()
+
+    app.state.config = StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                                  slow_rate=args.slow_rate, slow_latency_ms=args.slow_latency_ms)
+    uvicorn.run(app, host="0.0.0.0", port=args.port)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app, get_ai_service
+from services.batch import run_ordered
+
+
+@pytest.mark.asyncio
+async def test_run_ordered_keeps_order_and_bounds_concurrency():
+    """Test results come back in input order with at most `concurrency` workers running"""
+    running = 0
+    peak = 0
+    rng = random.Random(1)
+
+    async def worker(n):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(rng.uniform(0, 0.005))
+        running -= 1
+        if n % 7 == 3:
+            raise ValueError(f"bad {n}")
+        return n * 2
+
+    results = [r async for r in run_ordered(list(range(40)), worker, concurrency=4)]
+    assert [index for index, *_ in results] == list(range(40))
+    assert peak <= 4
+    for index, item, outcome, ok in results:
+        assert ok == (index % 7 != 3)
+        assert outcome == index * 2 if ok else str(outcome) == f"bad {index}"
+
+
+class FakeAIService:
+    async def run_batch_item(self, item):
+        if item.get("type") not in ("symptom_analysis", "diagnosis_assistance"):
+            raise ValueError(f"Neznámý typ položky dávky: {item.get('type')}")
+        await asyncio.sleep(0)
+        return {"type": item["type"], "symptoms": item["request"]["symptoms"]}
+
+
+def test_batch_endpoint_streams_ndjson_with_per_item_errors():
+    """Test the batch endpoint streams one NDJSON line per item, in order, with item-level errors"""
+    app.dependency_overrides[get_ai_service] = FakeAIService
+    items = [
+        {"type": "symptom_analysis", "request": {"symptoms": ["horečka"]}},
+        {"type": "nonsense", "request": {}},
+        {"type": "diagnosis_assistance", "request": {"symptoms": ["kašel"]}},
+    ]
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/batch/analyze", json={"items": items, "concurrency": 2})
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("application/x-ndjson")
+            lines = [json.loads(line) for line in response.text.splitlines()]
+
+            assert client.post("/api/batch/analyze", json={"items": []}).status_code == 422
+            assert client.post("/api/batch/analyze", json={"items": items, "concurrency": 0}).status_code == 422
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert lines[0]["success"] and lines[0]["result"]["symptoms"] == ["horečka"]
+    assert not lines[1]["success"] and "nonsense" in lines[1]["error"]
+    assert lines[2]["success"] and lines[2]["type"] == "diagnosis_assistance"
+
+
+def test_batch_endpoint_end_to_end_with_real_service(monkeypatch):
+    """Test a mixed batch through the real AIServiceCore.run_batch_item with one invalid item"""
+    monkeypatch.setenv("AI_BACKEND", "mock")
+    monkeypatch.setenv("AI_CACHE_BACKEND", "memory")
+    items = [
+        {"type": "symptom_analysis", "request": {"symptoms": ["horečka", "kašel"],
+                                                 "patient_info": {"age": 40, "gender": "female"}}},
+        {"type": "diagnosis_assistance", "request": {"symptoms": [{"name": "bolest břicha"}],
+                                                     "clinical_notes": "Bolest trvá 3 dny."}},
+        {"type": "symptom_analysis", "request": {"symptoms": []}},
+        {"type": "diagnosis_assistance", "request": {"symptoms": ["únava"]}},
+    ]
+    with TestClient(app) as client:
+        response = client.post("/api/batch/analyze", json={"items": items, "concurrency": 2})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [line["index"] for line in lines] == [0, 1, 2, 3]
+    assert [line["success"] for line in lines] == [True, True, False, True]
+    assert lines[0]["result"]["possible_conditions"][0]["name"] == "Virová infekce"
+    assert lines[1]["result"]["suggested_diagnoses"][0]["icd_code"] == "K59.0"
+    assert "symptoms" in lines[2]["error"]
+    assert lines[3]["type"] == "diagnosis_assistance"
@@ -0,0 +1,152 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.concurrency import AdaptiveConcurrencyLimiter, OverloadedError
+from services.model_client import ModelClientError, ModelClientSettings, create_model_client
+from stub_model_server import StubConfig, create_stub_app
+
+
+@pytest.mark.asyncio
+async def test_limiter_bounds_in_flight_and_rejects_when_queue_full():
+    """Test calls beyond the limit wait in the queue and a full queue is rejected with Retry-After"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2, max_queue=2)
+    gate = asyncio.Event()
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await gate.wait()
+        running -= 1
+        return "ok"
+
+    tasks = [asyncio.ensure_future(limiter.run(call)) for _ in range(4)]
+    await asyncio.sleep(0)
+    assert limiter.in_flight == 2 and limiter.queue_depth == 2
+
+    with pytest.raises(OverloadedError) as rejected:
+        await limiter.run(call)
+    assert rejected.value.retry_after >= 1
+
+    gate.set()
+    assert await asyncio.gather(*tasks) == ["ok"] * 4
+    assert peak == 2
+    stats = limiter.stats()
+    assert stats["rejected"] == 1 and stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_queue_timeout():
+    """Test a caller that waits longer than queue_timeout fails fast instead of hanging"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1, queue_timeout=0.01)
+    gate = asyncio.Event()
+    holder = asyncio.ensure_future(limiter.run(gate.wait))
+    await asyncio.sleep(0)
+    with pytest.raises(OverloadedError):
+        await limiter.run(gate.wait)
+    assert limiter.queue_timeouts == 1 and limiter.queue_depth == 0
+    gate.set()
+    await holder
+
+
+@pytest.mark.asyncio
+async def test_limiter_grows_additively_and_backs_off_on_slow_calls():
+    """Test fast saturated calls raise the limit and a call over the latency target cuts it"""
+    clock = [0.0]
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=10, latency_target=1.0,
+                                         clock=lambda: clock[0])
+
+    async def call(duration):
+        clock[0] += duration
+        await asyncio.sleep(0)
+
+    for _ in range(4):
+        await asyncio.gather(*(limiter.run(lambda: call(0.1)) for _ in range(4)))
+    assert limiter.limit == 5
+
+    # An unsaturated limiter does not grow
+    grown = limiter._limit
+    await limiter.run(lambda: call(0.1))
+    assert limiter._limit == grown
+
+    before = limiter._limit
+    await limiter.run(lambda: call(2.0))
+    assert limiter._limit == pytest.approx(before * 0.7)
+    assert limiter.decreases == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_backs_off_once_per_429_burst_from_stub():
+    """Test 429s from the stub cut the limit once per congestion event and keep the upstream Retry-After"""
+    stub = create_stub_app(StubConfig(latency_ms=5, error_rate=1.0, error_status=429, retry_after_s=7))
+    settings = ModelClientSettings(backend="http", base_url="http://stub/v1")
+    client = create_model_client(settings, transport=httpx.ASGITransport(app=stub))
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10)
+
+    results = await asyncio.gather(*(limiter.run(lambda: client.complete('{"answer": ""}')) for _ in range(5)),
+                                   return_exceptions=True)
+    await client.aclose()
+    assert all(isinstance(r, ModelClientError) and r.status_code == 429 and r.retry_after == 7 for r in results)
+    assert limiter.throttled == 5
+    assert limiter.decreases == 1 and limiter.limit == 7
+    assert limiter.retry_after() == 7
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_slot_until_done_and_reports_throttling():
+    """Test a stream keeps its limiter slot until the last chunk and a 429 stream backs the limit off"""
+    stub = create_stub_app(StubConfig(chunk_chars=16))
+    settings = ModelClientSettings(backend="http", base_url="http://stub/v1")
+    client = create_model_client(settings, transport=httpx.ASGITransport(app=stub))
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1, max_queue=0)
+
+    chunks = await limiter.open_stream(lambda: client.stream('{"answer": ""}'))
+    assert limiter.in_flight == 1
+    with pytest.raises(OverloadedError):
+        await limiter.open_stream(lambda: client.stream('{"answer": ""}'))
+    text = "".join([chunk async for chunk in chunks])
+    assert text.startswith('{"answer"')
+    assert limiter.in_flight == 0 and limiter.latency.count == 1
+
+    stub.state.config.error_rate = 1.0
+    stub.state.config.error_status = 429
+    failing = await limiter.open_stream(lambda: client.stream('{"answer": ""}'))
+    with pytest.raises(ModelClientError):
+        async for _ in failing:
+            pass
+    assert limiter.in_flight == 0 and limiter.throttled == 1 and limiter.decreases == 1
+
+    abandoned = await limiter.open_stream(lambda: client.stream('{"answer": ""}'))
+    await abandoned.aclose()
+    assert limiter.in_flight == 0
+    await client.aclose()
+
+
+def test_stream_route_returns_503_with_retry_after_when_limiter_is_full(monkeypatch):
+    """Test the real stream route answers 503 + Retry-After when no slot is free and the queue is full"""
+    monkeypatch.setenv("AI_BACKEND", "mock")
+    monkeypatch.setenv("AI_CACHE_BACKEND", "memory")
+    monkeypatch.setenv("AI_LIMIT_INITIAL", "1")
+    monkeypatch.setenv("AI_LIMIT_MAX", "1")
+    monkeypatch.setenv("AI_LIMIT_MAX_QUEUE", "0")
+    with TestClient(app) as client:
+        limiter = app.state.limiter
+        limiter.in_flight = 1   # pretend one running stream holds the only slot
+        response = client.post("/api/medical-question/stream", json={"question": "Co je hypertenze?"})
+        assert response.status_code == 503
+        assert int(response.headers["retry-after"]) >= 1
+
+        limiter.in_flight = 0
+        response = client.post("/api/medical-question/stream", json={"question": "Co je hypertenze?"})
+        assert response.status_code == 200 and "event: done" in response.text
+        assert limiter.in_flight == 0
+
+        metrics = client.get("/api/metrics").json()["concurrency_limiter"]
+        assert metrics["rejected"] == 1 and metrics["latency"]["count"] == 1
+        assert {"limit", "in_flight", "queue_depth", "max_queue"} <= metrics.keys()
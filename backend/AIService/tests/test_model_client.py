@@ -0,0 +1,72 @@
+import pytest
+import httpx
+
+from services.model_client import (
+    HTTPModelClient, MockModelClient, ModelClientError, ModelClientSettings, create_model_client
+)
+from stub_model_server import StubConfig, create_stub_app
+
+
+def http_client(stub_app, **overrides):
+    settings = ModelClientSettings(backend="http", base_url="http://stub/v1", api_key="test-key", **overrides)
+    return create_model_client(settings, transport=httpx.ASGITransport(app=stub_app))
+
+
+def test_backend_selected_from_env(monkeypatch):
+    """Test AI_BACKEND selects the client implementation and HTTP limits come from env"""
+    monkeypatch.setenv("AI_BACKEND", "http")
+    monkeypatch.setenv("AI_HTTP_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("AI_HTTP_READ_TIMEOUT", "2.5")
+    client = create_model_client()
+    assert isinstance(client, HTTPModelClient)
+    assert client.settings.max_connections == 7
+    assert client.settings.read_timeout == 2.5
+
+    monkeypatch.setenv("AI_BACKEND", "mock")
+    assert isinstance(create_model_client(), MockModelClient)
+
+    monkeypatch.setenv("AI_BACKEND", "nonsense")
+    with pytest.raises(ValueError):
+        create_model_client()
+
+
+@pytest.mark.asyncio
+async def test_http_client_round_trip_against_stub():
+    """Test the pooled HTTP client parses the JSON content returned by the stub"""
+    stub = create_stub_app()
+    client = http_client(stub)
+    await client.start()
+    try:
+        first = await client.complete('Poskytni odpověď ve formátu JSON: {"answer": "..."}')
+        second = await client.complete('{"possible_conditions": []}')
+    finally:
+        await client.aclose()
+
+    assert first["answer"].startswith("Detailní odpověď")
+    assert "possible_conditions" in second
+    assert stub.state.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_http_client_error_status_raises_model_client_error():
+    """Test an error status from the API surfaces as ModelClientError"""
+    client = http_client(create_stub_app(StubConfig(error_rate=1.0, error_status=503)))
+    with pytest.raises(ModelClientError, match="503"):
+        await client.complete("prompt")
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_http_client_is_shared_and_configured():
+    """Test one pooled httpx client is reused with the configured timeouts and auth"""
+    client = http_client(create_stub_app(), read_timeout=2.5, connect_timeout=1.0)
+    await client.start()
+    shared = client._client
+    await client.complete("prompt")
+    await client.complete("prompt")
+    assert client._client is shared
+    assert shared.timeout.read == 2.5
+    assert shared.timeout.connect == 1.0
+    assert shared.headers["Authorization"] == "Bearer test-key"
+    await client.aclose()
+    assert client._client is None
@@ -0,0 +1,201 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from services.persistent_cache import SQLiteResponseCache, TieredResponseCache, evict_periodically
+from services.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sqlite_cache_is_shared_between_instances_and_survives_restart(tmp_path):
+    """Test two workers see each other's entries and entries outlive the process"""
+    path = str(tmp_path / "cache.sqlite3")
+    worker_a = SQLiteResponseCache(path)
+    worker_b = SQLiteResponseCache(path)
+
+    worker_a.set("question:abc", {"answer": "odpověď"})
+    assert worker_b.get("question:abc") == {"answer": "odpověď"}
+
+    worker_a.close()
+    worker_b.close()
+    restarted = SQLiteResponseCache(path)
+    assert restarted.get("question:abc") == {"answer": "odpověď"}
+    assert restarted.stats()["endpoints"]["question"]["hits"] == 1
+    restarted.close()
+
+
+def test_sqlite_cache_ttl_and_size_eviction(tmp_path):
+    """Test expired entries miss and the least recently used entries go first over the byte limit"""
+    clock = FakeClock()
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=250,
+                                touch_interval=0, ttls={"symptoms": 60}, clock=clock)
+
+    for i in range(5):
+        clock.now += 1
+        cache.set(f"symptoms:{i}", {"pad": "x" * 50})
+        if i == 3:
+            clock.now += 1
+            assert cache.get("symptoms:0") is not None   # 0 je teď nejnověji použitá
+
+    assert cache.stats()["bytes"] > 250                  # zápis sám neuklízí
+    cache.evict()
+    assert cache.stats()["bytes"] <= 250
+    assert cache.get("symptoms:0") is not None
+    assert cache.get("symptoms:1") is None
+    assert cache.evictions >= 1
+
+    clock.now += 120
+    assert cache.get("symptoms:4") is None
+    cache.close()
+
+
+def test_snapshot_warms_a_fresh_cache(tmp_path):
+    """Test a snapshot of one cache pre-populates a new cache without overwriting its entries"""
+    source = SQLiteResponseCache(str(tmp_path / "old.sqlite3"))
+    source.set("question:a", {"answer": "A"})
+    source.set("question:b", {"answer": "B"})
+    source.snapshot(str(tmp_path / "snapshot.sqlite3"))
+    source.close()
+
+    fresh = SQLiteResponseCache(str(tmp_path / "new.sqlite3"))
+    fresh.set("question:a", {"answer": "novější"})
+    assert fresh.warm_from(str(tmp_path / "snapshot.sqlite3")) == 1
+    assert fresh.get("question:a") == {"answer": "novější"}
+    assert fresh.get("question:b") == {"answer": "B"}
+    assert fresh.warm_from(str(tmp_path / "missing.sqlite3")) == 0
+    fresh.close()
+
+
+def test_tiered_cache_promotes_shared_hits_to_memory(tmp_path):
+    """Test a hit in the shared tier is served from memory the next time"""
+    shared = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"))
+    shared.set("symptoms:k", {"v": 1})
+    tiered = TieredResponseCache(ResponseCache(max_entries=10), shared)
+
+    assert tiered.get("symptoms:k") == {"v": 1}
+    assert tiered.get("symptoms:k") == {"v": 1}
+    stats = tiered.stats()
+    assert stats["memory"]["endpoints"]["symptoms"]["hits"] == 1
+    assert stats["shared"]["endpoints"]["symptoms"]["hits"] == 1
+    tiered.close()
+
+
+def test_locked_database_skips_writes_instead_of_blocking(tmp_path):
+    """Test a write lock held by another worker turns set into a quick skip and reads still hit"""
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteResponseCache(path, touch_interval=0)
+    cache.set("question:a", {"answer": "A"})
+
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.perf_counter()
+        cache.set("question:b", {"answer": "B"})
+        assert cache.get("question:a") == {"answer": "A"}
+        assert time.perf_counter() - started < 1.0
+        assert cache.stats()["busy_skips"] == 2   # zápis b a dopsání času použití a
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+
+    assert cache.get("question:b") is None
+    cache.set("question:b", {"answer": "B"})
+    assert cache.get("question:b") == {"answer": "B"}
+    cache.close()
+
+
+def test_snapshot_uses_private_temp_file(tmp_path):
+    """Test concurrent snapshots from two workers do not share a temp file and leave none behind"""
+    target = tmp_path / "snapshot.sqlite3"
+    (tmp_path / "snapshot.sqlite3.tmp").write_bytes(b"stale file of another worker")
+    first = SQLiteResponseCache(str(tmp_path / "a.sqlite3"))
+    second = SQLiteResponseCache(str(tmp_path / "b.sqlite3"))
+    first.set("question:a", {"answer": "A"})
+
+    first.snapshot(str(target))
+    second.snapshot(str(target))
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("snapshot")) == [
+        "snapshot.sqlite3", "snapshot.sqlite3.tmp"
+    ]
+    first.close()
+    second.close()
+
+
+def test_tiered_memory_copy_expires_with_shared_entry(tmp_path):
+    """Test a shared hit is kept in memory only for the remaining TTL of the shared entry"""
+    clock = FakeClock()
+    shared = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), ttls={"symptoms": 60}, clock=clock)
+    memory = ResponseCache(max_entries=10, ttls={"symptoms": 60}, clock=clock)
+    tiered = TieredResponseCache(memory, shared)
+    shared.set("symptoms:k", {"v": 1})
+
+    clock.now += 50
+    assert tiered.get("symptoms:k") == {"v": 1}
+    clock.now += 11
+    assert memory.get("symptoms:k") is None
+    assert tiered.get("symptoms:k") is None
+    tiered.close()
+
+
+class ThreadRecordingCache(SQLiteResponseCache):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = []
+
+    def get_entry(self, key):
+        self.threads.append(threading.get_ident())
+        return super().get_entry(key)
+
+    def set(self, key, value):
+        self.threads.append(threading.get_ident())
+        super().set(key, value)
+
+
+@pytest.mark.asyncio
+async def test_async_access_runs_sqlite_off_the_event_loop(tmp_path):
+    """Test aget/aset query SQLite in worker threads and tiered memory hits stay on the loop"""
+    shared = ThreadRecordingCache(str(tmp_path / "cache.sqlite3"))
+    tiered = TieredResponseCache(ResponseCache(), shared)
+
+    await shared.aset("question:a", {"answer": "A"})
+    assert await shared.aget("question:a") == {"answer": "A"}
+    assert await tiered.aget("question:a") == {"answer": "A"}   # ze sdílené cache do paměti
+    assert await tiered.aget("question:a") == {"answer": "A"}   # z paměti
+    await tiered.aset("question:b", {"answer": "B"})
+
+    assert len(shared.threads) == 4
+    assert threading.get_ident() not in shared.threads
+    shared.close()
+
+
+@pytest.mark.asyncio
+async def test_periodic_eviction_trims_the_cache_in_the_background(tmp_path):
+    """Test evict_periodically brings the cache under its byte limit without any further writes"""
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=250)
+    for i in range(5):
+        cache.set(f"symptoms:{i}", {"pad": "x" * 50})
+    assert cache.stats()["bytes"] > 250
+
+    task = asyncio.create_task(evict_periodically(cache, interval=0.01))
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if cache.stats()["bytes"] <= 250:
+                break
+        assert cache.stats()["bytes"] <= 250
+        assert not task.done()
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    cache.close()
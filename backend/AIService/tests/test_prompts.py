@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+from services.model_client import mock_response_for
+from services.prompts import (
+    DIAGNOSIS_ASSISTANCE_TEMPLATE, MEDICAL_QUESTION_TEMPLATE, SYMPTOM_ANALYSIS_TEMPLATE, PromptBudget,
+    diagnosis_assistance_prompt, estimate_tokens, medical_question_prompt, symptom_analysis_prompt,
+    truncate_list_to_tokens, truncate_to_tokens,
+)
+
+
+def symptom_request(names, age=None, history=None, notes=None):
+    return SimpleNamespace(
+        symptoms=[SimpleNamespace(name=n) for n in names],
+        patient_info=SimpleNamespace(age=age, gender=None, medical_history=history or []),
+        test_results=[],
+        clinical_notes=notes,
+    )
+
+
+def test_estimate_tokens():
+    """Test token estimate counts punctuation and splits long words"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("bolest hlavy.") == 2 + 2 + 1
+    assert estimate_tokens("a" * 40) == 10
+
+
+def test_truncate_keeps_head_and_tail_within_budget():
+    """Test truncation respects the budget and keeps the start and the latest notes"""
+    text = "začátek " + " ".join(f"slovo{i}" for i in range(500)) + " konec"
+    short = truncate_to_tokens(text, 60)
+    assert estimate_tokens(short) <= 60 + 1
+    assert short.startswith("začátek")
+    assert short.endswith("konec")
+    assert " … " in short
+    assert truncate_to_tokens("  krátký\n  text  ", 60) == "krátký text"
+
+
+def test_truncate_list_reports_dropped_items():
+    """Test list truncation keeps whole items and notes how many were dropped"""
+    history = [f"diagnóza {i}" for i in range(50)]
+    joined = truncate_list_to_tokens(history, 20)
+    assert joined.startswith("diagnóza 0, diagnóza 1")
+    assert joined.endswith("dalších)")
+
+
+def test_prompts_share_static_prefix_and_bound_variable_fields():
+    """Test prompts start with the same minified prefix and long fields are cut to budget"""
+    budget = PromptBudget(medical_history=20, clinical_notes=30)
+    notes = "pacient udává " * 300
+    first = diagnosis_assistance_prompt(symptom_request(["kašel"], age=40, notes=notes), budget)
+    second = diagnosis_assistance_prompt(symptom_request(["horečka"], age=7), budget)
+    assert first.startswith(DIAGNOSIS_ASSISTANCE_TEMPLATE.prefix)
+    assert second.startswith(DIAGNOSIS_ASSISTANCE_TEMPLATE.prefix)
+    assert "\n        " not in DIAGNOSIS_ASSISTANCE_TEMPLATE.prefix
+    assert estimate_tokens(first) < DIAGNOSIS_ASSISTANCE_TEMPLATE.prefix_tokens + 60
+
+    symptoms = symptom_analysis_prompt(symptom_request(["kašel"], history=["astma"] * 100), budget)
+    assert symptoms.startswith(SYMPTOM_ANALYSIS_TEMPLATE.prefix)
+    assert estimate_tokens(symptoms) < SYMPTOM_ANALYSIS_TEMPLATE.prefix_tokens + 40
+
+
+def test_prompt_kinds_still_recognized_by_mock_backend():
+    """Test the minified JSON schemas keep the keys the mock backend dispatches on"""
+    budget = PromptBudget()
+    question = SimpleNamespace(question="Jak léčit chřipku?", context=None, specialization=None)
+    assert "answer" in mock_response_for(medical_question_prompt(question, budget))
+    assert "possible_conditions" in mock_response_for(symptom_analysis_prompt(symptom_request(["kašel"]), budget))
+    assert "suggested_diagnoses" in mock_response_for(diagnosis_assistance_prompt(symptom_request(["kašel"]), budget))
+    assert MEDICAL_QUESTION_TEMPLATE.prefix.endswith("\n")
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from services.model_client import ModelClientError, ModelClientSettings, create_model_client
+from services.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ResilientCaller
+from services.response_cache import DIAGNOSIS, SYMPTOMS
+from stub_model_server import StubConfig, create_stub_app
+
+
+def warmed_caller(latency=0.01, **kwargs):
+    caller = ResilientCaller(hedge_endpoints=[DIAGNOSIS], hedge_min_delay=0.0, hedge_max_ratio=1.0, **kwargs)
+    for _ in range(20):
+        caller._latency(DIAGNOSIS).record(latency)
+    return caller
+
+
+@pytest.mark.asyncio
+async def test_hedge_sent_after_p95_and_faster_response_wins():
+    """Test a slow primary gets a duplicate after the p95 delay and the faster reply is used"""
+    caller = warmed_caller()
+    durations = iter([1.0, 0.0])
+    cancelled = []
+
+    async def call():
+        duration = next(durations)
+        try:
+            await asyncio.sleep(duration)
+        except asyncio.CancelledError:
+            cancelled.append(duration)
+            raise
+        return {"took": duration}
+
+    started = time.perf_counter()
+    assert await caller.call(DIAGNOSIS, call) == {"took": 0.0}
+    assert time.perf_counter() - started < 0.5
+    await asyncio.sleep(0)
+    assert cancelled == [1.0]
+    assert caller.hedges == 1 and caller.hedge_wins == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_for_fast_calls_other_endpoints_or_over_budget():
+    """Test hedging stays off for fast replies, unlisted endpoints and once the hedge budget is spent"""
+    caller = warmed_caller()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        return {}
+
+    await caller.call(DIAGNOSIS, call)
+    await caller.call(SYMPTOMS, call)
+    assert calls == 2 and caller.hedges == 0
+    assert caller.hedge_delay(SYMPTOMS) is None
+
+    caller.hedge_max_ratio = 0.0
+    assert caller.hedge_delay(DIAGNOSIS) is None
+
+
+def test_breaker_opens_on_error_rate_and_recovers_through_half_open():
+    """Test the breaker opens at the failure threshold, short-circuits, then probes and closes"""
+    clock = [0.0]
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=10, open_seconds=5, clock=lambda: clock[0])
+    for ok in (True, False, True):
+        breaker.record(ok)
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow() and breaker.retry_after() == 5
+
+    clock[0] = 5.0
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    clock[0] = 10.0
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast_with_cached_or_degraded_fallback():
+    """Test an open breaker skips the model and falls back to the last good answer, then a degraded one"""
+    breaker = CircuitBreaker(min_calls=2)
+    caller = ResilientCaller(breaker=breaker, fallback="degraded")
+    caller.remember("symptoms:a", {"recommendations": ["Odpočinek"]})
+
+    async def failing():
+        raise ModelClientError("AI API vrátilo 500", status_code=500)
+
+    for _ in range(2):
+        with pytest.raises(ModelClientError):
+            await caller.call(SYMPTOMS, failing)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError) as rejected:
+        await caller.call(SYMPTOMS, failing)
+    assert rejected.value.retry_after >= 1
+    assert caller.fallback(SYMPTOMS, "symptoms:a") == {"recommendations": ["Odpočinek"]}
+    degraded = caller.fallback(SYMPTOMS, "symptoms:b")
+    assert degraded["confidence_score"] == 0.0 and degraded["possible_conditions"] == []
+    assert caller.stats()["fallback"] == {"mode": "degraded", "cached": 1, "degraded": 1}
+
+    assert ResilientCaller(fallback="cached").fallback(SYMPTOMS, "symptoms:b") is None
+
+
+@pytest.mark.asyncio
+async def test_hedging_cuts_tail_latency_against_stub():
+    """Test hedging bounds latency against a stub with an injected slow tail"""
+    stub = create_stub_app(StubConfig(latency_ms=2, slow_rate=0.2, slow_latency_ms=400, seed=1))
+    settings = ModelClientSettings(backend="http", base_url="http://stub/v1")
+    client = create_model_client(settings, transport=httpx.ASGITransport(app=stub))
+    caller = warmed_caller(latency=0.005)
+    prompt = '{"suggested_diagnoses": []}'
+
+    worst = 0.0
+    for _ in range(20):
+        started = time.perf_counter()
+        response = await caller.call(DIAGNOSIS, lambda: client.complete(prompt))
+        worst = max(worst, time.perf_counter() - started)
+        assert "suggested_diagnoses" in response
+    await client.aclose()
+
+    assert caller.hedges > 0
+    assert caller.hedge_wins >= 1
+    assert worst < 0.2
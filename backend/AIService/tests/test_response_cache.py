@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services.response_cache import (
+    ResponseCache, age_bucket, diagnosis_assistance_key, medical_question_key, symptom_analysis_key
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def symptom_request(names, age=34, gender="female", history=None):
+    return SimpleNamespace(
+        symptoms=[SimpleNamespace(name=n) for n in names],
+        patient_info=SimpleNamespace(age=age, gender=gender, medical_history=history or []),
+    )
+
+
+def test_symptom_key_is_normalized():
+    """Test symptom order, case, whitespace and exact age within a bucket do not change the key"""
+    a = symptom_analysis_key(symptom_request(["Horečka", "kašel"], age=31))
+    b = symptom_analysis_key(symptom_request(["  KAŠEL ", "horečka"], age=44))
+    c = symptom_analysis_key(symptom_request(["horečka", "kašel"], age=46))
+    d = symptom_analysis_key(symptom_request(["horečka", "kašel"], age=31, gender="male"))
+    assert a == b
+    assert a != c
+    assert a != d
+    assert age_bucket(0) == "0" and age_bucket(3) == "1-4" and age_bucket(90) == "75+"
+
+
+def test_keys_are_separated_by_endpoint():
+    """Test question text and specialization form the question key and endpoints never collide"""
+    q1 = SimpleNamespace(question="Jaká je  dávka?", context=None, specialization="Kardiologie")
+    q2 = SimpleNamespace(question="jaká je dávka?", context="", specialization="kardiologie")
+    assert medical_question_key(q1) == medical_question_key(q2)
+
+    diag = SimpleNamespace(**vars(symptom_request(["horečka"])), test_results=[], clinical_notes=None)
+    assert diagnosis_assistance_key(diag) != symptom_analysis_key(symptom_request(["horečka"]))
+
+
+def test_cache_lru_eviction_ttl_and_counters():
+    """Test size-bounded LRU eviction, per-endpoint TTL expiry and hit/miss counters"""
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, ttls={"symptoms": 10, "question": 100, "diagnosis": 0}, clock=clock)
+
+    cache.set("symptoms:a", {"v": 1})
+    cache.set("question:b", {"v": 2})
+    assert cache.get("symptoms:a") == {"v": 1}      # a je teď nejnověji použitá
+    cache.set("question:c", {"v": 3})               # vyhodí b
+    assert cache.get("question:b") is None
+    assert cache.evictions == 1
+
+    clock.now += 11
+    assert cache.get("symptoms:a") is None          # TTL symptomů vypršelo
+    assert cache.get("question:c") == {"v": 3}
+
+    cache.set("diagnosis:d", {"v": 4})              # TTL 0 = necachovat
+    assert cache.get("diagnosis:d") is None
+
+    stats = cache.stats()["endpoints"]
+    assert stats["symptoms"]["hits"] == 1 and stats["symptoms"]["misses"] == 1
+    assert stats["question"]["hits"] == 1 and stats["question"]["misses"] == 1
+    assert stats["diagnosis"]["misses"] == 1
+
+
+def test_metrics_endpoint_reports_cache_stats():
+    """Test the metrics endpoint exposes the response cache counters"""
+    with TestClient(app) as client:
+        response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert "symptoms" in response.json()["response_cache"]["endpoints"]
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from models import DiagnosisAssistanceRequest, SymptomAnalysisRequest
+from services.ai_service import AIServiceCore
+from services.concurrency import AdaptiveConcurrencyLimiter
+from services.model_client import MockModelClient
+from services.resilience import ResilientCaller
+from services.response_cache import ResponseCache
+from services.scheduling import BATCH, INTERACTIVE_DIAGNOSIS, INTERACTIVE_QUESTION, WeightedFairQueue
+from services.single_flight import SingleFlight
+
+
+def futures(n):
+    loop = asyncio.new_event_loop()
+    items = [loop.create_future() for _ in range(n)]
+    loop.close()
+    return items
+
+
+def test_classes_served_in_proportion_to_weights():
+    """Test a backlog of all classes is drained 8:4:1 and FIFO within a class"""
+    queue = WeightedFairQueue()
+    waiters = futures(24)
+    owner = {}
+    for i, priority in enumerate([INTERACTIVE_DIAGNOSIS, INTERACTIVE_QUESTION, BATCH] * 8):
+        queue.push(waiters[i], priority)
+        owner[id(waiters[i])] = (priority, i)
+
+    served = [owner[id(queue.pop())] for _ in range(13)]
+    counts = {p: sum(1 for c, _ in served if c == p) for p in (INTERACTIVE_DIAGNOSIS, INTERACTIVE_QUESTION, BATCH)}
+    assert counts == {INTERACTIVE_DIAGNOSIS: 8, INTERACTIVE_QUESTION: 4, BATCH: 1}
+    diagnosis_order = [i for c, i in served if c == INTERACTIVE_DIAGNOSIS]
+    assert diagnosis_order == sorted(diagnosis_order)
+    assert len(queue) == 11
+
+
+def test_starving_call_is_promoted_after_max_wait():
+    """Test a batch call waiting past max_wait jumps ahead of fresher interactive calls"""
+    clock = [0.0]
+    queue = WeightedFairQueue(max_wait=5.0, clock=lambda: clock[0])
+    batch, *interactive = futures(4)
+    queue.push(batch, BATCH)
+    clock[0] = 0.5
+    for waiter in interactive:
+        queue.push(waiter, INTERACTIVE_DIAGNOSIS)
+
+    clock[0] = 1.0
+    assert queue.pop() is interactive[0]
+    clock[0] = 6.0
+    assert queue.pop() is batch
+    assert queue.starvation_promotions == 1
+    latency = queue.stats()["classes"][BATCH]["queue_latency"]
+    assert latency["count"] == 1 and latency["max_ms"] == 6000.0
+
+    with pytest.raises(ValueError):
+        queue.push(futures(1)[0], "urgent")
+
+
+@pytest.mark.asyncio
+async def test_limiter_hands_free_slot_to_interactive_before_batch():
+    """Test a queued diagnosis call overtakes batch calls queued before it"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    gate = asyncio.Event()
+    order = []
+
+    async def call(name):
+        order.append(name)
+
+    holder = asyncio.ensure_future(limiter.run(gate.wait, BATCH))
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(limiter.run(lambda n=n: call(n), BATCH)) for n in ("batch-1", "batch-2")]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.ensure_future(limiter.run(lambda: call("diagnosis"), INTERACTIVE_DIAGNOSIS)))
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 3
+
+    gate.set()
+    await asyncio.gather(holder, *tasks)
+    assert order == ["diagnosis", "batch-1", "batch-2"]
+    classes = limiter.stats()["scheduler"]["classes"]
+    assert classes[BATCH]["queue_latency"]["count"] == 3
+    assert classes[INTERACTIVE_DIAGNOSIS]["queue_latency"]["count"] == 1
+
+
+async def settle():
+    # Volání služby projde single-flight a hedgingem, než dojde do fronty limiteru
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+class RecordingModelClient(MockModelClient):
+    def __init__(self):
+        self.prompts = []
+
+    async def complete(self, prompt):
+        self.prompts.append(prompt)
+        return await super().complete(prompt)
+
+
+@pytest.mark.asyncio
+async def test_interactive_caller_joining_queued_batch_call_raises_its_priority():
+    """Test an interactive call coalesced into a queued batch call is served at interactive priority"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    client = RecordingModelClient()
+    service = AIServiceCore(model_client=client, response_cache=ResponseCache(), single_flight=SingleFlight(),
+                            limiter=limiter, resilience=ResilientCaller())
+    gate = asyncio.Event()
+    holder = asyncio.ensure_future(limiter.run(gate.wait, BATCH))
+    await asyncio.sleep(0)
+
+    other_batch = asyncio.ensure_future(service.analyze_symptoms_with_ai(
+        SymptomAnalysisRequest(symptoms=["kašel"]), BATCH))
+    await settle()
+    request = DiagnosisAssistanceRequest(symptoms=["horečka"])
+    batch = asyncio.ensure_future(service.provide_diagnosis_assistance_with_ai(request, BATCH))
+    await settle()
+    interactive = asyncio.ensure_future(service.provide_diagnosis_assistance_with_ai(request))
+    await settle()
+    assert limiter.queue_depth == 2
+    classes = limiter.stats()["scheduler"]["classes"]
+    assert classes[INTERACTIVE_DIAGNOSIS]["queue_depth"] == 1
+    assert classes[BATCH]["queue_depth"] == 1
+
+    gate.set()
+    await asyncio.gather(holder, other_batch, batch, interactive)
+    assert len(client.prompts) == 2
+    assert "horečka" in client.prompts[0] and "kašel" in client.prompts[1]
+    assert service.single_flight.stats()["collapsed"] == 1
+    assert service._flight_priorities == {}
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from models import MedicalQuestionRequest
+from services.ai_service import AIServiceCore
+from services.concurrency import AdaptiveConcurrencyLimiter
+from services.model_client import MockModelClient
+from services.resilience import ResilientCaller
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight
+
+
+class SlowModelClient(MockModelClient):
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return await super().complete(prompt)
+
+
+def ai_service(client):
+    return AIServiceCore(model_client=client, response_cache=ResponseCache(), single_flight=SingleFlight(),
+                         limiter=AdaptiveConcurrencyLimiter(), resilience=ResilientCaller())
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_are_collapsed():
+    """Test identical in-flight keys share one upstream call and are counted as collapsed"""
+    flight = SingleFlight()
+    upstream_calls = 0
+
+    async def call():
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.01)
+        return {"answer": upstream_calls}
+
+    results = await asyncio.gather(*[flight.do("question:a", call) for _ in range(5)],
+                                   flight.do("question:b", call))
+    assert upstream_calls == 2
+    assert results[:5] == [results[0]] * 5
+    assert flight.stats() == {"calls": 6, "executed": 2, "collapsed": 4, "in_flight": 0}
+
+    # Po dokončení se klíč uvolní a další volání jde znovu na model
+    await flight.do("question:a", call)
+    assert upstream_calls == 3
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_leader_cancellation_does_not_cancel_followers():
+    """Test followers receive the leader's exception, and cancelling the leader keeps the call alive"""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    outcomes = await asyncio.gather(flight.do("k", failing), flight.do("k", failing), return_exceptions=True)
+    assert all(isinstance(o, RuntimeError) for o in outcomes)
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    leader = asyncio.ensure_future(flight.do("s", slow))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.do("s", slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "ok"
+
+
+@pytest.mark.asyncio
+async def test_service_collapses_concurrent_identical_questions():
+    """Test two concurrent identical questions through AIServiceCore make one model call"""
+    client = SlowModelClient()
+    service = ai_service(client)
+    request = MedicalQuestionRequest(question="Jak léčit migrénu?")
+
+    first, second = await asyncio.gather(service.answer_medical_question_with_ai(request),
+                                         service.answer_medical_question_with_ai(request))
+    assert client.calls == 1
+    assert service.single_flight.stats()["collapsed"] == 1
+    assert first.answer == second.answer
+    assert first.response_id != second.response_id
+
+
+@pytest.mark.asyncio
+async def test_service_serves_repeated_question_from_cache():
+    """Test a repeated question after the first answer is a cache hit without a model call"""
+    client = SlowModelClient()
+    service = ai_service(client)
+    request = MedicalQuestionRequest(question="Jak léčit migrénu?")
+
+    first = await service.answer_medical_question_with_ai(request)
+    second = await service.answer_medical_question_with_ai(request)
+    assert client.calls == 1
+    assert second.answer == first.answer
+    assert service.single_flight.stats()["calls"] == 1
+    question = service.response_cache.stats()["endpoints"]["question"]
+    assert (question["hits"], question["misses"]) == (1, 1)
@@ -0,0 +1,128 @@
+import json
+import random
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app, get_ai_service
+from services.model_client import MockModelClient, ModelClientSettings, create_model_client
+from services.response_cache import ResponseCache
+from services.ai_service import AIServiceCore
+from services.streaming import IncrementalJSONParser, model_answer_events
+from stub_model_server import StubConfig, create_stub_app
+
+DOCUMENT = {
+    "answer": "Léčba \"hypertenze\"\nzačíná režimem 😀 a\\nebo léky",
+    "sources": [{"title": "ESC {2024}", "type": "guideline", "reliability_score": 0.95}],
+    "confidence_score": 0.85,
+    "follow_up_questions": ["Jaké jsou rizikové faktory?"],
+    "related_topics": [],
+    "flag": True,
+}
+
+
+def feed_in_chunks(text, sizes):
+    parser = IncrementalJSONParser(stream_fields=("answer",))
+    events = []
+    i = 0
+    while i < len(text):
+        n = sizes()
+        events.extend(parser.feed(text[i:i + n]))
+        i += n
+    return parser, events
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_parser_matches_json_loads_for_any_chunking(ensure_ascii):
+    """Test the incremental parser yields the same document however the text is split"""
+    text = "```json\n" + json.dumps(DOCUMENT, ensure_ascii=ensure_ascii, indent=2) + "\n```"
+    rng = random.Random(7)
+    for sizes in (lambda: 1, lambda: 3, lambda: rng.randint(1, 40), lambda: 10_000):
+        parser, events = feed_in_chunks(text, sizes)
+        assert parser.done
+        assert parser.fields == DOCUMENT
+        streamed = "".join(v for kind, key, v in events if kind == "delta" and key == "answer")
+        assert streamed == DOCUMENT["answer"]
+        completed = [key for kind, key, _ in events if kind == "field"]
+        assert completed == list(DOCUMENT)
+
+
+def test_parser_streams_answer_before_object_is_complete():
+    """Test answer text is emitted while the object is still open and lists only once complete"""
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"answer": "Dobrý') == [("delta", "answer", "Dobrý")]
+    assert parser.feed(' den", "sources": [{"title": "A"') == [
+        ("delta", "answer", " den"), ("field", "answer", "Dobrý den")
+    ]
+    assert parser.feed('}], ') == [("field", "sources", [{"title": "A"}])]
+    assert not parser.done
+
+
+@pytest.mark.asyncio
+async def test_stream_events_from_stub_and_cache():
+    """Test SSE events come from the streamed model output and a second request is served from cache"""
+    settings = ModelClientSettings(backend="http", base_url="http://stub/v1")
+    client = create_model_client(settings, transport=httpx.ASGITransport(app=create_stub_app(StubConfig(chunk_chars=5))))
+    service = AIServiceCore(model_client=client, response_cache=ResponseCache())
+    payload = {"question": "Jak se léčí hypertenze?"}
+
+    events = [e async for e in await service.stream_medical_question(payload)]
+    names = [name for name, _ in events]
+    assert names.count("answer") > 1
+    assert names[-1] == "done" and "sources" in names and "follow_up_questions" in names
+    assert "".join(d["text"] for n, d in events if n == "answer").startswith("Detailní odpověď")
+    assert events[-1][1]["cached"] is False
+
+    cached = [e async for e in await service.stream_medical_question(payload)]
+    assert cached[-1][1]["cached"] is True
+    assert cached[-1][1]["response_id"] != events[-1][1]["response_id"]
+    await client.aclose()
+
+
+class FakeAIService:
+    async def stream_medical_question(self, payload):
+        if "question" not in payload:
+            raise ValueError("question is required")
+        return model_answer_events(MockModelClient().stream('{"answer": ...}'))
+
+
+def test_stream_endpoint_sends_sse_and_tracks_ttfb():
+    """Test the streaming endpoint returns SSE events and records time-to-first-byte"""
+    app.dependency_overrides[get_ai_service] = FakeAIService
+    try:
+        with TestClient(app) as client:
+            response = client.post("/api/medical-question/stream", json={"question": "Co je hypertenze?"})
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            assert "event: answer" in response.text
+            assert "event: done" in response.text
+
+            assert client.post("/api/medical-question/stream", json={}).status_code == 422
+
+            metrics = client.get("/api/metrics").json()["medical_question_stream"]
+            assert metrics["ttfb"]["count"] == 1
+            assert metrics["ttfb"]["p95_ms"] >= 0
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_stream_endpoint_end_to_end_with_real_service(monkeypatch):
+    """Test the SSE endpoint through the real AIServiceCore and the mock model backend"""
+    monkeypatch.setenv("AI_BACKEND", "mock")
+    monkeypatch.setenv("AI_CACHE_BACKEND", "memory")
+    with TestClient(app) as client:
+        response = client.post("/api/medical-question/stream", json={"question": "Jak se léčí hypertenze?"})
+        assert response.status_code == 200
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+        assert client.post("/api/medical-question/stream", json={"question": ""}).status_code == 422
+
+    names = [name for name, _ in events]
+    assert "error" not in names
+    assert names[0] == "answer" and names[-1] == "done"
+    assert "".join(data["text"] for name, data in events if name == "answer").startswith("Detailní odpověď")
+    assert dict(events)["sources"][0]["title"] == "ESC Guidelines 2024"
+    assert events[-1][1]["cached"] is False
@@ -0,0 +1,335 @@
+"""
+Throughput benchmark for the document crypto paths (document_crypto.py) on this machine.
+
+Usage:
+    python bench_crypto.py \
+        --store /var/tmp/cepem-bench \
+        --sizes 50K:200,1M:50,20M:5,500M:1 \
+        --ops decrypt,encrypt,reencrypt \
+        --chunk-sizes 64K,1M,4M \
+        --workers 1,2,4,8 \
+        --output results.jsonl
+
+A synthetic store is generated once in --store: plaintext files in plain/ and the
+same files encrypted in enc/ (--sizes is SIZE:COUNT pairs, the default mix goes from
+50 KB photos to a 500 MB scan). It is reused on the next run if --sizes match.
+
+Each (op, chunk size, workers) combination processes the whole store once:
+  decrypt    enc/ -> plaintext file   (infrm_download.py, thread pool)
+  encrypt    plain/ -> .enc file      (migrate.py, one file at a time)
+  reencrypt  enc/ -> .enc under a new key (reencrypt.py, process pool)
+
+One JSON object per run is written to --output (or stdout) with MB/s, CPU
+utilization (CPU seconds / wall seconds, in cores) and peak RSS; a summary table
+goes to stderr. --sink null discards the output instead of writing it, and
+--cold drops the inputs from the page cache before every run: comparing
+disk/warm against null/warm and disk/cold shows whether AES or the disk is the limit.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from document_crypto import (
+    CHUNK_SIZE,
+    ChunkBuffers,
+    decrypt_stream,
+    encrypt_stream,
+    pad_key,
+    reencrypt_stream,
+)
+
+OLD_KEY = pad_key("BenchOldKey", 32)
+OLD_IV = pad_key("BenchOldIV", 16)
+NEW_KEY = pad_key("BenchNewKey", 32)
+NEW_IV = pad_key("BenchNewIV", 16)
+
+DEFAULT_SIZES = "50K:200,1M:50,20M:5,500M:1"
+STORE_META = "store.json"
+
+# The executor each script actually uses for that path; migrate.py encrypts each
+# examination's documents one by one inside its import loop
+DEFAULT_EXECUTORS = {"decrypt": "thread", "encrypt": "serial", "reencrypt": "process"}
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper().removesuffix("B")
+    unit = text[-1] if text and text[-1] in _UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def parse_mix(spec: str) -> list[tuple[int, int]]:
+    """"50K:200,500M:1" -> [(51200, 200), (524288000, 1)]"""
+    mix = []
+    for part in spec.split(","):
+        size, _, count = part.partition(":")
+        mix.append((parse_size(size), int(count or 1)))
+    return mix
+
+
+def _fmt_size(n: int) -> str:
+    for unit in ("G", "M", "K"):
+        if n >= _UNITS[unit] and n % _UNITS[unit] == 0:
+            return f"{n // _UNITS[unit]}{unit}"
+    return str(n)
+
+
+# --- synthetic store ---------------------------------------------------------
+
+def build_store(store: Path, sizes: str) -> tuple[list[Path], list[Path]]:
+    """Creates (or reuses) plain/ and enc/ with the requested size mix.
+    Returns the plaintext and ciphertext files, largest first so big files start early."""
+    plain_dir, enc_dir = store / "plain", store / "enc"
+    meta_path = store / STORE_META
+    mix = parse_mix(sizes)
+
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        meta = None
+
+    if meta != {"sizes": sizes}:
+        print(f"🛠️  Generuji testovací úložiště {store} ({sizes})...", file=sys.stderr)
+        shutil.rmtree(plain_dir, ignore_errors=True)
+        shutil.rmtree(enc_dir, ignore_errors=True)
+        plain_dir.mkdir(parents=True)
+        enc_dir.mkdir(parents=True)
+        # Content does not change AES speed; one random block repeated keeps generation I/O-bound
+        pattern = os.urandom(CHUNK_SIZE)
+        for size, count in mix:
+            for i in range(count):
+                name = f"{_fmt_size(size)}_{i:05d}"
+                with (plain_dir / name).open("wb") as f:
+                    remaining = size
+                    while remaining:
+                        n = min(remaining, len(pattern))
+                        f.write(pattern[:n])
+                        remaining -= n
+                with (plain_dir / name).open("rb") as src, (enc_dir / f"{name}.enc").open("wb") as dst:
+                    encrypt_stream(src, dst, OLD_KEY, OLD_IV)
+        meta_path.write_text(json.dumps({"sizes": sizes}))
+
+    def by_size(directory: Path) -> list[Path]:
+        return sorted(directory.iterdir(), key=lambda p: p.stat().st_size, reverse=True)
+
+    return by_size(plain_dir), by_size(enc_dir)
+
+
+def drop_page_cache(files: list[Path]) -> None:
+    """Evicts the files from the page cache (clean pages only, no root needed)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in files:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+# --- peak RSS ----------------------------------------------------------------
+
+def _reset_peak_rss() -> bool:
+    """Resets VmHWM of this process (Linux >= 4.0), so each run gets its own peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# --- workers -----------------------------------------------------------------
+
+class _NullSink:
+    def write(self, data) -> int:
+        return len(data)
+
+
+def _worker_init() -> None:
+    _reset_peak_rss()
+
+
+def _cpu_seconds(usage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_file(op: str, src_path: str, out_dir: str, chunk_size: int, sink: str,
+             fsync: bool) -> tuple[int, int, float]:
+    """Runs one file through `op`; returns (bytes read, peak RSS of this worker in KiB,
+    CPU seconds of this worker process while it ran the file). The CPU figure is only
+    meaningful in a process worker, which runs one file at a time."""
+    cpu_start = _cpu_seconds(resource.getrusage(resource.RUSAGE_SELF))
+    buffers = ChunkBuffers(chunk_size)
+    out_path = os.path.join(out_dir, os.path.basename(src_path) + ".out")
+    with open(src_path, "rb") as src:
+        dst = _NullSink() if sink == "null" else open(out_path, "wb")
+        try:
+            if op == "decrypt":
+                decrypt_stream(src, dst, OLD_KEY, OLD_IV, chunk_size, buffers)
+            elif op == "encrypt":
+                encrypt_stream(src, dst, OLD_KEY, OLD_IV, chunk_size, buffers)
+            elif op == "reencrypt":
+                reencrypt_stream(src, dst, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, chunk_size, buffers)
+            else:
+                raise ValueError(f"Unknown op: {op}")
+            if fsync and sink != "null":
+                dst.flush()
+                os.fsync(dst.fileno())
+        finally:
+            if sink != "null":
+                dst.close()
+    if sink != "null":
+        os.remove(out_path)
+    cpu = _cpu_seconds(resource.getrusage(resource.RUSAGE_SELF)) - cpu_start
+    return os.path.getsize(src_path), _peak_rss_kb(), cpu
+
+
+def run_benchmark(op: str, files: list[Path], out_dir: Path, chunk_size: int, workers: int, executor: str,
+                  sink: str, fsync: bool, cold: bool) -> dict:
+    if cold:
+        drop_page_cache(files)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rss_reset = _reset_peak_rss()
+
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    pool_kwargs = {"initializer": _worker_init} if executor == "process" else {}
+    args = [(op, str(p), str(out_dir), chunk_size, sink, fsync) for p in files]
+
+    cpu_start = _cpu_seconds(resource.getrusage(resource.RUSAGE_SELF))
+    wall_start = time.perf_counter()
+    serial = executor == "serial" or workers == 1
+    if serial:
+        results = [run_file(*a) for a in args]
+    else:
+        with pool_class(max_workers=workers, **pool_kwargs) as pool:
+            results = list(pool.map(run_file, *zip(*args)))
+    wall = time.perf_counter() - wall_start
+
+    # RUSAGE_SELF covers thread workers; process workers report their own CPU per file,
+    # because RUSAGE_CHILDREN only counts them once they have been reaped
+    cpu = _cpu_seconds(resource.getrusage(resource.RUSAGE_SELF)) - cpu_start
+    if executor == "process" and workers > 1:
+        cpu += sum(worker_cpu for _, _, worker_cpu in results)
+    total_bytes = sum(n for n, _, _ in results)
+    peak_rss_kb = max([_peak_rss_kb()] + [rss for _, rss, _ in results])
+    return {
+        "op": op,
+        "chunk_size": chunk_size,
+        "workers": 1 if serial else workers,
+        "executor": "serial" if serial else executor,
+        "sink": sink,
+        "fsync": fsync,
+        "cold_cache": cold,
+        "files": len(files),
+        "bytes": total_bytes,
+        "wall_s": round(wall, 4),
+        "mb_per_s": round(total_bytes / wall / 1e6, 2) if wall else None,
+        "cpu_s": round(cpu, 4),
+        "cpu_cores": round(cpu / wall, 3) if wall else None,
+        "cpu_utilization": round(cpu / wall / (os.cpu_count() or 1), 3) if wall else None,
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+        "peak_rss_per_run": rss_reset,
+    }
+
+
+def environment() -> dict:
+    try:
+        from cryptography.hazmat.backends.openssl.backend import backend
+        openssl = backend.openssl_version_text()
+    except Exception:
+        openssl = None
+    return {
+        "type": "environment",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "openssl": openssl,
+    }
+
+
+def _csv(value: str, convert=str) -> list:
+    return [convert(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AES-CBC document encrypt/decrypt/re-encrypt throughput.")
+    parser.add_argument("--store", default="./bench-store",
+                        help="Directory for the synthetic store (reused while --sizes is unchanged)")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"File mix as SIZE:COUNT pairs (default {DEFAULT_SIZES})")
+    parser.add_argument("--ops", default="decrypt,encrypt,reencrypt")
+    parser.add_argument("--chunk-sizes", default="64K,256K,1M,4M")
+    parser.add_argument("--workers", default="1,2,4,8",
+                        help="Worker counts to try (0 = one per CPU core)")
+    parser.add_argument("--executor", choices=["default", "serial", "thread", "process"], default="default",
+                        help="Pool type; default = whatever the corresponding script uses")
+    parser.add_argument("--sink", choices=["file", "null"], default="file",
+                        help="Write the output to disk (default) or discard it to measure pure CPU")
+    parser.add_argument("--fsync", action="store_true", help="fsync each output file (durable writes)")
+    parser.add_argument("--cold", action="store_true",
+                        help="Drop the inputs from the page cache before every run")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default=None, help="JSON lines file (default stdout)")
+    parser.add_argument("--cleanup", action="store_true", help="Delete the store afterwards")
+    args = parser.parse_args()
+
+    ops = _csv(args.ops)
+    unknown = set(ops) - set(DEFAULT_EXECUTORS)
+    if unknown:
+        parser.error(f"unknown --ops: {', '.join(sorted(unknown))}")
+    chunk_sizes = _csv(args.chunk_sizes, parse_size)
+    worker_counts = [w if w > 0 else (os.cpu_count() or 1) for w in _csv(args.workers, int)]
+
+    store = Path(args.store)
+    plain_files, enc_files = build_store(store, args.sizes)
+    out_dir = store / "out"
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        out.write(json.dumps(environment()) + "\n")
+        print(f"{'op':<10} {'chunk':>6} {'workers':>7} {'MB/s':>9} {'CPU cores':>9} {'peak RSS MB':>11}", file=sys.stderr)
+        for op in ops:
+            files = plain_files if op == "encrypt" else enc_files
+            executor = DEFAULT_EXECUTORS[op] if args.executor == "default" else args.executor
+            for chunk_size in chunk_sizes:
+                for workers in ([1] if executor == "serial" else worker_counts):
+                    for run in range(args.repeat):
+                        result = run_benchmark(op, files, out_dir, chunk_size, workers, executor,
+                                               args.sink, args.fsync, args.cold)
+                        result.update({"type": "result", "run": run})
+                        out.write(json.dumps(result) + "\n")
+                        out.flush()
+                        print(f"{op:<10} {_fmt_size(chunk_size):>6} {workers:>7} {result['mb_per_s']:>9} "
+                              f"{result['cpu_cores']:>9} {result['peak_rss_mb']:>11}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        shutil.rmtree(out_dir, ignore_errors=True)
+        if args.cleanup:
+            shutil.rmtree(store, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
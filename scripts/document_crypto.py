@@ -0,0 +1,249 @@
+"""
+AES-256-CBC / PKCS#7 helpers shared by reencrypt.py, infrm_download.py and migrate.py.
+
+Same format as DatabaseAPI's PhotoEncryptionService / DocumentEncryptionService:
+the key and IV strings are space-padded (or cut) to 32 and 16 bytes, the whole
+file is one CBC stream with PKCS#7 padding.
+
+The streaming functions read with readinto() into a reusable input buffer and
+encrypt/decrypt with update_into() into a reusable output buffer, so a file costs
+two chunk-sized buffers per thread regardless of its size, and no per-chunk bytes
+objects are created. Cipher objects are cached per key/IV.
+"""
+
+import io
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+BLOCK_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+
+
+def pad_key(value: str, length: int, fill: bytes = b" ") -> bytes:
+    """Key/IV derivation used everywhere: UTF-8, space-padded or cut to `length` bytes.
+    fill=b"\0" reproduces the NUL padding migrate.py has always used."""
+    return value.encode("utf-8").ljust(length, fill)[:length]
+
+
+# Key and IV of the files written by migrate.py. The key string is 30 bytes and was
+# NUL-padded, so pad_key() with the same string (as given to reencrypt.py) differs.
+LEGACY_MIGRATION_KEY = pad_key("CEPEMSecureKey1234567890123456", 32, fill=b"\0")
+LEGACY_MIGRATION_IV = pad_key("CEPEMInitVector1", 16, fill=b"\0")
+
+
+@lru_cache(maxsize=16)
+def _cipher(key: bytes, iv: bytes) -> Cipher:
+    return Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+
+
+class ChunkBuffers:
+    """Input/output buffers for one stream. update_into needs BLOCK_SIZE - 1 spare bytes
+    in its output; the input buffer gets spare room too because reencrypt_stream
+    encrypts back into it."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.inp = bytearray(chunk_size + 2 * BLOCK_SIZE)
+        self.out = bytearray(chunk_size + 2 * BLOCK_SIZE)
+        self.inp_view = memoryview(self.inp)
+        self.out_view = memoryview(self.out)
+        self.read_view = self.inp_view[:chunk_size]
+
+
+_local = threading.local()
+
+
+def _buffers(chunk_size: int, buffers: Optional[ChunkBuffers]) -> ChunkBuffers:
+    if buffers is not None:
+        return buffers
+    cached = getattr(_local, "buffers", None)
+    if cached is None or cached.chunk_size != chunk_size:
+        cached = _local.buffers = ChunkBuffers(chunk_size)
+    return cached
+
+
+def pkcs7_pad_len(last_block: bytes) -> int:
+    """Validates PKCS#7 padding of the final plaintext block and returns its length."""
+    if len(last_block) != BLOCK_SIZE:
+        raise ValueError("Ciphertext is empty or not a multiple of the AES block size")
+    pad_len = last_block[-1]
+    if pad_len < 1 or pad_len > BLOCK_SIZE:
+        raise ValueError(f"Invalid PKCS#7 padding length: {pad_len}")
+    if last_block[-pad_len:] != bytes([pad_len]) * pad_len:
+        raise ValueError("Invalid PKCS#7 padding bytes")
+    return pad_len
+
+
+def has_valid_padding(last_block: bytes) -> bool:
+    try:
+        pkcs7_pad_len(last_block)
+        return True
+    except ValueError:
+        return False
+
+
+def decrypt_bytes(data: bytes, key: bytes, iv: bytes) -> bytes:
+    decryptor = _cipher(key, iv).decryptor()
+    padded = decryptor.update(data) + decryptor.finalize()
+    pad_len = pkcs7_pad_len(padded[-BLOCK_SIZE:])
+    return padded[:-pad_len]
+
+
+def encrypt_bytes(data: bytes, key: bytes, iv: bytes) -> bytes:
+    pad_len = BLOCK_SIZE - (len(data) % BLOCK_SIZE)
+    encryptor = _cipher(key, iv).encryptor()
+    return encryptor.update(data) + encryptor.update(bytes([pad_len]) * pad_len) + encryptor.finalize()
+
+
+def decrypt_block(block: bytes, key: bytes, prev: bytes) -> bytes:
+    """Decrypts a single CBC block given the preceding ciphertext block (or the IV)."""
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(prev), backend=default_backend()).decryptor()
+    return decryptor.update(block) + decryptor.finalize()
+
+
+def read_probe_blocks(path: Path) -> tuple[int, bytes, bytes]:
+    """Returns (ciphertext size, first block, last two blocks) with two small reads."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or size % BLOCK_SIZE:
+            raise ValueError("Ciphertext is empty or not a multiple of the AES block size")
+        first = f.read(BLOCK_SIZE)
+        f.seek(max(size - 2 * BLOCK_SIZE, 0))
+        tail = f.read(2 * BLOCK_SIZE)
+    return size, first, tail
+
+
+def last_plaintext_block(tail: bytes, key: bytes, iv: bytes) -> bytes:
+    """CBC: P[n] = D(C[n]) XOR C[n-1], with C[-1] = IV for single-block files."""
+    prev = tail[:-BLOCK_SIZE] if len(tail) == 2 * BLOCK_SIZE else iv
+    return decrypt_block(tail[-BLOCK_SIZE:], key, prev)
+
+
+def plaintext_size(path: Path, key: bytes, iv: bytes) -> int:
+    """Plaintext length from the last two ciphertext blocks only (validates the padding too)."""
+    size, _first, tail = read_probe_blocks(path)
+    return size - pkcs7_pad_len(last_plaintext_block(tail, key, iv))
+
+
+def _read_chunk(src: BinaryIO, buffers: ChunkBuffers) -> int:
+    n = src.readinto(buffers.read_view)
+    return n or 0
+
+
+def decrypt_stream(src: BinaryIO, dst: BinaryIO, key: bytes, iv: bytes, chunk_size: int = CHUNK_SIZE,
+                   buffers: Optional[ChunkBuffers] = None) -> int:
+    """Decrypts src into dst chunk by chunk. The last block is held back until EOF
+    so the PKCS#7 padding can be checked and stripped. Returns plaintext size."""
+    buf = _buffers(chunk_size, buffers)
+    decryptor = _cipher(key, iv).decryptor()
+    pending = b""
+    written = 0
+    while n := _read_chunk(src, buf):
+        m = decryptor.update_into(buf.inp_view[:n], buf.out)
+        if m >= BLOCK_SIZE:
+            if pending:
+                dst.write(pending)
+                written += len(pending)
+            dst.write(buf.out_view[:m - BLOCK_SIZE])
+            written += m - BLOCK_SIZE
+            pending = bytes(buf.out_view[m - BLOCK_SIZE:m])
+        elif m:
+            combined = pending + bytes(buf.out_view[:m])
+            overflow = len(combined) - BLOCK_SIZE
+            if overflow > 0:
+                dst.write(combined[:overflow])
+                written += overflow
+                combined = combined[overflow:]
+            pending = combined
+    pending += decryptor.finalize()
+    pad_len = pkcs7_pad_len(pending)
+    dst.write(pending[:-pad_len])
+    return written + BLOCK_SIZE - pad_len
+
+
+def encrypt_stream(src: BinaryIO, dst: BinaryIO, key: bytes, iv: bytes, chunk_size: int = CHUNK_SIZE,
+                   buffers: Optional[ChunkBuffers] = None) -> int:
+    """Encrypts src into dst chunk by chunk, PKCS#7 padding only the final block. Returns plaintext size."""
+    buf = _buffers(chunk_size, buffers)
+    encryptor = _cipher(key, iv).encryptor()
+    total = 0
+    while n := _read_chunk(src, buf):
+        total += n
+        m = encryptor.update_into(buf.inp_view[:n], buf.out)
+        dst.write(buf.out_view[:m])
+    pad_len = BLOCK_SIZE - (total % BLOCK_SIZE)
+    dst.write(encryptor.update(bytes([pad_len]) * pad_len) + encryptor.finalize())
+    return total
+
+
+def reencrypt_stream(src: BinaryIO, dst: BinaryIO, old_key: bytes, old_iv: bytes, new_key: bytes, new_iv: bytes,
+                     chunk_size: int = CHUNK_SIZE, buffers: Optional[ChunkBuffers] = None) -> int:
+    """Pipes src through the old-key decryptor straight into the new-key encryptor.
+
+    The padded plaintext is identical under both keys (same length), so the padding
+    block is re-encrypted as-is; it is only validated at the end to reject a wrong key.
+    Decrypting into the output buffer and encrypting back into the input buffer
+    keeps it to the same two buffers as the one-way streams."""
+    buf = _buffers(chunk_size, buffers)
+    decryptor = _cipher(old_key, old_iv).decryptor()
+    encryptor = _cipher(new_key, new_iv).encryptor()
+    tail = b""
+    total = 0
+    while n := _read_chunk(src, buf):
+        m = decryptor.update_into(buf.inp_view[:n], buf.out)
+        if not m:
+            continue
+        plain = buf.out_view[:m]
+        tail = bytes(plain[-BLOCK_SIZE:]) if m >= BLOCK_SIZE else (tail + bytes(plain))[-BLOCK_SIZE:]
+        total += m
+        k = encryptor.update_into(plain, buf.inp)
+        dst.write(buf.inp_view[:k])
+    plain = decryptor.finalize()
+    if plain:
+        tail = (tail + plain)[-BLOCK_SIZE:]
+        total += len(plain)
+        dst.write(encryptor.update(plain))
+    if total == 0:
+        raise ValueError("Ciphertext is empty or not a multiple of the AES block size")
+    pad_len = pkcs7_pad_len(tail)
+    dst.write(encryptor.finalize())
+    return total - pad_len
+
+
+class DecryptingReader(io.RawIOBase):
+    """Read-only stream of plaintext, decrypted chunk by chunk from an .enc file.
+
+    The plaintext size must be known up front (see plaintext_size); the padding
+    is simply cut off at that length."""
+
+    def __init__(self, src: BinaryIO, key: bytes, iv: bytes, size: int, chunk_size: int = CHUNK_SIZE):
+        self._src = src
+        self._decryptor = _cipher(key, iv).decryptor()
+        self._remaining = size
+        self._chunk_size = chunk_size
+        self._buffer = b""
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        if self._remaining <= 0:
+            return 0
+        while self._offset >= len(self._buffer):
+            chunk = self._src.read(self._chunk_size)
+            self._buffer = self._decryptor.update(chunk) if chunk else self._decryptor.finalize()
+            self._offset = 0
+            if not chunk and not self._buffer:
+                raise ValueError("Unexpected end of ciphertext")
+        n = min(len(target), len(self._buffer) - self._offset, self._remaining)
+        target[:n] = memoryview(self._buffer)[self._offset:self._offset + n]
+        self._offset += n
+        self._remaining -= n
+        return n
@@ -9,19 +9,28 @@ Defaults:
 - Reads document encryption key/iv from DOCUMENT_ENCRYPTION_KEY/IV or .env
 - Reads encrypted source files from DOCUMENT_STORAGE_PATH or ./data/patient-documents
 - Writes decrypted files to ~/infrm_download
+- With --sync, only documents new or changed since the previous export are written
+- With --archive, documents are streamed into one tar/zip (or stdout) plus index.csv
 """
 
 import argparse
+import csv
 import importlib
+import io
+import json
 import os
+import queue
 import re
 import sys
+import tarfile
+import threading
+import time
+import zipfile
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from document_crypto import CHUNK_SIZE, DecryptingReader, decrypt_stream, pad_key, plaintext_size
 
 
 @dataclass
@@ -32,6 +41,13 @@ class DocumentRow:
 	original_file_name: str
 	encrypted_path: str
 	is_deleted: int
+	file_size: int = 0
+	uploaded_at: str = ""
+
+	@property
+	def output_name(self) -> str:
+		safe_original = sanitize_file_name(self.original_file_name)
+		return f"{self.doc_id}_{self.examination_id}_{safe_original}"
 
 
 def parse_args() -> argparse.Namespace:
@@ -58,6 +74,38 @@ def parse_args() -> argparse.Namespace:
 		action="store_true",
 		help="Process all documents in ExaminationDocuments (not only INFRM matches).",
 	)
+	parser.add_argument(
+		"--workers",
+		type=int,
+		default=1,
+		help="Parallel decrypt/write workers (default 1 = serial, 0 = one per CPU core).",
+	)
+	parser.add_argument(
+		"--sync",
+		action="store_true",
+		help="Skip documents already exported unchanged (matched by FileSize/UploadedAt and a local manifest).",
+	)
+	parser.add_argument(
+		"--create-infrm-index",
+		action="store_true",
+		help="Add the indexed generated column ExaminationDocuments.IsInfrm (one-time, rebuilds the table) before fetching.",
+	)
+	parser.add_argument(
+		"--no-infrm-index",
+		action="store_true",
+		help="Ignore the IsInfrm column and filter with the LIKE '%%infrm%%' pattern.",
+	)
+	parser.add_argument(
+		"--archive",
+		default=None,
+		help="Write all documents into one archive (.tar, .tar.gz/.tgz, .zip) instead of --output-dir; '-' streams a tar to stdout.",
+	)
+	parser.add_argument(
+		"--archive-format",
+		choices=["tar", "tgz", "zip"],
+		default=None,
+		help="Archive format (default: from --archive suffix, tar for stdout).",
+	)
 	return parser.parse_args()
 
 
@@ -89,26 +137,114 @@ def parse_connection_string(value: str) -> Dict[str, str]:
 	return parts
 
 
-def pad_key(value: str, length: int) -> bytes:
-	return value.encode("utf-8").ljust(length)[:length]
-
-
-def decrypt_aes_cbc_pkcs7(data: bytes, key: bytes, iv: bytes) -> bytes:
-	cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-	decryptor = cipher.decryptor()
-	padded = decryptor.update(data) + decryptor.finalize()
-
-	if not padded:
-		raise ValueError("Decrypted output is empty")
-
-	pad_len = padded[-1]
-	if pad_len < 1 or pad_len > 16:
-		raise ValueError(f"Invalid PKCS7 padding length: {pad_len}")
-
-	if padded[-pad_len:] != bytes([pad_len] * pad_len):
-		raise ValueError("Invalid PKCS7 padding bytes")
-
-	return padded[:-pad_len]
+def decrypt_file(encrypted_file: Path, output_file: Path, key: bytes, iv: bytes) -> int:
+	"""Stream-decrypt one file; output is written to a .part file and renamed on success."""
+	part_file = output_file.with_name(output_file.name + ".part")
+	try:
+		with encrypted_file.open("rb") as src, part_file.open("wb") as dst:
+			size = decrypt_stream(src, dst, key, iv)
+		part_file.replace(output_file)
+		return size
+	except BaseException:
+		part_file.unlink(missing_ok=True)
+		raise
+
+
+class ArchiveWriter:
+	"""Streams decrypted documents into one tar/tar.gz/zip archive (or tar to stdout).
+
+	Plaintext never touches the disk outside the archive. An index.csv member
+	(doc_id -> member name) is appended on close."""
+
+	INDEX_MEMBER = "index.csv"
+
+	def __init__(self, target: str, archive_format: Optional[str] = None) -> None:
+		self.target = target
+		self.format = archive_format or self.detect_format(target)
+		self.index: List[Tuple[int, int, str, str, int]] = []
+		self._lock = threading.Lock()
+		self._zip: Optional[zipfile.ZipFile] = None
+		self._tar: Optional[tarfile.TarFile] = None
+		self._saved_stdout = None
+		self._closed = False
+
+		if target == "-":
+			# Stream mode: stdout carries the archive, so the report goes to stderr until close()
+			stream = sys.stdout.buffer
+			self._saved_stdout = sys.stdout
+			sys.stdout = sys.stderr
+		else:
+			stream = None
+
+		if self.format == "zip":
+			self._zip = zipfile.ZipFile(stream or target, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+		else:
+			mode = "w|gz" if self.format == "tgz" else "w|"
+			if stream is not None:
+				self._tar = tarfile.open(fileobj=stream, mode=mode)
+			else:
+				self._tar = tarfile.open(target, mode=mode)
+
+	@staticmethod
+	def detect_format(target: str) -> str:
+		lowered = target.lower()
+		if lowered.endswith(".zip"):
+			return "zip"
+		if lowered.endswith((".tar.gz", ".tgz")):
+			return "tgz"
+		return "tar"
+
+	def add(self, row: DocumentRow, encrypted_file: Path, key: bytes, iv: bytes) -> int:
+		member = row.output_name
+		# Checked before writing anything, so a bad file never leaves a broken member behind
+		size = plaintext_size(encrypted_file, key, iv)
+		mtime = encrypted_file.stat().st_mtime
+
+		with self._lock, encrypted_file.open("rb") as src:
+			if self._zip is not None:
+				info = zipfile.ZipInfo(member, date_time=time.localtime(mtime)[:6])
+				info.file_size = size
+				with self._zip.open(info, "w", force_zip64=size > 0x7FFFFFFF) as dst:
+					decrypt_stream(src, dst, key, iv)
+			else:
+				assert self._tar is not None
+				info = tarfile.TarInfo(member)
+				info.size = size
+				info.mtime = int(mtime)
+				info.mode = 0o600
+				self._tar.addfile(info, io.BufferedReader(DecryptingReader(src, key, iv, size), CHUNK_SIZE))
+			self.index.append((row.doc_id, row.examination_id, member, row.original_file_name, size))
+		return size
+
+	def close(self) -> None:
+		"""Append index.csv and finish the archive; safe to call more than once."""
+		if self._closed:
+			return
+		self._closed = True
+		try:
+			self._write_index()
+		finally:
+			if self._saved_stdout is not None:
+				sys.stdout.flush()
+				sys.stdout = self._saved_stdout
+
+	def _write_index(self) -> None:
+		buffer = io.StringIO()
+		writer = csv.writer(buffer)
+		writer.writerow(["doc_id", "examination_id", "member", "original_file_name", "size"])
+		writer.writerows(sorted(self.index))
+		data = buffer.getvalue().encode("utf-8")
+
+		if self._zip is not None:
+			self._zip.writestr(self.INDEX_MEMBER, data)
+			self._zip.close()
+		elif self._tar is not None:
+			info = tarfile.TarInfo(self.INDEX_MEMBER)
+			info.size = len(data)
+			info.mtime = int(time.time())
+			info.mode = 0o600
+			self._tar.addfile(info, io.BytesIO(data))
+			self._tar.close()
 
 
 def sanitize_file_name(name: str) -> str:
@@ -136,30 +272,23 @@ def pick_db_driver() -> str:
 	)
 
 
-def fetch_documents(
-	conn_info: Dict[str, str],
-	include_deleted: bool,
-	all_documents: bool,
-) -> List[DocumentRow]:
-	driver = pick_db_driver()
+INFRM_LIKE_SQL = (
+	"(LOWER(OriginalFileName) LIKE '%infrm%' OR LOWER(FileName) LIKE '%infrm%' OR LOWER(EncryptedPath) LIKE '%infrm%')"
+)
+INFRM_COLUMN = "IsInfrm"
+INFRM_INDEX = "IX_ExaminationDocuments_IsInfrm_IsDeleted"
+# Rows pulled from the server per fetchmany() while the export runs
+FETCH_BATCH_ROWS = 500
+# The result set stays open for the whole export; the server must wait for a slow
+# reader (workers busy on a large file) instead of dropping it after the default 60 s
+STREAM_NET_WRITE_TIMEOUT = 3600
 
-	where_parts: List[str] = []
-	if not include_deleted:
-		where_parts.append("IsDeleted = 0")
-	if not all_documents:
-		where_parts.append(
-			"(LOWER(OriginalFileName) LIKE '%infrm%' OR LOWER(FileName) LIKE '%infrm%' OR LOWER(EncryptedPath) LIKE '%infrm%')"
-		)
 
-	where_sql = ""
-	if where_parts:
-		where_sql = " WHERE " + " AND ".join(where_parts)
+def connect_database(conn_info: Dict[str, str]):
+	"""Open a DB-API connection with whichever MySQL driver is installed.
 
-	sql = (
-		"SELECT Id, ExaminationId, FileName, OriginalFileName, EncryptedPath, IsDeleted "
-		"FROM ExaminationDocuments"
-		f"{where_sql} ORDER BY Id"
-	)
+	host.docker.internal falls back to local host names when run outside Docker."""
+	driver = pick_db_driver()
 
 	host = conn_info.get("server") or conn_info.get("host") or "127.0.0.1"
 	port = int(conn_info.get("port") or "3306")
@@ -167,70 +296,280 @@ def fetch_documents(
 	user = conn_info.get("user") or conn_info.get("uid") or "root"
 	password = conn_info.get("password") or conn_info.get("pwd") or ""
 
-	rows: List[Tuple] = []
 	hosts_to_try: List[str] = [host]
 	if host == "host.docker.internal":
 		hosts_to_try.extend(["127.0.0.1", "localhost", "mysql"])
 
 	last_error: Optional[Exception] = None
-	query_executed = False
 
 	for active_host in hosts_to_try:
 		try:
 			if driver == "mysql.connector":
 				mysql_connector = importlib.import_module("mysql.connector")
 
-				conn = mysql_connector.connect(
+				return mysql_connector.connect(
 					host=active_host,
 					port=port,
 					database=database,
 					user=user,
 					password=password,
 				)
-				try:
-					cursor = conn.cursor()
-					cursor.execute(sql)
-					rows = list(cursor.fetchall())
-				finally:
-					conn.close()
-			else:
-				pymysql = importlib.import_module("pymysql")
 
-				conn = pymysql.connect(
-					host=active_host,
-					port=port,
-					database=database,
-					user=user,
-					password=password,
-					cursorclass=pymysql.cursors.Cursor,
-				)
-				try:
-					with conn.cursor() as cursor:
-						cursor.execute(sql)
-						rows = list(cursor.fetchall())
-				finally:
-					conn.close()
-
-			query_executed = True
-			break
+			pymysql = importlib.import_module("pymysql")
+
+			return pymysql.connect(
+				host=active_host,
+				port=port,
+				database=database,
+				user=user,
+				password=password,
+				cursorclass=pymysql.cursors.Cursor,
+			)
 		except Exception as exc:
 			last_error = exc
 			continue
 
-	if not query_executed and last_error is not None:
-		raise last_error
-
-	return [
-		DocumentRow(
-			doc_id=int(r[0]),
-			examination_id=int(r[1]),
-			file_name=str(r[2]),
-			original_file_name=str(r[3]),
-			encrypted_path=str(r[4]),
-			is_deleted=int(r[5]) if r[5] is not None else 0,
-		)
-		for r in rows
-	]
+	assert last_error is not None
+	raise last_error
+
+
+def has_infrm_column(cursor) -> bool:
+	cursor.execute(
+		"SELECT COUNT(*) FROM information_schema.COLUMNS "
+		"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ExaminationDocuments' AND COLUMN_NAME = %s",
+		(INFRM_COLUMN,),
+	)
+	# fetchall leaves no unread result behind on unbuffered cursors
+	return int(cursor.fetchall()[0][0]) > 0
+
+
+def ensure_infrm_column(conn_info: Dict[str, str]) -> bool:
+	"""Add the stored generated IsInfrm column plus an index, once.
+
+	The column is computed by MySQL from the same LIKE pattern, so rows inserted
+	later by the DatabaseAPI are classified without any backfill. Adding a STORED
+	column rebuilds the table, so run it outside busy hours. Returns True if created."""
+	conn = connect_database(conn_info)
+	try:
+		cursor = conn.cursor()
+		try:
+			if has_infrm_column(cursor):
+				return False
+			cursor.execute(
+				f"ALTER TABLE ExaminationDocuments "
+				f"ADD COLUMN {INFRM_COLUMN} TINYINT(1) AS (IF({INFRM_LIKE_SQL}, 1, 0)) STORED, "
+				f"ADD INDEX {INFRM_INDEX} ({INFRM_COLUMN}, IsDeleted)"
+			)
+			return True
+		finally:
+			cursor.close()
+	finally:
+		conn.close()
+
+
+def streaming_cursor(conn):
+	"""Unbuffered cursor: rows stay on the server until fetched (pymysql buffers by default)"""
+	if type(conn).__module__.startswith("pymysql"):
+		return conn.cursor(importlib.import_module("pymysql").cursors.SSCursor)
+	return conn.cursor(buffered=False)
+
+
+def fetch_documents(
+	conn_info: Dict[str, str],
+	include_deleted: bool,
+	all_documents: bool,
+	use_index: bool = True,
+) -> Iterator[DocumentRow]:
+	"""Run the document query and return an iterator over its rows.
+
+	The connection and query errors surface here; rows are then read in
+	FETCH_BATCH_ROWS batches as the iterator is consumed, so memory stays bounded
+	by the worker queue rather than the table size. The connection closes when
+	the iterator is exhausted or closed."""
+	conn = connect_database(conn_info)
+	try:
+		where_parts: List[str] = []
+		if not include_deleted:
+			where_parts.append("IsDeleted = 0")
+		if not all_documents:
+			# Equality on the indexed generated column when it exists, full-scan LIKE otherwise
+			cursor = conn.cursor()
+			try:
+				indexed = use_index and has_infrm_column(cursor)
+			finally:
+				cursor.close()
+			where_parts.append(f"{INFRM_COLUMN} = 1" if indexed else INFRM_LIKE_SQL)
+
+		where_sql = ""
+		if where_parts:
+			where_sql = " WHERE " + " AND ".join(where_parts)
+
+		cursor = streaming_cursor(conn)
+		try:
+			cursor.execute(f"SET SESSION net_write_timeout = {STREAM_NET_WRITE_TIMEOUT}")
+			cursor.execute(
+				"SELECT Id, ExaminationId, FileName, OriginalFileName, EncryptedPath, IsDeleted, FileSize, UploadedAt "
+				"FROM ExaminationDocuments"
+				f"{where_sql} ORDER BY Id"
+			)
+		except BaseException:
+			cursor.close()
+			raise
+	except BaseException:
+		conn.close()
+		raise
+
+	return _iter_document_rows(conn, cursor)
+
+
+def _iter_document_rows(conn, cursor) -> Iterator[DocumentRow]:
+	try:
+		while True:
+			rows = cursor.fetchmany(FETCH_BATCH_ROWS)
+			if not rows:
+				return
+			for r in rows:
+				yield DocumentRow(
+					doc_id=int(r[0]),
+					examination_id=int(r[1]),
+					file_name=str(r[2]),
+					original_file_name=str(r[3]),
+					encrypted_path=str(r[4]),
+					is_deleted=int(r[5]) if r[5] is not None else 0,
+					file_size=int(r[6]) if r[6] is not None else 0,
+					uploaded_at=str(r[7]) if r[7] is not None else "",
+				)
+	finally:
+		try:
+			cursor.close()
+		finally:
+			conn.close()
+
+
+def process_document(
+	row: DocumentRow,
+	source_dir: Path,
+	output_dir: Path,
+	key: bytes,
+	iv: bytes,
+	archive: Optional[ArchiveWriter] = None,
+) -> Tuple[str, str, int]:
+	"""Decrypt one document into output_dir or the archive.
+	Returns (status, report line, plaintext bytes written)."""
+	encrypted_file = source_dir / row.encrypted_path
+
+	if not encrypted_file.exists():
+		return "MISS", f"MISS  doc_id={row.doc_id} file={row.encrypted_path}", 0
+
+	try:
+		if archive is not None:
+			size = archive.add(row, encrypted_file, key, iv)
+		else:
+			size = decrypt_file(encrypted_file, output_dir / row.output_name, key, iv)
+		return "OK", f"OK    doc_id={row.doc_id} -> {row.output_name}", size
+	except Exception as exc:
+		return "FAIL", f"FAIL  doc_id={row.doc_id} file={row.encrypted_path}: {exc}", 0
+
+
+def run_parallel(
+	documents: Iterable[DocumentRow],
+	source_dir: Path,
+	output_dir: Path,
+	key: bytes,
+	iv: bytes,
+	workers: int,
+	report: Callable[[DocumentRow, Tuple[str, str, int]], None],
+	archive: Optional[ArchiveWriter] = None,
+) -> None:
+	"""Feed rows through a bounded queue to decrypt/write worker threads.
+
+	OpenSSL releases the GIL during AES and the workers spend the rest of
+	their time in file I/O, so threads scale without a process pool.
+	Results are handed back to the calling thread, which does all reporting."""
+	work: "queue.Queue[Optional[DocumentRow]]" = queue.Queue(maxsize=workers * 4)
+	results: "queue.Queue[Optional[Tuple[DocumentRow, Tuple[str, str, int]]]]" = queue.Queue()
+
+	def worker() -> None:
+		while True:
+			row = work.get()
+			if row is None:
+				results.put(None)
+				return
+			results.put((row, process_document(row, source_dir, output_dir, key, iv, archive)))
+
+	producer_error: List[BaseException] = []
+
+	def producer() -> None:
+		# documents may be a live database cursor; a read error must still stop the workers
+		try:
+			for row in documents:
+				work.put(row)
+		except BaseException as exc:
+			producer_error.append(exc)
+		finally:
+			for _ in range(workers):
+				work.put(None)
+
+	threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+	threads.append(threading.Thread(target=producer, daemon=True))
+	for thread in threads:
+		thread.start()
+
+	finished = 0
+	while finished < workers:
+		result = results.get()
+		if result is None:
+			finished += 1
+			continue
+		report(*result)
+
+	for thread in threads:
+		thread.join()
+	if producer_error:
+		raise producer_error[0]
+
+
+class SyncManifest:
+	"""Local record of exported documents (doc_id -> UploadedAt, FileSize, output name).
+
+	A document is skipped when its manifest entry matches the database row and the
+	output file still exists with the expected plaintext size (FileSize)."""
+
+	FILE_NAME = ".infrm_sync_manifest.json"
+
+	def __init__(self, output_dir: Path) -> None:
+		self.path = output_dir / self.FILE_NAME
+		self.entries: Dict[str, Dict[str, object]] = {}
+		if self.path.exists():
+			try:
+				self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+			except ValueError:
+				self.entries = {}
+
+	def is_current(self, row: DocumentRow, output_dir: Path) -> bool:
+		entry = self.entries.get(str(row.doc_id))
+		if not entry:
+			return False
+		if entry.get("uploaded_at") != row.uploaded_at or entry.get("file_size") != row.file_size:
+			return False
+		if entry.get("output") != row.output_name:
+			return False
+		try:
+			return (output_dir / row.output_name).stat().st_size == row.file_size
+		except OSError:
+			return False
+
+	def mark(self, row: DocumentRow) -> None:
+		self.entries[str(row.doc_id)] = {
+			"uploaded_at": row.uploaded_at,
+			"file_size": row.file_size,
+			"output": row.output_name,
+		}
+
+	def save(self) -> None:
+		tmp_path = self.path.with_name(self.path.name + ".tmp")
+		tmp_path.write_text(json.dumps(self.entries), encoding="utf-8")
+		tmp_path.replace(self.path)
 
 
 def resolve_source_dir(args_source_dir: Optional[str], env_values: Dict[str, str], project_root: Path) -> Tuple[Path, bool]:
@@ -287,9 +626,36 @@ def main() -> int:
 		or "DefaultIV12345678"
 	)
 
+	if args.archive and args.sync:
+		print("ERROR: --sync cannot be combined with --archive")
+		return 1
+
+	archive: Optional[ArchiveWriter] = None
+	if args.archive:
+		# Opened first: in stdout mode it also moves all report output to stderr
+		archive = ArchiveWriter(args.archive, args.archive_format)
+
+	try:
+		return export_documents(args, conn_info, env_values, project_root, key_string, iv_string, archive)
+	finally:
+		if archive is not None:
+			# Also on the early returns, so even an empty export is a valid archive with index.csv
+			archive.close()
+
+
+def export_documents(
+	args: argparse.Namespace,
+	conn_info: Dict[str, str],
+	env_values: Dict[str, str],
+	project_root: Path,
+	key_string: str,
+	iv_string: str,
+	archive: Optional[ArchiveWriter],
+) -> int:
 	source_dir, used_fallback = resolve_source_dir(args.source_dir, env_values, project_root)
 	output_dir = Path(args.output_dir).expanduser().resolve()
-	output_dir.mkdir(parents=True, exist_ok=True)
+	if archive is None:
+		output_dir.mkdir(parents=True, exist_ok=True)
 
 	if not source_dir.exists():
 		print(f"ERROR: Encrypted source directory does not exist: {source_dir}")
@@ -302,51 +668,90 @@ def main() -> int:
 		print("INFO: DOCUMENT_STORAGE_PATH points to Docker path, using host path fallback.")
 
 	print(f"Source directory: {source_dir}")
-	print(f"Output directory: {output_dir}")
+	if archive is not None:
+		print(f"Output archive: {'<stdout>' if args.archive == '-' else args.archive} ({archive.format})")
+	else:
+		print(f"Output directory: {output_dir}")
+
+	if args.create_infrm_index:
+		try:
+			if ensure_infrm_column(conn_info):
+				print(f"Created generated column ExaminationDocuments.{INFRM_COLUMN} with index {INFRM_INDEX}.")
+			else:
+				print(f"Column ExaminationDocuments.{INFRM_COLUMN} already exists.")
+		except Exception as exc:
+			print(f"ERROR: Cannot create INFRM index column: {exc}")
+			return 1
 
 	try:
-		documents = fetch_documents(conn_info, args.include_deleted, args.all_documents)
+		documents = fetch_documents(
+			conn_info, args.include_deleted, args.all_documents, use_index=not args.no_infrm_index
+		)
 	except Exception as exc:
 		print(f"ERROR: Cannot read ExaminationDocuments from database: {exc}")
 		return 1
 
-	if not documents:
-		print("No matching documents found.")
-		return 0
-
 	key = pad_key(key_string, 32)
 	iv = pad_key(iv_string, 16)
 
-	success = 0
-	failed = 0
-	missing = 0
+	workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+	started = time.perf_counter()
+	counters = {"OK": 0, "MISS": 0, "FAIL": 0}
+	total_bytes = 0
+
+	manifest: Optional[SyncManifest] = None
+	seen = {"total": 0, "skipped": 0}
+
+	def pending_rows() -> Iterator[DocumentRow]:
+		# Rows stream from the database; nothing is collected up front
+		for row in documents:
+			seen["total"] += 1
+			if manifest is not None and manifest.is_current(row, output_dir):
+				seen["skipped"] += 1
+				continue
+			yield row
+
+	if args.sync:
+		manifest = SyncManifest(output_dir)
+	pending = pending_rows()
+
+	def report(row: DocumentRow, result: Tuple[str, str, int]) -> None:
+		nonlocal total_bytes
+		status, line, size = result
+		print(line)
+		counters[status] += 1
+		total_bytes += size
+		if manifest is not None and status == "OK":
+			manifest.mark(row)
 
-	for row in documents:
-		encrypted_file = source_dir / row.encrypted_path
-
-		if not encrypted_file.exists():
-			print(f"MISS  doc_id={row.doc_id} file={row.encrypted_path}")
-			missing += 1
-			continue
-
-		safe_original = sanitize_file_name(row.original_file_name)
-		output_name = f"{row.doc_id}_{row.examination_id}_{safe_original}"
-		output_file = output_dir / output_name
+	try:
+		if workers > 1:
+			run_parallel(pending, source_dir, output_dir, key, iv, workers, report, archive)
+		else:
+			for row in pending:
+				report(row, process_document(row, source_dir, output_dir, key, iv, archive))
+	except Exception as exc:
+		print(f"ERROR: Reading ExaminationDocuments failed after {seen['total']} documents: {exc}")
+		return 1
+	finally:
+		if manifest is not None:
+			manifest.save()
 
-		try:
-			encrypted = encrypted_file.read_bytes()
-			decrypted = decrypt_aes_cbc_pkcs7(encrypted, key, iv)
-			output_file.write_bytes(decrypted)
-			print(f"OK    doc_id={row.doc_id} -> {output_file.name}")
-			success += 1
-		except Exception as exc:
-			print(f"FAIL  doc_id={row.doc_id} file={row.encrypted_path}: {exc}")
-			failed += 1
+	if seen["total"] == 0:
+		print("No matching documents found.")
+		return 0
 
+	elapsed = max(time.perf_counter() - started, 1e-9)
+	skipped_note = f" skipped={seen['skipped']}" if args.sync else ""
+	print(
+		f"Done. total={seen['total']} success={counters['OK']} missing={counters['MISS']} failed={counters['FAIL']}"
+		f"{skipped_note}"
+	)
 	print(
-		f"Done. total={len(documents)} success={success} missing={missing} failed={failed}"
+		f"Throughput: {counters['OK'] / elapsed:.1f} files/s, "
+		f"{total_bytes / elapsed / (1024 * 1024):.1f} MB/s ({elapsed:.2f} s, workers={workers})"
 	)
-	return 0 if failed == 0 else 2
+	return 0 if counters["FAIL"] == 0 else 2
 
 
 if __name__ == "__main__":
@@ -1,14 +1,116 @@
+import hashlib
 import json
 import os
 import re
+import time
 import uuid
+from collections import Counter
+from contextlib import contextmanager
 import mysql.connector
 from mysql.connector import Error
 
+from document_crypto import CHUNK_SIZE, LEGACY_MIGRATION_IV, LEGACY_MIGRATION_KEY, encrypt_bytes, encrypt_stream
+
+# Klíč, kterým jsou šifrovaná už zmigrovaná data. Doplněný nulami (ne mezerami jako
+# výchozí document_crypto.pad_key), takže zůstává bajt po bajtu stejný.
+ENCRYPTION_KEY = LEGACY_MIGRATION_KEY
+ENCRYPTION_IV = LEGACY_MIGRATION_IV
+
+
+class SQLTracer:
+    """
+    Volitelné měření SQL příkazů v MySQLDatabase.execute.
+    Příkazy se seskupují podle normalizovaného textu (literály → ?,
+    client_<ident> → client_?), pro každý se drží počet volání, celková
+    a maximální latence a počet dotčených/vrácených řádků.
+    """
+
+    _WHITESPACE = re.compile(r"\s+")
+    _STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+    _NUMBER = re.compile(r"\b\d+\b")
+    _PARAM = re.compile(r"%s")
+    _IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _CLIENT_TABLE = re.compile(r"`?client_[A-Za-z0-9]+`?")
+
+    def __init__(self, top_n=15, explain=False):
+        self.top_n = top_n
+        self.explain = explain
+        self.stats = {}
+
+    @classmethod
+    def normalize(cls, query):
+        text = cls._WHITESPACE.sub(" ", query).strip()
+        text = cls._CLIENT_TABLE.sub("client_?", text)
+        text = cls._STRING.sub("?", text)
+        text = cls._PARAM.sub("?", text)
+        text = cls._NUMBER.sub("?", text)
+        return cls._IN_LIST.sub("(?, ...)", text)
+
+    def record(self, db_config, query, params, elapsed, rows):
+        key = self.normalize(query)
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = self.stats[key] = {
+                "calls": 0, "total": 0.0, "max": 0.0, "rows": 0,
+                "database": db_config.get("database"), "sample": None, "sample_params": None,
+            }
+        entry["calls"] += 1
+        entry["total"] += elapsed
+        entry["rows"] += max(rows, 0)
+        if elapsed >= entry["max"]:
+            entry["max"] = elapsed
+            entry["sample"] = query
+            entry["sample_params"] = params
+
+    def report(self, title, explain_config=None):
+        """Vypíše top-N příkazů podle celkového času a vynuluje statistiky."""
+        if not self.stats:
+            return
+        ranked = sorted(self.stats.items(), key=lambda item: item[1]["total"], reverse=True)
+        total = sum(entry["total"] for _, entry in ranked)
+        calls = sum(entry["calls"] for _, entry in ranked)
+
+        print(f"\n  📊 SQL profil – {title}: {calls} příkazů, {total:.2f} s celkem")
+        print(f"     {'volání':>8} {'celkem s':>9} {'prům. ms':>9} {'max ms':>8} {'řádků':>9}  příkaz")
+        for key, entry in ranked[:self.top_n]:
+            avg_ms = entry["total"] / entry["calls"] * 1000
+            statement = key if len(key) <= 120 else key[:117] + "..."
+            print(f"     {entry['calls']:>8} {entry['total']:>9.2f} {avg_ms:>9.2f} "
+                  f"{entry['max'] * 1000:>8.1f} {entry['rows']:>9}  [{entry['database']}] {statement}")
+
+        if self.explain and explain_config is not None:
+            self._print_explain(ranked[:self.top_n], explain_config)
+
+        self.stats = {}
+
+    def _print_explain(self, ranked, explain_config):
+        for key, entry in ranked:
+            if not re.match(r"^\s*(SELECT|INSERT|UPDATE|DELETE)\b", entry["sample"], re.IGNORECASE):
+                continue
+            config = {k: v for k, v in explain_config.items() if k != "autocommit"}
+            config["database"] = entry["database"]
+            db = MySQLDatabase(**config)
+            try:
+                db.connect()
+                plan = db.execute("EXPLAIN " + entry["sample"], entry["sample_params"], fetch=True)
+            except RuntimeError as e:
+                print(f"\n     EXPLAIN selhal pro: {key[:80]} ({e})")
+                continue
+            finally:
+                db.close()
+            print(f"\n     EXPLAIN {key[:100]}")
+            for row in plan:
+                print(f"       table={row.get('table')} type={row.get('type')} key={row.get('key')} "
+                      f"rows={row.get('rows')} extra={row.get('Extra')}")
+
+
+class TransactionAborted(RuntimeError):
+    """Savepoint nešel vrátit (deadlock, ztracené spojení): celá transakce je pryč"""
+
 
 class MySQLDatabase:
     def __init__(self, host="127.0.0.1", port=3306,
-                 user="root", password="", database=None):
+                 user="root", password="", database=None, tracer=None):
         self.config = {
             "host": host,
             "port": port,
@@ -18,6 +120,8 @@ class MySQLDatabase:
             "autocommit": False
         }
         self.conn = None
+        self.tracer = tracer
+        self._savepoints = 0
 
     def connect(self):
         try:
@@ -42,23 +146,60 @@ class MySQLDatabase:
             raise RuntimeError("Not connected to database")
 
         cursor = self.conn.cursor(dictionary=True)
+        started = time.perf_counter() if self.tracer else None
 
         try:
             cursor.execute(query, params or ())
             
             if fetch:
                 result = cursor.fetchall()
+                if self.tracer:
+                    self.tracer.record(self.config, query, params, time.perf_counter() - started, len(result))
                 return result
             else:
+                if self.tracer:
+                    self.tracer.record(self.config, query, params, time.perf_counter() - started, cursor.rowcount)
                 return cursor.rowcount
 
         except Error as e:
-            self.conn.rollback()
+            # Uvnitř savepointu vrací chybu savepoint(), ne celou transakci
+            if not self._savepoints:
+                self.conn.rollback()
             raise RuntimeError(f"Query failed: {e}")
 
         finally:
             cursor.close()
 
+    def _run(self, statement):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def savepoint(self, name):
+        """
+        Část transakce, která se při chybě vrátí sama (ROLLBACK TO SAVEPOINT), zbytek
+        transakce zůstane. Když nejde vrátit ani savepoint, vrátí se celá transakce
+        a vyletí TransactionAborted.
+        """
+        self._run(f"SAVEPOINT {name}")
+        self._savepoints += 1
+        try:
+            yield
+        except BaseException:
+            self._savepoints -= 1
+            try:
+                self._run(f"ROLLBACK TO SAVEPOINT {name}")
+            except Error as e:
+                self.conn.rollback()
+                raise TransactionAborted(f"Rollback to savepoint {name} failed: {e}")
+            raise
+        else:
+            self._savepoints -= 1
+            self._run(f"RELEASE SAVEPOINT {name}")
+
     def commit(self):
         if self.conn:
             self.conn.commit()
@@ -67,6 +208,605 @@ class MySQLDatabase:
         if self.conn:
             self.conn.rollback()
 
+
+# ============================================================================
+# Index souborů ze staré aplikace (files/client_*/vysetreni_*)
+# ============================================================================
+
+class LegacyFilesIndex:
+    """
+    Jednorázový paralelní průchod stromem files/ přes os.scandir.
+    Výsledek: client ident → název složky vyšetření → [(soubor, velikost)].
+    Index se ukládá do cache souboru a při dalším běhu se znovu načítají
+    jen klienti, jejichž složka (nebo některá složka vyšetření) změnila mtime.
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, base_dir, cache_path=None, workers=16):
+        self.base_dir = base_dir
+        self.cache_path = cache_path
+        self.workers = workers
+        # client_ident → {"mtime": ..., "exams": {dir_name: {"mtime": ..., "files": [[name, size], ...]}}}
+        self.clients = {}
+
+    @staticmethod
+    def exam_dir_name(ex_ident):
+        return f"vysetreni_{ex_ident:08d}"
+
+    def files_for(self, kartoteka_ident, ex_ident):
+        """Seznam (název, velikost) souborů vyšetření — bez přístupu na disk."""
+        client = self.clients.get(str(kartoteka_ident))
+        if not client:
+            return []
+        exam = client["exams"].get(self.exam_dir_name(ex_ident))
+        if not exam:
+            return []
+        return [(name, size) for name, size in exam["files"]]
+
+    def exam_dir(self, kartoteka_ident, ex_ident):
+        return os.path.join(self.base_dir, f"client_{kartoteka_ident}", self.exam_dir_name(ex_ident))
+
+    def build(self):
+        """Načte index z cache (je-li platná) a doskenuje změněné klienty."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not os.path.isdir(self.base_dir):
+            print(f"  ⚠️  Složka se soubory neexistuje: {self.base_dir}")
+            self.clients = {}
+            return self
+
+        cached = self._load_cache()
+
+        client_dirs = {}
+        with os.scandir(self.base_dir) as it:
+            for entry in it:
+                if entry.name.startswith("client_") and entry.is_dir(follow_symlinks=False):
+                    client_dirs[entry.name[len("client_"):]] = entry.path
+
+        def scan_or_reuse(item):
+            ident, path = item
+            previous = cached.get(ident)
+            if previous is not None and self._is_fresh(path, previous):
+                return ident, previous, False
+            return ident, self._scan_client(path), True
+
+        rescanned = 0
+        clients = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for ident, data, was_scanned in pool.map(scan_or_reuse, client_dirs.items()):
+                clients[ident] = data
+                rescanned += was_scanned
+
+        self.clients = clients
+        total_exams = sum(len(c["exams"]) for c in clients.values())
+        print(f"  📂 Index souborů: {len(clients)} klientů, {total_exams} složek vyšetření "
+              f"({rescanned} klientů naskenováno, {len(clients) - rescanned} z cache)")
+
+        if rescanned or len(cached) != len(clients):
+            self._save_cache()
+        return self
+
+    @staticmethod
+    def _scan_client(client_path):
+        client_mtime = os.stat(client_path).st_mtime_ns
+        exams = {}
+        with os.scandir(client_path) as it:
+            for entry in it:
+                if not entry.name.startswith("vysetreni_") or not entry.is_dir(follow_symlinks=False):
+                    continue
+                files = []
+                with os.scandir(entry.path) as files_it:
+                    for f in files_it:
+                        if f.is_file():
+                            files.append([f.name, f.stat().st_size])
+                files.sort()
+                exams[entry.name] = {"mtime": entry.stat(follow_symlinks=False).st_mtime_ns, "files": files}
+        return {"mtime": client_mtime, "exams": exams}
+
+    def _is_fresh(self, client_path, cached_client):
+        # Přidání souboru mění mtime jen složky vyšetření, ne složky klienta,
+        # proto se kontrolují obě úrovně.
+        try:
+            if os.stat(client_path).st_mtime_ns != cached_client["mtime"]:
+                return False
+            for name, exam in cached_client["exams"].items():
+                if os.stat(os.path.join(client_path, name)).st_mtime_ns != exam["mtime"]:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != self.CACHE_VERSION or data.get("base_dir") != os.path.abspath(self.base_dir):
+            return {}
+        return data.get("clients", {})
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": self.CACHE_VERSION,
+                    "base_dir": os.path.abspath(self.base_dir),
+                    "clients": self.clients,
+                }, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"  ⚠️  Nepodařilo se uložit cache indexu souborů: {e}")
+
+
+class _HashingReader:
+    """Obal zdrojového souboru: při čtení (readinto) průběžně počítá SHA-256 plaintextu."""
+
+    def __init__(self, f):
+        self._f = f
+        self.hash = hashlib.sha256()
+
+    def readinto(self, buffer):
+        n = self._f.readinto(buffer)
+        if n:
+            self.hash.update(memoryview(buffer)[:n])
+        return n
+
+
+class DocumentBlobStore:
+    """
+    Obsahově adresované úložiště dokumentů vyšetření (režim --dedup).
+    Každý jedinečný obsah (SHA-256 plaintextu) se zašifruje a zapíše jen jednou
+    jako blob_<sha256>.enc; řádky ExaminationDocuments na něj ukazují přes
+    EncryptedPath. Tabulka ExaminationDocumentBlobs drží počet odkazů, takže
+    soubor se smí smazat jen tehdy, když na něj už nic neukazuje (prune_document_blobs).
+
+    Hash se počítá při šifrování, bez dalšího čtení. Soubor se předem jen hashuje
+    (bez šifrování a zápisu) pouze tehdy, když už existuje blob stejné velikosti —
+    jen takový soubor může být duplikát.
+    """
+
+    TABLE = "ExaminationDocumentBlobs"
+
+    def __init__(self, db, storage_dir):
+        self.db = db
+        self.storage_dir = storage_dir
+        self.blobs = {}    # sha256 → (EncryptedPath, FileSize), jen commitnuté
+        self.sizes = set()
+        self.pending = {}  # bloby vložené v běžící transakci; do self.blobs až po commitu
+        self.reused = 0
+        self.saved_bytes = 0
+
+    @staticmethod
+    def blob_name(content_hash):
+        return f"blob_{content_hash}.enc"
+
+    def ensure_table(self):
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS `{self.TABLE}` ("
+            "`ContentHash` char(64) CHARACTER SET ascii NOT NULL, "
+            "`EncryptedPath` varchar(500) CHARACTER SET utf8mb4 NOT NULL, "
+            "`FileSize` bigint NOT NULL, "
+            "`RefCount` int NOT NULL DEFAULT 0, "
+            "`CreatedAt` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6), "
+            f"CONSTRAINT `PK_{self.TABLE}` PRIMARY KEY (`ContentHash`), "
+            f"UNIQUE KEY `IX_{self.TABLE}_EncryptedPath` (`EncryptedPath`)"
+            ") CHARACTER SET=utf8mb4"
+        )
+        self.db.commit()
+
+    def load(self):
+        """Načte už existující bloby (navázání na předchozí běh migrace)."""
+        self.ensure_table()
+        rows = self.db.execute(f"SELECT ContentHash, EncryptedPath, FileSize FROM `{self.TABLE}`", fetch=True) or []
+        for row in rows:
+            self.blobs[row['ContentHash']] = (row['EncryptedPath'], row['FileSize'])
+            self.sizes.add(row['FileSize'])
+        return self
+
+    @staticmethod
+    def _hash_file(path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def store(self, path, size):
+        """Uloží obsah souboru a přičte mu odkaz; vrací (EncryptedPath, FileSize).
+        Volá se uvnitř transakce vyšetření, commit dělá volající."""
+        if size in self.sizes or any(file_size == size for _, file_size in self.pending.values()):
+            content_hash = self._hash_file(path)
+            known = self._lookup(content_hash)
+            if known:
+                enc_name, file_size = known
+                self._add_reference(content_hash)
+                self.reused += 1
+                self.saved_bytes += file_size
+                return enc_name, file_size
+
+        part_path = os.path.join(self.storage_dir, f".blob_{uuid.uuid4()}.part")
+        try:
+            with open(path, 'rb') as src, open(part_path, 'wb') as dst:
+                reader = _HashingReader(src)
+                file_size = encrypt_stream(reader, dst, ENCRYPTION_KEY, ENCRYPTION_IV)
+            content_hash = reader.hash.hexdigest()
+            enc_name = self.blob_name(content_hash)
+            # Stejný obsah dává (pevné IV) stejný šifrotext, přepsání existujícího blobu nic nemění
+            os.replace(part_path, os.path.join(self.storage_dir, enc_name))
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+        known = self._lookup(content_hash)
+        if known:
+            # Velikost z indexu neodpovídala skutečnosti (soubor se mezitím změnil)
+            self._add_reference(content_hash)
+            self.reused += 1
+            return known
+
+        self.db.execute(
+            f"INSERT INTO `{self.TABLE}` (ContentHash, EncryptedPath, FileSize, RefCount) VALUES (%s, %s, %s, 0)",
+            (content_hash, enc_name, file_size)
+        )
+        self.pending[content_hash] = (enc_name, file_size)
+        self._add_reference(content_hash)
+        return enc_name, file_size
+
+    def mark(self):
+        """Stav před jedním souborem, viz discard_since()"""
+        return set(self.pending), self.reused, self.saved_bytes
+
+    def discard_since(self, mark):
+        """Vrácený savepoint jednoho souboru: bloby vložené od mark() zmizely z tabulky,
+        smažou se i jejich soubory"""
+        known, self.reused, self.saved_bytes = mark
+        for content_hash in [h for h in self.pending if h not in known]:
+            enc_name, _ = self.pending.pop(content_hash)
+            path = os.path.join(self.storage_dir, enc_name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _lookup(self, content_hash):
+        return self.blobs.get(content_hash) or self.pending.get(content_hash)
+
+    def commit_pending(self):
+        """Volá se po commitu transakce: bloby z ní jsou v tabulce, smí se na ně odkazovat."""
+        for content_hash, (enc_name, file_size) in self.pending.items():
+            self.blobs[content_hash] = (enc_name, file_size)
+            self.sizes.add(file_size)
+        self.pending.clear()
+
+    def discard_pending(self):
+        """Volá se po rollbacku: řádky blobů zmizely, jejich soubory se smažou."""
+        for enc_name, _ in self.pending.values():
+            path = os.path.join(self.storage_dir, enc_name)
+            if os.path.exists(path):
+                os.remove(path)
+        self.pending.clear()
+
+    def _add_reference(self, content_hash):
+        self.db.execute(
+            f"UPDATE `{self.TABLE}` SET RefCount = RefCount + 1 WHERE ContentHash = %s", (content_hash,)
+        )
+
+
+# ============================================================================
+# Ověření migrace (premedical ↔ cepem_healthcare)
+# ============================================================================
+
+# Každá tabulka: klíč + normalizovaný výraz, který musí na obou stranách dát
+# stejný řetězec. CONCAT_WS vynechává NULL, proto jsou prázdné hodnoty
+# převedeny stejně jako v migraci (prázdný řetězec → NULL / '').
+# "target_source_keys_only": cíl se porovnává jen v klíčích, které má zdroj — pro
+# tabulky, do kterých přidávají řádky i jiné kroky migrace.
+VERIFY_TABLES = [
+    {
+        "name": "ExaminationTypes",
+        "source_from": "_cinnosti",
+        "source_key": "ident",
+        "source_expr": "CONCAT_WS('|', ident, name)",
+        "target_from": "ExaminationTypes et JOIN Translations t ON t.Id = et.NameTranslationId",
+        "target_key": "et.Id",
+        "target_expr": "CONCAT_WS('|', et.Id, t.CS)",
+        # migrate_examinations zakládá typy pro druhy vyšetření, které v _cinnosti nejsou
+        "target_source_keys_only": True,
+    },
+    {
+        "name": "Hospitals",
+        "source_from": "_strediska",
+        "source_key": "ident",
+        "source_expr": "CONCAT_WS('|', ident, alias, NULLIF(ico, ''), NULLIF(firmaname, ''))",
+        "target_from": "Hospitals",
+        "target_key": "Id",
+        "target_expr": "CONCAT_WS('|', Id, Name, CompanyIco, CompanyName)",
+    },
+    {
+        "name": "Patients",
+        "source_from": "_kartoteka",
+        "source_key": "poradi",
+        "source_expr": "CONCAT_WS('|', poradi, ident, COALESCE(jmeno, ''), COALESCE(prijmeni, ''), "
+                       "IF(umrti_date IS NULL OR umrti_date = 0, 1, 0))",
+        "target_from": "Patients pa JOIN Persons pe ON pe.Id = pa.PersonId",
+        "target_key": "pa.Id",
+        "target_expr": "CONCAT_WS('|', pa.Id, pe.UID, pe.FirstName, pe.LastName, pa.Alive)",
+    },
+    {
+        "name": "Employees",
+        "source_from": "_zamestnanci",
+        "source_key": "ident",
+        "source_expr": "CONCAT_WS('|', ident)",
+        "target_from": "Employees",
+        "target_key": "Id",
+        "target_expr": "CONCAT_WS('|', Id)",
+    },
+]
+
+# Vyšetření z client_<ident> ↔ Events + Examinations pacienta s UID = <ident>.
+# Čas se porovnává přes UNIX_TIMESTAMP ve stejné session timezone, ve které
+# migrace převádí `date` na HappenedAt (date = 0 → 2000-01-01).
+EVENTS_SOURCE_EXPR = (
+    "CONCAT_WS('|', IF(`date`, `date`, UNIX_TIMESTAMP('2000-01-01 00:00:00')), "
+    "COALESCE(NULLIF(TRIM(druh), ''), 'Neuvedeno'))"
+)
+EVENTS_TARGET_FROM = (
+    "Events e "
+    "JOIN Examinations x ON x.EventId = e.Id "
+    "JOIN ExaminationTypes et ON et.Id = x.ExaminationTypeId "
+    "JOIN Translations t ON t.Id = et.NameTranslationId "
+    "JOIN Patients pa ON pa.Id = e.PatientId "
+    "JOIN Persons pe ON pe.Id = pa.PersonId"
+)
+EVENTS_TARGET_EXPR = "CONCAT_WS('|', UNIX_TIMESTAMP(e.HappenedAt), t.EN)"
+
+
+class MigrationVerifier:
+    """
+    Porovnání zdrojové a cílové DB pomocí agregací na straně serveru.
+    Pro každý rozsah klíčů se spočítá COUNT(*) a BIT_XOR(CRC32(...)) nad
+    normalizovanými sloupci; na úroveň řádků se sestupuje (půlením rozsahu)
+    jen u rozsahů, které se liší. Rozsahy se zpracovávají paralelně,
+    každé vlákno má vlastní spojení.
+    """
+
+    def __init__(self, source_config, target_config, chunk_size=10000, drill_rows=500, workers=8, max_report=20):
+        self.source_config = source_config
+        self.target_config = target_config
+        self.chunk_size = chunk_size
+        self.drill_rows = drill_rows
+        self.workers = workers
+        self.max_report = max_report
+        self._local = None
+        self._lock = None
+        self._connections = []
+
+    # --- spojení per vlákno ---------------------------------------------------
+
+    def _dbs(self):
+        if not hasattr(self._local, "source"):
+            source = MySQLDatabase(**{k: v for k, v in self.source_config.items() if k != "autocommit"})
+            target = MySQLDatabase(**{k: v for k, v in self.target_config.items() if k != "autocommit"})
+            source.connect()
+            target.connect()
+            self._local.source, self._local.target = source, target
+            with self._lock:
+                self._connections.extend([source, target])
+        return self._local.source, self._local.target
+
+    def _run_parallel(self, func, items):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                return list(pool.map(func, items))
+        finally:
+            for db in self._connections:
+                db.close()
+            self._connections = []
+
+    # --- klíčované tabulky ----------------------------------------------------
+
+    @staticmethod
+    def _aggregate(db, from_, key, expr, lo, hi, where=None):
+        row = db.execute(
+            f"SELECT COUNT(*) AS cnt, COALESCE(BIT_XOR(CRC32({expr})), 0) AS crc "
+            f"FROM {from_} WHERE {key} BETWEEN %s AND %s{f' AND {where}' if where else ''}",
+            (lo, hi), fetch=True
+        )[0]
+        return int(row['cnt']), int(row['crc'])
+
+    @staticmethod
+    def _row_checksums(db, from_, key, expr, lo, hi, where=None):
+        rows = db.execute(
+            f"SELECT {key} AS k, CRC32({expr}) AS crc FROM {from_} "
+            f"WHERE {key} BETWEEN %s AND %s{f' AND {where}' if where else ''}",
+            (lo, hi), fetch=True
+        )
+        return {row['k']: row['crc'] for row in rows}
+
+    def _compare_range(self, spec, lo, hi, source_agg=None, target_agg=None):
+        source, target = self._dbs()
+        target_where = spec.get("target_where")
+        if source_agg is None:
+            source_agg = self._aggregate(source, spec["source_from"], spec["source_key"], spec["source_expr"], lo, hi)
+        if target_agg is None:
+            target_agg = self._aggregate(target, spec["target_from"], spec["target_key"], spec["target_expr"],
+                                         lo, hi, target_where)
+        if source_agg == target_agg:
+            return [], [], []
+
+        if hi - lo + 1 <= self.drill_rows:
+            src = self._row_checksums(source, spec["source_from"], spec["source_key"], spec["source_expr"], lo, hi)
+            tgt = self._row_checksums(target, spec["target_from"], spec["target_key"], spec["target_expr"],
+                                      lo, hi, target_where)
+            missing = sorted(k for k in src if k not in tgt)
+            extra = sorted(k for k in tgt if k not in src)
+            changed = sorted(k for k in src if k in tgt and src[k] != tgt[k])
+            return missing, extra, changed
+
+        mid = (lo + hi) // 2
+        missing, extra, changed = self._compare_range(spec, lo, mid)
+        m2, e2, c2 = self._compare_range(spec, mid + 1, hi)
+        return missing + m2, extra + e2, changed + c2
+
+    def verify_table(self, spec):
+        import time
+
+        started = time.perf_counter()
+        if spec.get("target_source_keys_only"):
+            spec = {**spec, "target_where": self._source_keys_filter(spec)}
+
+        def key_range(db, from_, key, where=None):
+            row = db.execute(f"SELECT MIN({key}) AS lo, MAX({key}) AS hi FROM {from_}"
+                             f"{f' WHERE {where}' if where else ''}", fetch=True)[0]
+            return row['lo'], row['hi']
+
+        def bounds():
+            source, target = self._dbs()
+            return [key_range(source, spec["source_from"], spec["source_key"]),
+                    key_range(target, spec["target_from"], spec["target_key"], spec.get("target_where"))]
+
+        (s_lo, s_hi), (t_lo, t_hi) = self._run_parallel(lambda _: bounds(), [None])[0]
+        los = [v for v in (s_lo, t_lo) if v is not None]
+        his = [v for v in (s_hi, t_hi) if v is not None]
+        if not los:
+            print(f"  ✅ {spec['name']}: prázdné na obou stranách")
+            return True
+
+        lo, hi = int(min(los)), int(max(his))
+        chunks = [(start, min(start + self.chunk_size - 1, hi)) for start in range(lo, hi + 1, self.chunk_size)]
+        results = self._run_parallel(lambda c: self._compare_range(spec, c[0], c[1]), chunks)
+
+        missing = [k for r in results for k in r[0]]
+        extra = [k for r in results for k in r[1]]
+        changed = [k for r in results for k in r[2]]
+        elapsed = time.perf_counter() - started
+
+        if not (missing or extra or changed):
+            print(f"  ✅ {spec['name']}: shoda ({len(chunks)} rozsahů, {elapsed:.2f} s)")
+            return True
+
+        print(f"  ❌ {spec['name']}: chybí v cíli {len(missing)}, navíc v cíli {len(extra)}, "
+              f"rozdílné {len(changed)} ({elapsed:.2f} s)")
+        for label, keys in (("chybí", missing), ("navíc", extra), ("rozdíl", changed)):
+            if keys:
+                shown = ", ".join(str(k) for k in keys[:self.max_report])
+                more = f" … (+{len(keys) - self.max_report})" if len(keys) > self.max_report else ""
+                print(f"     {label}: {shown}{more}")
+        return False
+
+    def _source_keys_filter(self, spec):
+        """Podmínka na cílový klíč: jen klíče, které existují ve zdroji (malé číselníky)"""
+        def fetch(_):
+            source, _target = self._dbs()
+            return [row['k'] for row in source.execute(
+                f"SELECT {spec['source_key']} AS k FROM {spec['source_from']}", fetch=True
+            )]
+
+        keys = self._run_parallel(fetch, [None])[0]
+        if not keys:
+            return "1 = 0"
+        return f"{spec['target_key']} IN ({', '.join(str(int(k)) for k in keys)})"
+
+    # --- vyšetření (client_* tabulky) -----------------------------------------
+
+    def _compare_client_batch(self, idents):
+        source, target = self._dbs()
+
+        union = " UNION ALL ".join(
+            f"SELECT %s AS uid, COUNT(*) AS cnt, COALESCE(BIT_XOR(CRC32({EVENTS_SOURCE_EXPR})), 0) AS crc "
+            f"FROM `client_{ident}`"
+            for ident in idents
+        )
+        source_aggs = {
+            str(row['uid']): (int(row['cnt']), int(row['crc']))
+            for row in source.execute(union, tuple(idents), fetch=True)
+        }
+
+        placeholders = ", ".join(["%s"] * len(idents))
+        target_aggs = {
+            str(row['uid']): (int(row['cnt']), int(row['crc']))
+            for row in target.execute(
+                f"SELECT pe.UID AS uid, COUNT(*) AS cnt, COALESCE(BIT_XOR(CRC32({EVENTS_TARGET_EXPR})), 0) AS crc "
+                f"FROM {EVENTS_TARGET_FROM} WHERE pe.UID IN ({placeholders}) GROUP BY pe.UID",
+                tuple(idents), fetch=True
+            )
+        }
+
+        mismatches = []
+        for ident in idents:
+            src = source_aggs.get(ident, (0, 0))
+            tgt = target_aggs.get(ident, (0, 0))
+            if src == tgt:
+                continue
+            # Řádková úroveň jen pro nesouhlasícího klienta
+            src_rows = source.execute(f"SELECT CRC32({EVENTS_SOURCE_EXPR}) AS crc FROM `client_{ident}`", fetch=True)
+            tgt_rows = target.execute(
+                f"SELECT CRC32({EVENTS_TARGET_EXPR}) AS crc FROM {EVENTS_TARGET_FROM} WHERE pe.UID = %s",
+                (ident,), fetch=True
+            )
+            src_crcs = Counter(r['crc'] for r in src_rows)
+            tgt_crcs = Counter(r['crc'] for r in tgt_rows)
+            only_source = sum((src_crcs - tgt_crcs).values())
+            only_target = sum((tgt_crcs - src_crcs).values())
+            mismatches.append((ident, src[0], tgt[0], only_source, only_target))
+        return mismatches
+
+    def verify_events(self, batch_size=200):
+        import time
+
+        started = time.perf_counter()
+        source_db = MySQLDatabase(**{k: v for k, v in self.source_config.items() if k != "autocommit"})
+        source_db.connect()
+        try:
+            tables = source_db.execute(
+                "SELECT table_name AS table_name FROM information_schema.tables "
+                "WHERE table_schema = %s AND table_name LIKE 'client\\_%%' ORDER BY table_name",
+                (self.source_config["database"],), fetch=True
+            )
+        finally:
+            source_db.close()
+
+        idents = [row['table_name'][len('client_'):] for row in tables]
+        batches = [idents[i:i + batch_size] for i in range(0, len(idents), batch_size)]
+        results = self._run_parallel(self._compare_client_batch, batches)
+        mismatches = [m for batch in results for m in batch]
+        elapsed = time.perf_counter() - started
+
+        if not mismatches:
+            print(f"  ✅ Vyšetření: shoda pro {len(idents)} klientů ({elapsed:.2f} s)")
+            return True
+
+        print(f"  ❌ Vyšetření: {len(mismatches)} z {len(idents)} klientů se liší ({elapsed:.2f} s)")
+        for ident, src_cnt, tgt_cnt, only_source, only_target in mismatches[:self.max_report]:
+            print(f"     client_{ident}: zdroj {src_cnt}, cíl {tgt_cnt} "
+                  f"(jen ve zdroji {only_source}, jen v cíli {only_target})")
+        if len(mismatches) > self.max_report:
+            print(f"     … (+{len(mismatches) - self.max_report})")
+        return False
+
+    def verify(self, tables=None):
+        print("\n🔍 Ověřuji migraci...")
+        ok = True
+        for spec in VERIFY_TABLES:
+            if tables and spec["name"] not in tables:
+                continue
+            ok = self.verify_table(spec) and ok
+        if not tables or "Events" in tables:
+            ok = self.verify_events() and ok
+        print(f"\n  {'✅ Ověření v pořádku' if ok else '❌ Ověření našlo rozdíly'}")
+        return ok
+
 # ============================================================================
 # Migrations pro CEPEM Healthcare
 # ============================================================================
@@ -74,21 +814,33 @@ class MySQLDatabase:
 class CepemHealthcareMigration:
     """Třída pro správu migrací databáze cepem_healthcare"""
     
-    def __init__(self, host="127.0.0.1", user="root", password="", port=3306):
+    def __init__(self, host="127.0.0.1", user="root", password="", port=3306, tracer=None, dedup_documents=False):
+        self.tracer = tracer
+        self.dedup_documents = dedup_documents
         self.source_db = MySQLDatabase(
             host=host,
             user=user,
             password=password,
             database="premedical",
-            port=port
+            port=port,
+            tracer=tracer
         )
         self.target_db = MySQLDatabase(
             host=host,
             user=user,
             password=password,
             database="cepem_healthcare",
-            port=port
+            port=port,
+            tracer=tracer
         )
+
+    def run_step(self, step):
+        """Spustí jeden krok migrace; se zapnutým tracerem vypíše SQL profil kroku"""
+        try:
+            return step()
+        finally:
+            if self.tracer:
+                self.tracer.report(step.__name__, explain_config=self.target_db.config)
     
     def migrate_activities(self):
         """Migrace tabulky aktivit (_cinnosti) z premedical do cepem_healthcare"""
@@ -679,26 +1431,23 @@ class CepemHealthcareMigration:
             self.target_db.close()
 
     def migrate_examinations(self, files_base_dir: str = os.path.expanduser("~/database_CEPEM/clients/files"),
-                             doc_storage_dir: str = "/home/olda/programovani/CEPEM/data/patient-documents"):
-        """Migrace vyšetření z client_* tabulek do Events, Examinations, Comments, ExaminationDocuments"""
+                             doc_storage_dir: str = "/home/olda/programovani/CEPEM/data/patient-documents",
+                             files_index_cache: str = os.path.expanduser("~/database_CEPEM/clients/files_index.json"),
+                             scan_workers: int = 16,
+                             dedup: bool = None):
+        """Migrace vyšetření z client_* tabulek do Events, Examinations, Comments, ExaminationDocuments.
+        S dedup=True (výchozí podle dedup_documents) se shodné přílohy ukládají jen jednou, viz DocumentBlobStore."""
         import datetime
-        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-        from cryptography.hazmat.backends import default_backend
 
-        ENCRYPTION_KEY = b"CEPEMSecureKey1234567890123456\x00\x00"[:32]
-        ENCRYPTION_IV  = b"CEPEMInitVector1"[:16]
-
-        def encrypt_file(data: bytes) -> bytes:
-            pad_len = 16 - (len(data) % 16)
-            padded = data + bytes([pad_len] * pad_len)
-            cipher = Cipher(algorithms.AES(ENCRYPTION_KEY), modes.CBC(ENCRYPTION_IV), backend=default_backend())
-            enc = cipher.encryptor()
-            return enc.update(padded) + enc.finalize()
+        if dedup is None:
+            dedup = self.dedup_documents
 
         os.makedirs(doc_storage_dir, exist_ok=True)
 
         print("\n🔄 Migruju vyšetření...")
 
+        files_index = LegacyFilesIndex(files_base_dir, cache_path=files_index_cache, workers=scan_workers).build()
+
         self.source_db.connect()
         client_tables = self.source_db.execute(
             "SELECT table_name FROM information_schema.tables "
@@ -712,8 +1461,10 @@ class CepemHealthcareMigration:
             print("  ⚠️  Žádné client_* tabulky nenalezeny")
             return
 
+        blob_store = None
         try:
             self.target_db.connect()
+            blob_store = DocumentBlobStore(self.target_db, doc_storage_dir).load() if dedup else None
 
             def get_or_create_event_type(name: str) -> int:
                 row = self.target_db.execute(
@@ -812,43 +1563,35 @@ class CepemHealthcareMigration:
                     examination_id = self.target_db.execute("SELECT LAST_INSERT_ID() AS id", fetch=True)[0]['id']
 
                     # Soubory pro toto vyšetření
-                    vysetreni_dir = os.path.join(
-                        files_base_dir,
-                        f"client_{kartoteka_ident}",
-                        f"vysetreni_{ex_ident:08d}"
-                    )
-                    if os.path.isdir(vysetreni_dir):
-                        for filename in os.listdir(vysetreni_dir):
-                            filepath = os.path.join(vysetreni_dir, filename)
-                            if not os.path.isfile(filepath):
-                                continue
-                            try:
-                                with open(filepath, 'rb') as f:
-                                    raw = f.read()
-                                encrypted = encrypt_file(raw)
-                                enc_filename = f"examination_{examination_id}_{uuid.uuid4()}.enc"
-                                enc_path = os.path.join(doc_storage_dir, enc_filename)
-                                with open(enc_path, 'wb') as f:
-                                    f.write(encrypted)
-                                self.target_db.execute(
-                                    "INSERT INTO ExaminationDocuments "
-                                    "(ExaminationId, FileName, OriginalFileName, UploadedAt, FileSize, EncryptedPath, IsDeleted) "
-                                    "VALUES (%s, %s, %s, %s, %s, %s, 0)",
-                                    (examination_id, enc_filename, filename, happened_at, len(raw), enc_filename)
-                                )
-                                total_files += 1
-                            except Exception as fe:
-                                print(f"    ⚠️  Soubor {filename}: {fe}")
+                    vysetreni_dir = files_index.exam_dir(kartoteka_ident, ex_ident)
+                    for filename, size in files_index.files_for(kartoteka_ident, ex_ident):
+                        try:
+                            self._store_examination_document(
+                                blob_store, doc_storage_dir, examination_id,
+                                os.path.join(vysetreni_dir, filename), filename, size, happened_at
+                            )
+                            total_files += 1
+                        except TransactionAborted:
+                            raise
+                        except Exception as fe:
+                            print(f"    ⚠️  Soubor {filename}: {fe}")
 
                     self.target_db.commit()
+                    if blob_store:
+                        blob_store.commit_pending()
                     total_events += 1
 
                 print(f"  ✅ {table_name}: {len(examinations)} vyšetření")
 
             print(f"\n  ✅ Migrace vyšetření dokončena: {total_events} nových, {total_skipped} přeskočeno, {total_files} souborů")
+            if blob_store:
+                print(f"  ♻️  Deduplikace: {blob_store.reused} souborů odkazuje na existující blob, "
+                      f"ušetřeno {blob_store.saved_bytes / 1024 / 1024:.1f} MB")
 
         except Exception as e:
             self.target_db.rollback()
+            if blob_store:
+                blob_store.discard_pending()
             print(f"  ❌ Chyba při migraci vyšetření: {e}")
             raise
 
@@ -858,24 +1601,84 @@ class CepemHealthcareMigration:
             self.target_db.close()
 
 
+    def _store_examination_document(self, blob_store, doc_storage_dir, examination_id, filepath, filename, size,
+                                     happened_at):
+        """Zašifruje jeden soubor vyšetření a vloží jeho řádek ExaminationDocuments.
+        Běží v savepointu: při chybě se vrátí jen řádky tohoto souboru (ne celé vyšetření)
+        a smažou se soubory, které pro něj vznikly, takže commit_pending() je nepovýší."""
+        blob_mark = blob_store.mark() if blob_store else None
+        enc_path = None
+        try:
+            with self.target_db.savepoint("examination_document"):
+                if blob_store:
+                    enc_filename, file_size = blob_store.store(filepath, size)
+                else:
+                    enc_filename = f"examination_{examination_id}_{uuid.uuid4()}.enc"
+                    enc_path = os.path.join(doc_storage_dir, enc_filename)
+                    # Streamuje se po blocích, celý soubor se do paměti nenačítá
+                    with open(filepath, 'rb') as src, open(enc_path, 'wb') as dst:
+                        file_size = encrypt_stream(src, dst, ENCRYPTION_KEY, ENCRYPTION_IV)
+                self.target_db.execute(
+                    "INSERT INTO ExaminationDocuments "
+                    "(ExaminationId, FileName, OriginalFileName, UploadedAt, FileSize, EncryptedPath, IsDeleted) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, 0)",
+                    (examination_id, enc_filename, filename, happened_at, file_size, enc_filename)
+                )
+        except BaseException:
+            if blob_store:
+                blob_store.discard_since(blob_mark)
+            elif enc_path and os.path.exists(enc_path):
+                os.remove(enc_path)
+            raise
+
+    def prune_document_blobs(self, doc_storage_dir: str = "/home/olda/programovani/CEPEM/data/patient-documents",
+                             dry_run: bool = False):
+        """Přepočítá RefCount blobů podle ExaminationDocuments a smaže bloby, na které nic neukazuje.
+        Počítají se i soft-smazané řádky (IsDeleted = 1), dokument z nich jde pořád obnovit."""
+        table = DocumentBlobStore.TABLE
+        print("\n🔄 Kontroluju deduplikované bloby dokumentů...")
+        try:
+            self.target_db.connect()
+            DocumentBlobStore(self.target_db, doc_storage_dir).ensure_table()
+            self.target_db.execute(
+                f"UPDATE `{table}` b LEFT JOIN ("
+                "SELECT EncryptedPath, COUNT(*) AS Refs FROM ExaminationDocuments GROUP BY EncryptedPath"
+                ") d ON d.EncryptedPath = b.EncryptedPath "
+                "SET b.RefCount = COALESCE(d.Refs, 0)"
+            )
+            orphans = self.target_db.execute(
+                f"SELECT ContentHash, EncryptedPath, FileSize FROM `{table}` WHERE RefCount = 0 FOR UPDATE",
+                fetch=True
+            ) or []
+            freed = 0
+            for blob in orphans:
+                if dry_run:
+                    print(f"  🗑️  {blob['EncryptedPath']} ({blob['FileSize']} B)")
+                    continue
+                self.target_db.execute(f"DELETE FROM `{table}` WHERE ContentHash = %s", (blob['ContentHash'],))
+                freed += blob['FileSize']
+            self.target_db.commit()
+            # Soubory až po commitu: při rollbacku by jinak řádky blobů zůstaly bez souborů
+            for blob in [] if dry_run else orphans:
+                path = os.path.join(doc_storage_dir, blob['EncryptedPath'])
+                if os.path.exists(path):
+                    os.remove(path)
+            if dry_run:
+                print(f"  ✅ Nepoužitých blobů: {len(orphans)} (jen výpis, nic se nemaže)")
+            else:
+                print(f"  ✅ Smazáno nepoužitých blobů: {len(orphans)}, uvolněno {freed / 1024 / 1024:.1f} MB")
+        except Exception as e:
+            self.target_db.rollback()
+            print(f"  ❌ Chyba při úklidu blobů: {e}")
+            raise
+        finally:
+            self.target_db.close()
+
     def migrate_patient_photos(self, photo_storage_dir="/home/olda/programovani/CEPEM/data/patient-photos"):
         print("\n🔄 Migruju fotky pacientů...")
 
-        ENCRYPTION_KEY = b"CEPEMSecureKey1234567890123456\x00\x00"[:32]
-        ENCRYPTION_IV  = b"CEPEMInitVector1"[:16]
-
-        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-        from cryptography.hazmat.primitives import padding
-        from cryptography.hazmat.backends import default_backend
         import base64
 
-        def encrypt(data: bytes) -> bytes:
-            padder = padding.PKCS7(128).padder()
-            padded = padder.update(data) + padder.finalize()
-            cipher = Cipher(algorithms.AES(ENCRYPTION_KEY), modes.CBC(ENCRYPTION_IV), backend=default_backend())
-            enc = cipher.encryptor()
-            return enc.update(padded) + enc.finalize()
-
         os.makedirs(photo_storage_dir, exist_ok=True)
 
         try:
@@ -920,7 +1723,7 @@ class CepemHealthcareMigration:
                     total_skipped += 1
                     continue
 
-                encrypted = encrypt(raw_bytes)
+                encrypted = encrypt_bytes(raw_bytes, ENCRYPTION_KEY, ENCRYPTION_IV)
                 file_name = f"patient_{patient_id}_{uuid.uuid4()}.enc"
                 file_path = os.path.join(photo_storage_dir, file_name)
 
@@ -946,22 +1749,70 @@ class CepemHealthcareMigration:
                 self.source_db.close()
             self.target_db.close()
 
+    def verify_migration(self, tables=None, chunk_size=10000, workers=8):
+        """Porovná premedical a cepem_healthcare přes agregace COUNT + BIT_XOR(CRC32) po rozsazích klíčů"""
+        verifier = MigrationVerifier(
+            self.source_db.config,
+            self.target_db.config,
+            chunk_size=chunk_size,
+            workers=workers
+        )
+        return verifier.verify(tables)
+
 
 if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Migrace premedical → cepem_healthcare")
+    parser.add_argument("command", nargs="?", choices=["migrate", "verify", "prune-blobs"], default="migrate",
+                        help="migrate = spustí všechny migrace, verify = porovná zdroj a cíl, "
+                             "prune-blobs = smaže deduplikované bloby bez odkazů")
+    parser.add_argument("--tables", nargs="*",
+                        help="Jen pro verify: tabulky k ověření (ExaminationTypes, Hospitals, Patients, Employees, Events)")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Jen pro verify: velikost rozsahu klíčů")
+    parser.add_argument("--workers", type=int, default=8, help="Jen pro verify: počet paralelních spojení")
+    parser.add_argument("--trace", action="store_true",
+                        help="Měří každý SQL příkaz a po každém kroku vypíše nejpomalejší")
+    parser.add_argument("--trace-top", type=int, default=15, help="Počet příkazů v SQL profilu")
+    parser.add_argument("--trace-explain", action="store_true",
+                        help="K nejpomalejším příkazům vypíše i EXPLAIN (implikuje --trace)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Shodné přílohy vyšetření uložit jen jednou (blob_<sha256>.enc s počítadlem odkazů)")
+    parser.add_argument("--dry-run", action="store_true", help="Jen pro prune-blobs: nic nemazat, jen vypsat")
+    args = parser.parse_args()
+
+    tracer = None
+    if args.trace or args.trace_explain:
+        tracer = SQLTracer(top_n=args.trace_top, explain=args.trace_explain)
+
     # Inicializuj migraci s tvými credentials
     migration = CepemHealthcareMigration(
         host="127.0.0.1",
         user="root",
         password="oldaolda",
-        port=3306
+        port=3306,
+        tracer=tracer,
+        dedup_documents=args.dedup
     )
-    
+
+    if args.command == "verify":
+        ok = migration.verify_migration(args.tables, chunk_size=args.chunk_size, workers=args.workers)
+        sys.exit(0 if ok else 1)
+
+    if args.command == "prune-blobs":
+        migration.prune_document_blobs(dry_run=args.dry_run)
+        sys.exit(0)
+
     # Spusť všechny migrace
-    migration.migrate_activities()
-    migration.migrate_hospitals()
-    migration.migrate_hospital_examination_types()
-    migration.migrate_hospital_equipment()
-    migration.migrate_patients()
-    migration.migrate_employees()
-    migration.migrate_examinations()
-    migration.migrate_patient_photos()
+    for step in (
+        migration.migrate_activities,
+        migration.migrate_hospitals,
+        migration.migrate_hospital_examination_types,
+        migration.migrate_hospital_equipment,
+        migration.migrate_patients,
+        migration.migrate_employees,
+        migration.migrate_examinations,
+        migration.migrate_patient_photos,
+    ):
+        migration.run_step(step)
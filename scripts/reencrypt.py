@@ -8,73 +8,517 @@ Usage:
         --new-key "NewSecureKey1234567890123456789" \
         --new-iv  "NewInitVector123" \
         --photos-dir  /path/to/patient-photos \
-        --docs-dir    /path/to/patient-documents
+        --docs-dir    /path/to/patient-documents \
+        --workers     8
 
-The script processes files in-place, writing a .tmp file first and only replacing
-the original on success, so a crash leaves the originals intact.
+The script processes files in-place, writing a <name>.reencrypt.tmp file first and
+only replacing the original on success, so a crash leaves the originals intact;
+the next run deletes the leftover temporary files before it starts.
+Files are streamed in 1 MiB chunks, so memory use does not grow with file size.
+With --workers N the files are spread over N processes (AES is CPU-bound),
+with at most 2*N files in flight at any time.
+
+Before re-encrypting, each file's key is probed from its last two ciphertext
+blocks, so files already under the new key are skipped when a run is repeated.
+A file whose key stays ambiguous is left untouched and reported, not failed.
+--scan only reports how many files are under the old/new/unknown key.
+Files written by migrate.py, whose old key was NUL-padded instead of
+space-padded, are recognised and rotated as well.
+
+With --manifest the progress is logged so the rotation can be stopped (Ctrl+C)
+and resumed in a later maintenance window; --max-mbps caps the I/O rate so it
+can also run while the DatabaseAPI is serving documents.
+
+--durable-batch N makes the replacements crash-safe on disk: files are fsynced
+and renamed in groups of N with one directory fsync and an undo journal per
+group, instead of one fsync round-trip per file.
 """
 
 import argparse
+import json
 import os
 import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
+from typing import Iterable, Iterator
+
+from document_crypto import (
+    BLOCK_SIZE,
+    decrypt_block,
+    has_valid_padding,
+    last_plaintext_block,
+    pad_key,
+    read_probe_blocks,
+    reencrypt_stream,
+)
+
+
+# Known plaintext signatures, used only to break a tie when the last block has
+# valid padding under both keys (~1/256 chance for a random key).
+_MAGIC_PREFIXES = (
+    b"%PDF", b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"PK\x03\x04",
+    b"II*\x00", b"MM\x00*", b"RIFF", b"\xd0\xcf\x11\xe0", b"BM",
+)
+# DICOM files start with a 128-byte preamble followed by "DICM"
+_DICOM_OFFSET = 128
+_DICOM_MAGIC = b"DICM"
+# How much of the file is decrypted to break a tie
+_TIE_BREAK_BYTES = 4096
+# I/O of classifying one file: the first block and the last two (the tie-break read is rare)
+PROBE_BYTES = 3 * BLOCK_SIZE
+
+
+def _read_head(file: Path) -> bytes:
+    """First whole AES blocks of the file, at most _TIE_BREAK_BYTES."""
+    with open(file, "rb") as f:
+        head = f.read(_TIE_BREAK_BYTES)
+    return head[:len(head) - len(head) % BLOCK_SIZE]
+
+
+def looks_like_plaintext(data: bytes) -> bool:
+    """A known signature, or a byte distribution far from uniform. Under a wrong key CBC
+    yields random bytes, whose chi-square over 256 byte values stays near 255
+    (sd ~23); real file headers and text are far above 512."""
+    if data.startswith(_MAGIC_PREFIXES):
+        return True
+    if data[_DICOM_OFFSET:_DICOM_OFFSET + len(_DICOM_MAGIC)] == _DICOM_MAGIC:
+        return True
+    if len(data) < 1024:
+        return False
+    expected = len(data) / 256
+    counts = Counter(data)
+    chi_square = sum((counts.get(value, 0) - expected) ** 2 for value in range(256)) / expected
+    return chi_square > 512
+
 
+def classify_file(file: Path, old_key: bytes, old_iv: bytes, new_key: bytes, new_iv: bytes,
+                  legacy_key: bytes | None = None) -> str:
+    """Determines the key of an .enc file from its last two ciphertext blocks, without
+    decrypting the whole file.
 
-def _pad_key(key: str, length: int) -> bytes:
-    return key.encode().ljust(length)[:length]
+    In CBC the last plaintext block is D(C[n]) XOR C[n-1] (C[-1] = IV), so checking the
+    PKCS#7 padding — the only thing a full decrypt validates — needs just 32 bytes.
+    When the padding is valid under more than one key, the first 4 KiB are decrypted
+    under each of them and the one that looks like a real file wins.
+    `legacy_key` is the old key string NUL-padded the way migrate.py wrote its files.
+    Returns "old", "legacy" (old key, NUL-padded), "new", "unknown" (no key) or
+    "ambiguous" (more than one key)."""
+    try:
+        _size, _first, tail = read_probe_blocks(file)
+    except ValueError:
+        return "unknown"
 
+    candidates = [("old", old_key, old_iv), ("new", new_key, new_iv)]
+    if legacy_key is not None and legacy_key != old_key:
+        candidates.append(("legacy", legacy_key, old_iv))
+    matches = [(state, key, iv) for state, key, iv in candidates
+               if has_valid_padding(last_plaintext_block(tail, key, iv))]
+    if len(matches) == 1:
+        return matches[0][0]
+    if not matches:
+        return "unknown"
 
-def decrypt(data: bytes, key: bytes, iv: bytes) -> bytes:
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-    padded = decryptor.update(data) + decryptor.finalize()
-    pad_len = padded[-1]
-    if pad_len < 1 or pad_len > 16:
-        raise ValueError(f"Invalid PKCS#7 padding length: {pad_len}")
-    if padded[-pad_len:] != bytes([pad_len]) * pad_len:
-        raise ValueError("Invalid PKCS#7 padding bytes")
-    return padded[:-pad_len]
+    head = _read_head(file)
+    plausible = [state for state, key, iv in matches if looks_like_plaintext(decrypt_block(head, key, iv))]
+    if len(plausible) == 1:
+        return plausible[0]
+    return "ambiguous"
 
 
-def encrypt(data: bytes, key: bytes, iv: bytes) -> bytes:
-    pad_len = 16 - (len(data) % 16)
-    padded = data + bytes([pad_len] * pad_len)
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-    return encryptor.update(padded) + encryptor.finalize()
+TMP_SUFFIX = ".reencrypt.tmp"
 
 
-def reencrypt_directory(directory: Path, old_key: bytes, old_iv: bytes, new_key: bytes, new_iv: bytes) -> tuple[int, int]:
+def tmp_path(file: Path) -> Path:
+    """Temporary file for the new ciphertext; distinctive, so recovery never touches other .tmp files"""
+    return file.with_name(file.name + TMP_SUFFIX)
+
+
+def remove_stale_tmp_files(directory: Path) -> int:
+    """Deletes the temporary files of an interrupted run. Each belongs to a file whose rename
+    never happened, so the original still holds its old content. Returns the number removed."""
+    removed = 0
+    for tmp in directory.glob(f"*{TMP_SUFFIX}"):
+        try:
+            tmp.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def reencrypt_file(file: Path, old_key: bytes, old_iv: bytes, new_key: bytes, new_iv: bytes,
+                   skip_rotated: bool = True, replace: bool = True,
+                   legacy_key: bytes | None = None) -> tuple[str, str | None]:
+    """Re-encrypts one file via tmp_path() + replace. With replace=False the temporary file is left
+    for GroupCommitter to fsync and rename together with the rest of its batch.
+    Files written by migrate.py (state "legacy") are decrypted with `legacy_key`.
+    Returns ("ok", None), ("skipped", reason), ("ambiguous", reason) — left untouched for
+    a manual check, not a failure — or ("failed", error text)."""
+    if skip_rotated:
+        try:
+            state = classify_file(file, old_key, old_iv, new_key, new_iv, legacy_key)
+        except Exception as e:
+            return "failed", str(e)
+        if state == "new":
+            return "skipped", "už je pod novým klíčem"
+        if state == "unknown":
+            return "failed", "neodpovídá starému ani novému klíči"
+        if state == "ambiguous":
+            return "ambiguous", "nelze jednoznačně určit klíč, soubor ponechán beze změny"
+        if state == "legacy":
+            old_key = legacy_key
+
+    tmp = tmp_path(file)
+    try:
+        with file.open("rb") as src, tmp.open("wb") as dst:
+            reencrypt_stream(src, dst, old_key, old_iv, new_key, new_iv)
+        if replace:
+            tmp.replace(file)
+        return "ok", None
+    except Exception as e:
+        if tmp.exists():
+            tmp.unlink()
+        return "failed", str(e)
+
+
+def _iter_results_parallel(files: Iterable[Path], workers: int, func, args: tuple, executor_class=ProcessPoolExecutor):
+    """Yields (file, func result) from a worker pool, keeping at most workers * 2 files in flight."""
+    max_in_flight = workers * 2
+    pending = {}
+    remaining = iter(files)
+
+    with executor_class(max_workers=workers) as pool:
+        for file in remaining:
+            pending[pool.submit(func, file, *args)] = file
+            if len(pending) >= max_in_flight:
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = ("failed", str(e))
+                yield file, result
+
+                next_file = next(remaining, None)
+                if next_file is not None:
+                    pending[pool.submit(func, next_file, *args)] = next_file
+
+
+def _list_enc_files(directory: Path) -> list[Path] | None:
     if not directory.exists():
         print(f"  ⚠️  Složka neexistuje, přeskakuji: {directory}")
-        return 0, 0
+        return None
 
     files = list(directory.glob("*.enc"))
     if not files:
         print(f"  ℹ️  Žádné .enc soubory v {directory}")
-        return 0, 0
+        return None
+    return files
+
+
+class RotationManifest:
+    """Append-only JSON-lines log of finished files (path, size, mtime, state).
+
+    Entries are buffered and appended in batches; on load the last entry per path
+    wins. A file recorded as "done" whose size and mtime still match is skipped
+    without being opened, so an interrupted rotation resumes where it stopped."""
+
+    def __init__(self, path: Path, batch_size: int = 200):
+        self.path = path
+        self.batch_size = batch_size
+        self.entries: dict[str, dict] = {}
+        self._buffer: list[dict] = []
+        if path.exists():
+            with path.open("r+b") as f:
+                complete = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn last line after a crash: cut it off so the next append starts a new line
+                        f.truncate(complete)
+                        break
+                    complete += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry["path"]] = entry
+
+    def is_done(self, file: Path) -> bool:
+        entry = self.entries.get(str(file.resolve()))
+        if not entry or entry["state"] != "done":
+            return False
+        try:
+            st = file.stat()
+        except OSError:
+            return False
+        return st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]
+
+    def record(self, file: Path, state: str) -> None:
+        try:
+            st = file.stat()
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        except OSError:
+            size, mtime_ns = None, None
+        entry = {"path": str(file.resolve()), "size": size, "mtime_ns": mtime_ns, "state": state}
+        self.entries[entry["path"]] = entry
+        self._buffer.append(entry)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self, fsync: bool = False) -> None:
+        if not self._buffer:
+            return
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in self._buffer))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._buffer = []
+
+
+def _fsync_path(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class GroupCommitter:
+    """Makes .tmp → original replacement durable in batches instead of per file.
+
+    Per batch: the list of files is appended to an undo journal (fsynced), all .tmp
+    files are fsynced concurrently so the filesystem can fold them into few journal
+    commits, the renames are done, and the directory is fsynced once. After a crash
+    recover() removes the .tmp files of any uncommitted batch: a file whose rename
+    did not survive still has its original content, one whose rename did has fully
+    synced new content. The same holds for .tmp files that workers had written but
+    that were not yet part of a journalled batch."""
+
+    JOURNAL_NAME = ".reencrypt-journal.jsonl"
+
+    def __init__(self, directory: Path, batch_size: int = 256, fsync_threads: int = 16):
+        self.directory = directory
+        self.journal = directory / self.JOURNAL_NAME
+        self.batch_size = batch_size
+        self.fsync_threads = fsync_threads
+        self._batch: list[Path] = []
+        self._batch_no = 0
+
+    def recover(self) -> int:
+        """Rolls back the uncommitted batches of a crashed run. Returns the number of removed .tmp files.
+
+        Every leftover .tmp file is removed, journalled or not: a rename either happened
+        (and consumed the .tmp) or the original is still intact."""
+        removed = remove_stale_tmp_files(self.directory)
+        if self.journal.exists():
+            self.journal.unlink()
+        elif not removed:
+            return 0
+        _fsync_path(self.directory)
+        return removed
+
+    def add(self, file: Path) -> list[tuple[Path, str | None]]:
+        """Queues a file whose .tmp is written; returns the batch results once the batch is full."""
+        self._batch.append(file)
+        if len(self._batch) >= self.batch_size:
+            return self.commit()
+        return []
+
+    def commit(self) -> list[tuple[Path, str | None]]:
+        """Durably replaces all queued files. Returns (file, None) or (file, error) per file."""
+        batch, self._batch = self._batch, []
+        if not batch:
+            return []
+        self._batch_no += 1
+
+        with self.journal.open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"batch": self._batch_no, "files": [file.name for file in batch]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        def sync_tmp(file: Path) -> str | None:
+            try:
+                _fsync_path(tmp_path(file))
+                return None
+            except OSError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=self.fsync_threads) as pool:
+            sync_errors = list(pool.map(sync_tmp, batch))
+
+        results: list[tuple[Path, str | None]] = []
+        for file, error in zip(batch, sync_errors):
+            tmp = tmp_path(file)
+            if error is None:
+                try:
+                    tmp.replace(file)
+                except OSError as e:
+                    error = str(e)
+            if error is not None and tmp.exists():
+                tmp.unlink()
+            results.append((file, error))
+
+        _fsync_path(self.directory)
+        with self.journal.open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"commit": self._batch_no}) + "\n")
+        return results
+
+    def close(self) -> None:
+        if self.journal.exists():
+            self.journal.unlink()
+
+
+class IOThrottle:
+    """Paces file dispatch so that read + written bytes stay under a MB/s budget."""
+
+    def __init__(self, mb_per_s: float):
+        self.bytes_per_s = mb_per_s * 1024 * 1024
+        self._next = time.monotonic()
+
+    def consume(self, nbytes: int) -> None:
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + nbytes / self.bytes_per_s
+        if start > now:
+            time.sleep(start - now)
+
+
+def reencrypt_directory(directory: Path, old_key: bytes, old_iv: bytes, new_key: bytes, new_iv: bytes,
+                        workers: int = 1, skip_rotated: bool = True,
+                        manifest: RotationManifest | None = None,
+                        throttle: IOThrottle | None = None,
+                        durable_batch: int = 0,
+                        legacy_key: bytes | None = None) -> tuple[int, int, int, int]:
+    """Returns (re-encrypted, failed, skipped as already rotated, ambiguous left untouched)."""
+    committer = None
+    removed = 0
+    if durable_batch > 0 and directory.exists():
+        committer = GroupCommitter(directory, durable_batch)
+        removed = committer.recover()
+    elif directory.exists():
+        removed = remove_stale_tmp_files(directory)
+    if removed:
+        print(f"  ↩️  Obnova po pádu: odstraněno {removed} nedokončených .tmp souborů")
+
+    files = _list_enc_files(directory)
+    if not files:
+        return 0, 0, 0, 0
+
+    resumed = 0
+    if manifest is not None:
+        pending_files = [file for file in files if not manifest.is_done(file)]
+        resumed = len(files) - len(pending_files)
+        files = pending_files
+
+    def dispatch(files: list[Path]) -> Iterator[Path]:
+        for file in files:
+            if throttle is not None:
+                # Up front only the key probe; the full read + write is charged when the file is rewritten
+                throttle.consume(PROBE_BYTES)
+            yield file
+
+    def charge_rewrite(file: Path) -> None:
+        if throttle is not None:
+            try:
+                # Each rewritten file is read once and written once
+                throttle.consume(2 * file.stat().st_size)
+            except OSError:
+                pass
+
+    args = (old_key, old_iv, new_key, new_iv, skip_rotated, committer is None, legacy_key)
+    if workers > 1:
+        results = _iter_results_parallel(dispatch(files), workers, reencrypt_file, args)
+    else:
+        results = ((file, reencrypt_file(file, *args)) for file in dispatch(files))
 
     ok = 0
     failed = 0
-    for file in files:
-        tmp = file.with_suffix(".tmp")
-        try:
-            encrypted = file.read_bytes()
-            plain = decrypt(encrypted, old_key, old_iv)
-            re_encrypted = encrypt(plain, new_key, new_iv)
-            tmp.write_bytes(re_encrypted)
-            tmp.replace(file)
+    skipped = resumed
+    ambiguous = 0
+
+    def record_done(file: Path, error: str | None) -> None:
+        nonlocal ok, failed
+        if error is None:
             print(f"  ✅ {file.name}")
             ok += 1
-        except Exception as e:
-            print(f"  ❌ {file.name}: {e}")
-            if tmp.exists():
-                tmp.unlink()
+        else:
+            print(f"  ❌ {file.name}: {error}")
             failed += 1
+        if manifest is not None:
+            manifest.record(file, "failed" if error else "done")
 
-    return ok, failed
+    try:
+        for file, (status, message) in results:
+            if status == "ok":
+                charge_rewrite(file)
+                if committer is None:
+                    record_done(file, None)
+                else:
+                    for committed, error in committer.add(file):
+                        record_done(committed, error)
+                    if manifest is not None:
+                        manifest.flush(fsync=True)
+            elif status == "skipped":
+                skipped += 1
+                if manifest is not None:
+                    manifest.record(file, "done")
+            elif status == "ambiguous":
+                # Not a failure: the file is unchanged and the next run probes it again
+                print(f"  ❓ {file.name}: {message}")
+                ambiguous += 1
+                if manifest is not None:
+                    manifest.record(file, "ambiguous")
+            else:
+                record_done(file, message)
+        if committer is not None:
+            for committed, error in committer.commit():
+                record_done(committed, error)
+            committer.close()
+    finally:
+        if manifest is not None:
+            manifest.flush(fsync=committer is not None)
+
+    if skipped:
+        print(f"  ⏭️  {skipped} souborů už bylo přešifrováno, přeskočeno"
+              + (f" ({resumed} podle manifestu)" if resumed else ""))
+    if ambiguous:
+        print(f"  ❓ {ambiguous} souborů s nejednoznačným klíčem ponecháno beze změny, zkontrolujte ručně")
+    return ok, failed, skipped, ambiguous
+
+
+def scan_directory(directory: Path, old_key: bytes, old_iv: bytes, new_key: bytes, new_iv: bytes,
+                   workers: int = 1, legacy_key: bytes | None = None) -> dict[str, int]:
+    """Classifies every .enc file by key from its last blocks only; changes nothing.
+    Files under the NUL-padded old key (written by migrate.py) count as old."""
+    counts = {"old": 0, "new": 0, "unknown": 0, "ambiguous": 0}
+    files = _list_enc_files(directory)
+    if not files:
+        return counts
+
+    def classify(file: Path, *keys: bytes) -> str:
+        try:
+            return classify_file(file, *keys)
+        except OSError:
+            return "unknown"
+
+    args = (old_key, old_iv, new_key, new_iv, legacy_key)
+    # Scan is I/O-bound (two small reads per file), threads are enough
+    results = _iter_results_parallel(files, max(workers, 8), classify, args, executor_class=ThreadPoolExecutor)
+    for file, state in results:
+        counts["old" if state == "legacy" else state] += 1
+        if state in ("unknown", "ambiguous"):
+            print(f"  ❓ {file.name}: {'neznámý klíč' if state == 'unknown' else 'nejednoznačné'}")
+
+    print(f"  🔑 starý klíč: {counts['old']}, nový klíč: {counts['new']}, "
+          f"neznámý: {counts['unknown']}, nejednoznačné: {counts['ambiguous']}")
+    return counts
 
 
 def main():
@@ -85,12 +529,28 @@ def main():
     parser.add_argument("--new-iv",  required=True)
     parser.add_argument("--photos-dir", default="../data/patient-photos")
     parser.add_argument("--docs-dir",   default="../data/patient-documents")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default 1 = serial, 0 = one per CPU core)")
+    parser.add_argument("--scan", action="store_true",
+                        help="Only classify files as old/new/unknown key from their last 32 bytes; change nothing")
+    parser.add_argument("--no-skip-rotated", action="store_true",
+                        help="Do not probe files first; try to re-encrypt every file (previous behaviour)")
+    parser.add_argument("--manifest", default=None,
+                        help="Progress manifest (JSON lines); finished files are skipped when the run is resumed")
+    parser.add_argument("--max-mbps", type=float, default=None,
+                        help="I/O budget in MB/s (read + write) so a live rotation does not starve the API")
+    parser.add_argument("--durable-batch", type=int, default=0,
+                        help="fsync re-encrypted files in batches of N with an undo journal (0 = no fsync)")
     args = parser.parse_args()
 
-    old_key = _pad_key(args.old_key, 32)
-    old_iv  = _pad_key(args.old_iv,  16)
-    new_key = _pad_key(args.new_key, 32)
-    new_iv  = _pad_key(args.new_iv,  16)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    old_key = pad_key(args.old_key, 32)
+    old_iv  = pad_key(args.old_iv,  16)
+    # migrate.py doplňoval klíč nulami místo mezer; jeho soubory se poznají a přešifrují taky
+    legacy_key = pad_key(args.old_key, 32, fill=b"\0")
+    new_key = pad_key(args.new_key, 32)
+    new_iv  = pad_key(args.new_iv,  16)
 
     if old_key == new_key and old_iv == new_iv:
         print("Starý a nový klíč jsou stejné, není co dělat.")
@@ -99,19 +559,42 @@ def main():
     photos_dir = Path(args.photos_dir)
     docs_dir   = Path(args.docs_dir)
 
-    total_ok = total_failed = 0
+    if args.scan:
+        totals = {"old": 0, "new": 0, "unknown": 0, "ambiguous": 0}
+        for label, directory in (("Fotografie pacientů", photos_dir), ("Dokumenty pacientů", docs_dir)):
+            print(f"\n📁 {label} ({directory}):")
+            counts = scan_directory(directory, old_key, old_iv, new_key, new_iv, workers, legacy_key)
+            for state, count in counts.items():
+                totals[state] += count
+        print(f"\n🔑 Celkem: starý klíč {totals['old']}, nový klíč {totals['new']}, "
+              f"neznámý {totals['unknown']}, nejednoznačné {totals['ambiguous']}")
+        sys.exit(0 if totals["unknown"] == 0 and totals["ambiguous"] == 0 else 1)
+
+    skip_rotated = not args.no_skip_rotated
+    manifest = RotationManifest(Path(args.manifest)) if args.manifest else None
+    throttle = IOThrottle(args.max_mbps) if args.max_mbps else None
+    total_ok = total_failed = total_skipped = total_ambiguous = 0
 
     print(f"\n📁 Fotografie pacientů ({photos_dir}):")
-    ok, failed = reencrypt_directory(photos_dir, old_key, old_iv, new_key, new_iv)
+    ok, failed, skipped, ambiguous = reencrypt_directory(photos_dir, old_key, old_iv, new_key, new_iv, workers,
+                                                         skip_rotated, manifest, throttle, args.durable_batch,
+                                                         legacy_key)
     total_ok += ok
     total_failed += failed
+    total_skipped += skipped
+    total_ambiguous += ambiguous
 
     print(f"\n📁 Dokumenty pacientů ({docs_dir}):")
-    ok, failed = reencrypt_directory(docs_dir, old_key, old_iv, new_key, new_iv)
+    ok, failed, skipped, ambiguous = reencrypt_directory(docs_dir, old_key, old_iv, new_key, new_iv, workers,
+                                                         skip_rotated, manifest, throttle, args.durable_batch,
+                                                         legacy_key)
     total_ok += ok
     total_failed += failed
+    total_skipped += skipped
+    total_ambiguous += ambiguous
 
-    print(f"\n{'✅' if total_failed == 0 else '⚠️ '} Hotovo: {total_ok} přešifrováno, {total_failed} selhalo")
+    print(f"\n{'✅' if total_failed == 0 else '⚠️ '} Hotovo: {total_ok} přešifrováno, {total_failed} selhalo, "
+          f"{total_skipped} už přešifrováno dříve, {total_ambiguous} nejednoznačných ponecháno")
 
     if total_failed > 0:
         sys.exit(1)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The scripts run from scripts/ and import each other (document_crypto)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
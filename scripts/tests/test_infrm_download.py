@@ -0,0 +1,125 @@
+import io
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+import infrm_download
+
+
+def run_main(monkeypatch, tmp_path, *args):
+	source_dir = tmp_path / "encrypted"
+	source_dir.mkdir()
+	monkeypatch.setattr(infrm_download, "fetch_documents", lambda *a, **kw: [])
+	monkeypatch.setattr(sys, "argv", ["infrm_download.py", "--source-dir", str(source_dir), *args])
+	return infrm_download.main()
+
+
+@pytest.mark.parametrize("name", ["export.tar", "export.tar.gz", "export.zip"])
+def test_empty_export_is_valid_archive_with_index(monkeypatch, tmp_path, name):
+	"""Test an export with no matching documents still writes a complete archive"""
+	target = tmp_path / name
+	assert run_main(monkeypatch, tmp_path, "--archive", str(target)) == 0
+
+	if name.endswith(".zip"):
+		with zipfile.ZipFile(target) as archive:
+			assert archive.namelist() == ["index.csv"]
+			index = archive.read("index.csv")
+	else:
+		with tarfile.open(target) as archive:
+			assert archive.getnames() == ["index.csv"]
+			index = archive.extractfile("index.csv").read()
+	assert index.decode().splitlines() == ["doc_id,examination_id,member,original_file_name,size"]
+
+
+def test_stdout_archive_restores_stdout_on_early_return(monkeypatch, tmp_path):
+	"""Test streaming to stdout hands sys.stdout back after an early return"""
+	stdout = io.TextIOWrapper(io.BytesIO())
+	monkeypatch.setattr(sys, "stdout", stdout)
+	assert run_main(monkeypatch, tmp_path, "--archive", "-") == 0
+	assert sys.stdout is stdout
+
+	stdout.flush()
+	with tarfile.open(fileobj=io.BytesIO(stdout.buffer.getvalue())) as archive:
+		assert archive.getnames() == ["index.csv"]
+
+
+def test_missing_source_dir_still_closes_archive(monkeypatch, tmp_path):
+	"""Test the error return for a missing source directory leaves a readable archive"""
+	target = tmp_path / "export.tar"
+	monkeypatch.setattr(sys, "argv", [
+		"infrm_download.py", "--source-dir", str(tmp_path / "missing"), "--archive", str(target)
+	])
+	assert infrm_download.main() == 1
+	with tarfile.open(target) as archive:
+		assert archive.getnames() == ["index.csv"]
+
+
+class StreamingCursor:
+	def __init__(self, rows):
+		self.rows = rows
+		self.fetched = 0
+		self.statements = []
+		self.closed = False
+
+	def execute(self, sql, params=None):
+		self.statements.append(sql)
+
+	def fetchmany(self, size):
+		batch = self.rows[self.fetched:self.fetched + size]
+		self.fetched += len(batch)
+		return batch
+
+	def fetchall(self):
+		raise AssertionError("the document query must not be read in one piece")
+
+	def close(self):
+		self.closed = True
+
+
+class StreamingConnection:
+	def __init__(self, cursor):
+		self._cursor = cursor
+		self.closed = False
+
+	def cursor(self, buffered=True):
+		assert buffered is False
+		return self._cursor
+
+	def close(self):
+		self.closed = True
+
+
+def test_fetch_documents_reads_rows_in_batches_as_they_are_consumed(monkeypatch):
+	"""Test the document query is streamed with fetchmany and the connection closes once exhausted"""
+	rows = [(i, 7, f"f{i}", f"doc{i}.pdf", f"enc/{i}", 0, 10, "2024-01-01") for i in range(1, 251)]
+	cursor = StreamingCursor(rows)
+	conn = StreamingConnection(cursor)
+	monkeypatch.setattr(infrm_download, "connect_database", lambda conn_info: conn)
+	monkeypatch.setattr(infrm_download, "FETCH_BATCH_ROWS", 100)
+
+	documents = infrm_download.fetch_documents({}, include_deleted=False, all_documents=True)
+	assert cursor.fetched == 0
+	assert next(documents).doc_id == 1
+	assert cursor.fetched == 100
+
+	assert [row.doc_id for row in documents] == list(range(2, 251))
+	assert cursor.closed and conn.closed
+	assert cursor.statements[0].startswith("SET SESSION net_write_timeout")
+
+
+def test_run_parallel_stops_workers_when_the_row_source_fails(tmp_path):
+	"""Test a database error while streaming rows reaches the caller instead of hanging the workers"""
+	def documents():
+		for i in range(1, 4):
+			yield infrm_download.DocumentRow(i, 1, "f", "doc.pdf", f"missing/{i}", 0)
+		raise ConnectionError("lost connection to MySQL server")
+
+	reported = []
+	with pytest.raises(ConnectionError):
+		infrm_download.run_parallel(
+			documents(), tmp_path, tmp_path, b"k" * 32, b"i" * 16, 2,
+			lambda row, result: reported.append(result[0]),
+		)
+	assert reported == ["MISS"] * 3
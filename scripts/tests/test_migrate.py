@@ -0,0 +1,171 @@
+import sqlite3
+import zlib
+
+import pytest
+
+mysql_connector = pytest.importorskip("mysql.connector")
+
+import migrate  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 1
+
+    def execute(self, query, params=()):
+        self.conn.statements.append(query)
+        if any(query.startswith(prefix) for prefix in self.conn.fail_on):
+            raise mysql_connector.Error(msg="simulated failure")
+
+    def fetchall(self):
+        return [{"id": 1}]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fail_on=()):
+        self.fail_on = fail_on
+        self.statements = []
+        self.rollbacks = 0
+
+    def is_connected(self):
+        return True
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.statements.append("COMMIT")
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def migration_with(conn):
+    migration = migrate.CepemHealthcareMigration()
+    migration.target_db.conn = conn
+    return migration
+
+
+def test_failed_document_insert_rolls_back_only_its_savepoint_and_blob(tmp_path):
+    """Test a failing ExaminationDocuments INSERT discards the new blob and keeps the examination"""
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(b"%PDF-1.4 obsah")
+    conn = FakeConnection(fail_on=("INSERT INTO ExaminationDocuments",))
+    migration = migration_with(conn)
+    store = migrate.DocumentBlobStore(migration.target_db, str(tmp_path))
+
+    with pytest.raises(RuntimeError):
+        migration._store_examination_document(store, str(tmp_path), 7, str(source), "scan.pdf",
+                                              source.stat().st_size, None)
+
+    assert "ROLLBACK TO SAVEPOINT examination_document" in conn.statements
+    assert conn.rollbacks == 0
+    assert store.pending == {}
+    assert not list(tmp_path.glob("blob_*.enc"))
+    store.commit_pending()
+    assert store.blobs == {}
+
+
+def test_successful_document_is_promoted_after_commit(tmp_path):
+    """Test a stored document's blob stays pending until commit_pending()"""
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(b"%PDF-1.4 obsah")
+    conn = FakeConnection()
+    migration = migration_with(conn)
+    store = migrate.DocumentBlobStore(migration.target_db, str(tmp_path))
+
+    migration._store_examination_document(store, str(tmp_path), 7, str(source), "scan.pdf",
+                                          source.stat().st_size, None)
+    assert "RELEASE SAVEPOINT examination_document" in conn.statements
+    assert len(store.pending) == 1 and store.blobs == {}
+    store.commit_pending()
+    assert len(store.blobs) == 1 and len(list(tmp_path.glob("blob_*.enc"))) == 1
+
+
+def test_plain_mode_removes_encrypted_file_of_failed_document(tmp_path):
+    """Test without dedup the encrypted file of a failed INSERT does not stay behind"""
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(b"%PDF-1.4 obsah")
+    storage = tmp_path / "storage"
+    storage.mkdir()
+    migration = migration_with(FakeConnection(fail_on=("INSERT INTO ExaminationDocuments",)))
+
+    with pytest.raises(RuntimeError):
+        migration._store_examination_document(None, str(storage), 7, str(source), "scan.pdf",
+                                              source.stat().st_size, None)
+    assert list(storage.iterdir()) == []
+
+
+def test_lost_savepoint_aborts_the_whole_transaction(tmp_path):
+    """Test a savepoint that cannot be rolled back aborts the examination instead of being swallowed"""
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(b"%PDF-1.4 obsah")
+    conn = FakeConnection(fail_on=("INSERT INTO ExaminationDocuments", "ROLLBACK TO SAVEPOINT"))
+    migration = migration_with(conn)
+
+    with pytest.raises(migrate.TransactionAborted):
+        migration._store_examination_document(None, str(tmp_path), 7, str(source), "scan.pdf",
+                                              source.stat().st_size, None)
+    assert conn.rollbacks == 1
+
+
+class _BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        self.value ^= value or 0
+
+    def finalize(self):
+        return self.value
+
+
+class SQLiteDatabase:
+    """MySQLDatabase.execute() over sqlite, with the MySQL functions the verifier uses"""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("CRC32", 1, lambda text: zlib.crc32(str(text).encode()))
+        self.conn.create_function("CONCAT_WS", -1, lambda sep, *parts: sep.join(str(p) for p in parts if p is not None))
+        self.conn.create_aggregate("BIT_XOR", 1, _BitXor)
+
+    def execute(self, query, params=None, fetch=False):
+        cursor = self.conn.execute(query.replace("%s", "?"), params or ())
+        return [dict(row) for row in cursor.fetchall()] if fetch else cursor.rowcount
+
+    def close(self):
+        pass
+
+
+class LocalVerifier(migrate.MigrationVerifier):
+    def __init__(self, source, target):
+        super().__init__({}, {}, workers=1)
+        self.source, self.target = source, target
+
+    def _dbs(self):
+        return self.source, self.target
+
+
+def test_examination_types_ignore_types_created_by_examination_step():
+    """Test an auto-created examination type is not reported as extra, a real difference still is"""
+    source, target = SQLiteDatabase(), SQLiteDatabase()
+    source.execute("CREATE TABLE _cinnosti (ident INTEGER PRIMARY KEY, name TEXT)")
+    source.execute("INSERT INTO _cinnosti VALUES (1, 'Odběr'), (2, 'Kontrola')")
+    target.execute("CREATE TABLE Translations (Id INTEGER PRIMARY KEY, EN TEXT, CS TEXT)")
+    target.execute("CREATE TABLE ExaminationTypes (Id INTEGER PRIMARY KEY, NameTranslationId INTEGER)")
+    target.execute("INSERT INTO Translations VALUES (1, 'Odběr', 'Odběr'), (2, 'Kontrola', 'Kontrola'), "
+                   "(3, 'Neuvedeno', 'Neuvedeno')")
+    # Typ 3 založil migrate_examinations pro druh vyšetření, který v _cinnosti není
+    target.execute("INSERT INTO ExaminationTypes VALUES (1, 1), (2, 2), (3, 3)")
+    spec = next(s for s in migrate.VERIFY_TABLES if s["name"] == "ExaminationTypes")
+    verifier = LocalVerifier(source, target)
+
+    assert verifier.verify_table(spec)
+
+    target.execute("UPDATE Translations SET CS = 'Kontrola 2' WHERE Id = 2")
+    assert not verifier.verify_table(spec)
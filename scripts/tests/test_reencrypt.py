@@ -0,0 +1,210 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from document_crypto import LEGACY_MIGRATION_IV, LEGACY_MIGRATION_KEY, decrypt_bytes, encrypt_bytes, pad_key
+from reencrypt import (
+    PROBE_BYTES,
+    TMP_SUFFIX,
+    GroupCommitter,
+    RotationManifest,
+    classify_file,
+    reencrypt_directory,
+    reencrypt_file,
+    scan_directory,
+)
+
+OLD_KEY = pad_key("CEPEMSecureKey1234567890123456", 32)
+OLD_IV = pad_key("CEPEMInitVector1", 16)
+LEGACY_KEY = pad_key("CEPEMSecureKey1234567890123456", 32, fill=b"\0")
+NEW_KEY = pad_key("NewSecureKey1234567890123456789", 32)
+NEW_IV = pad_key("NewInitVector123", 16)
+
+PLAINTEXT = b"%PDF-1.4 " + b"x" * 1000
+
+
+def test_legacy_key_matches_migrate_padding():
+    """Test the legacy constant equals the NUL-padded key migrate.py always used"""
+    assert LEGACY_MIGRATION_KEY == b"CEPEMSecureKey1234567890123456\x00\x00"
+    assert LEGACY_MIGRATION_KEY == LEGACY_KEY != OLD_KEY
+    assert LEGACY_MIGRATION_IV == OLD_IV
+
+
+def test_migrated_files_are_scanned_as_old_and_reencrypted(tmp_path):
+    """Test a file written by migrate.py is classified under the old key and rotated to the new one"""
+    migrated = tmp_path / "examination_1.enc"
+    migrated.write_bytes(encrypt_bytes(PLAINTEXT, LEGACY_MIGRATION_KEY, LEGACY_MIGRATION_IV))
+    (tmp_path / "photo_1.enc").write_bytes(encrypt_bytes(PLAINTEXT, OLD_KEY, OLD_IV))
+
+    assert classify_file(migrated, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV) == "unknown"
+    assert classify_file(migrated, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, LEGACY_KEY) == "legacy"
+    counts = scan_directory(tmp_path, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, legacy_key=LEGACY_KEY)
+    assert counts == {"old": 2, "new": 0, "unknown": 0, "ambiguous": 0}
+
+    assert reencrypt_file(migrated, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, legacy_key=LEGACY_KEY) == ("ok", None)
+    assert decrypt_bytes(migrated.read_bytes(), NEW_KEY, NEW_IV) == PLAINTEXT
+    assert classify_file(migrated, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, LEGACY_KEY) == "new"
+
+
+def encrypt_with_padding_valid_under_both_keys(make_plaintext):
+    """Plaintext variant whose old-key ciphertext also has valid padding under the new key (~1 in 256)"""
+    for attempt in range(100_000):
+        data = encrypt_bytes(make_plaintext(attempt), OLD_KEY, OLD_IV)
+        try:
+            decrypt_bytes(data, NEW_KEY, NEW_IV)
+        except ValueError:
+            continue
+        return data
+    raise AssertionError("no collision found")
+
+
+def dicom(attempt):
+    return b"\0" * 128 + b"DICM" + attempt.to_bytes(4, "big") + b"\x02\x00" * 500
+
+
+def text(attempt):
+    return f"Výsledek vyšetření č. {attempt}\n".encode() + "Krevní obraz v normě. ".encode() * 100
+
+
+def noise(attempt):
+    return os.urandom(2000 + attempt % 16)
+
+
+@pytest.mark.parametrize("make_plaintext", [dicom, text])
+def test_padding_tie_is_broken_by_decrypting_the_head(tmp_path, make_plaintext):
+    """Test a file valid under both keys is resolved from its DICOM signature or text content"""
+    file = tmp_path / "document.enc"
+    file.write_bytes(encrypt_with_padding_valid_under_both_keys(make_plaintext))
+
+    assert classify_file(file, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, LEGACY_KEY) == "old"
+    assert reencrypt_file(file, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, legacy_key=LEGACY_KEY) == ("ok", None)
+
+
+def test_unresolved_tie_is_left_untouched_and_not_counted_as_failure(tmp_path):
+    """Test a file that stays ambiguous is reported separately and the rotation does not fail"""
+    file = tmp_path / "document.enc"
+    data = encrypt_with_padding_valid_under_both_keys(noise)
+    file.write_bytes(data)
+    (tmp_path / "photo.enc").write_bytes(encrypt_bytes(PLAINTEXT, OLD_KEY, OLD_IV))
+
+    status, _message = reencrypt_file(file, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV)
+    assert status == "ambiguous"
+    assert reencrypt_directory(tmp_path, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV) == (1, 0, 0, 1)
+    assert file.read_bytes() == data
+
+
+class RecordingThrottle:
+    def __init__(self):
+        self.charged = 0
+
+    def consume(self, nbytes):
+        self.charged += nbytes
+
+
+def test_throttle_charges_full_io_only_for_rewritten_files(tmp_path):
+    """Test already rotated files cost only the probe reads against the I/O budget"""
+    rotated = encrypt_bytes(PLAINTEXT, NEW_KEY, NEW_IV)
+    for i in range(3):
+        (tmp_path / f"rotated_{i}.enc").write_bytes(rotated)
+    pending = tmp_path / "pending.enc"
+    pending.write_bytes(encrypt_bytes(PLAINTEXT, OLD_KEY, OLD_IV))
+    throttle = RecordingThrottle()
+
+    assert reencrypt_directory(tmp_path, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, throttle=throttle) == (1, 0, 3, 0)
+    assert throttle.charged == 4 * PROBE_BYTES + 2 * pending.stat().st_size
+
+
+def write_old_key_files(directory, count):
+    files = []
+    for i in range(count):
+        file = directory / f"doc_{i}.enc"
+        file.write_bytes(encrypt_bytes(PLAINTEXT + bytes([i]), OLD_KEY, OLD_IV))
+        files.append(file)
+    return files
+
+
+def assert_rotated(directory, files):
+    assert not list(directory.glob(f"*{TMP_SUFFIX}"))
+    assert not (directory / GroupCommitter.JOURNAL_NAME).exists()
+    for i, file in enumerate(files):
+        assert decrypt_bytes(file.read_bytes(), NEW_KEY, NEW_IV) == PLAINTEXT + bytes([i])
+
+
+def test_crash_between_journal_write_and_renames_converges_on_rerun(tmp_path, monkeypatch):
+    """Test a batch cut off after its journal entry, plus an unjournalled .tmp, is cleaned up and finished by a rerun"""
+    files = write_old_key_files(tmp_path, 4)
+    committer = GroupCommitter(tmp_path, batch_size=10)
+    for file in files[:3]:
+        assert reencrypt_file(file, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, replace=False) == ("ok", None)
+        committer.add(file)
+    # Written by a worker, but the run died before the file joined a batch
+    assert reencrypt_file(files[3], OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, replace=False) == ("ok", None)
+
+    original_replace = Path.replace
+    renames = []
+
+    def crash_after_first_rename(self, target):
+        if renames:
+            raise KeyboardInterrupt("crash")
+        renames.append(target)
+        return original_replace(self, target)
+
+    monkeypatch.setattr(Path, "replace", crash_after_first_rename)
+    with pytest.raises(KeyboardInterrupt):
+        committer.commit()
+    monkeypatch.undo()
+
+    assert (tmp_path / GroupCommitter.JOURNAL_NAME).exists()
+    assert len(list(tmp_path.glob(f"*{TMP_SUFFIX}"))) == 3
+
+    # The renamed file is already under the new key, the other three start over
+    assert reencrypt_directory(tmp_path, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, durable_batch=2) == (3, 0, 1, 0)
+    assert_rotated(tmp_path, files)
+    assert reencrypt_directory(tmp_path, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, durable_batch=2) == (0, 0, 4, 0)
+
+
+def test_plain_run_removes_only_its_own_leftover_tmp_files(tmp_path):
+    """Test a run without --durable-batch also deletes stale re-encryption temp files, and no other .tmp"""
+    files = write_old_key_files(tmp_path, 2)
+    stale = tmp_path / f"doc_0.enc{TMP_SUFFIX}"
+    stale.write_bytes(b"half written")
+    unrelated = tmp_path / "upload.tmp"
+    unrelated.write_bytes(b"DatabaseAPI upload in progress")
+
+    assert reencrypt_directory(tmp_path, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV) == (2, 0, 0, 0)
+    assert_rotated(tmp_path, files)
+    assert unrelated.exists()
+
+
+class CrashingThrottle:
+    def __init__(self, crash_at):
+        self.calls = 0
+        self.crash_at = crash_at
+
+    def consume(self, nbytes):
+        self.calls += 1
+        if self.calls == self.crash_at:
+            raise KeyboardInterrupt("crash")
+
+
+def test_interrupted_rotation_resumes_from_manifest(tmp_path):
+    """Test a run stopped mid-way resumes from the manifest, skips committed files unopened and converges"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    files = write_old_key_files(docs, 5)
+    manifest_path = tmp_path / "manifest.jsonl"
+
+    # Per file one probe charge and one rewrite charge: the 5th call is the third file's probe
+    with pytest.raises(KeyboardInterrupt):
+        reencrypt_directory(docs, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, manifest=RotationManifest(manifest_path),
+                            throttle=CrashingThrottle(crash_at=5), durable_batch=2)
+    with manifest_path.open("a", encoding="utf-8") as f:
+        f.write('{"path": "torn')
+
+    manifest = RotationManifest(manifest_path)
+    assert sum(manifest.is_done(file) for file in files) == 2
+    assert reencrypt_directory(docs, OLD_KEY, OLD_IV, NEW_KEY, NEW_IV, manifest=manifest,
+                               durable_batch=2) == (3, 0, 2, 0)
+    assert_rotated(docs, files)
+    assert all(RotationManifest(manifest_path).is_done(file) for file in files)